@@ -0,0 +1,91 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Time the stages of importing task rows from JSONL.
+
+Run from the top of the source tree:
+
+    python benchmarks/bulk.py [TASKS]
+
+Rows are decoded, validated and added to an in-memory store a chunk at
+a time, as by the import command, and the time of each stage is
+reported.  The store is not written.
+"""
+
+import collections
+import datetime
+import itertools
+import json
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ebslib import bulk
+from ebslib import estimator
+from ebslib import store
+from ebslib import tasktable
+
+
+def lines(ntasks):
+    """Return a JSONL file of task rows."""
+    fp = StringIO.StringIO()
+    date = datetime.date(2012, 1, 1)
+    for j in xrange(ntasks):
+        row = {'estimator': 'Bob', 'id': 't{}'.format(j),
+            'project': 'P{}'.format(j % 7), 'estimate': j % 8 + 1}
+        if j % 2:
+            row.update(date=str(date + datetime.timedelta(j % 700)),
+                actual=j % 11 + 1)
+        print >>fp, json.dumps(row)
+    fp.seek(0)
+    return fp
+
+
+def main(ntasks, chunk_size=10000):
+    fp = lines(ntasks)
+    directory = tempfile.mkdtemp()
+    s = store.Store(os.path.join(directory, 'ebs'))
+    s.add_estimator(estimator.Estimator('Bob'))
+    times = collections.Counter()
+    rows = bulk.read_rows(fp, 'jsonl')
+    while True:
+        start = time.time()
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        times['decode'] += time.time() - start
+        start = time.time()
+        records = [
+            bulk.task_record(bulk.parse_row(row)[1]) for line, row in chunk]
+        times['validate'] += time.time() - start
+        start = time.time()
+        s.add_tasks('Bob', tasktable.TaskTable.from_records(records))
+        times['add'] += time.time() - start
+    total = sum(times.values())
+    print '{} tasks in {:.2f}s ({:.0f} rows/s)'.format(
+        ntasks, total, ntasks / total)
+    for stage in ('decode', 'validate', 'add'):
+        print '  {:8} {:5.2f}s'.format(stage, times[stage])
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
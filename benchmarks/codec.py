@@ -0,0 +1,100 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare the store codec with the generic encoder it replaced.
+
+Run from the top of the source tree:
+
+    python benchmarks/codec.py [TASKS]
+"""
+
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ebslib import estimator
+from ebslib import holiday
+from ebslib import store
+from ebslib import task
+
+
+def make_data(ntasks, nestimators=20):
+    start = datetime.date(2012, 1, 1)
+    estimators = []
+    for i in range(nestimators):
+        tasks = []
+        for j in range(ntasks // nestimators):
+            done = j % 5 != 0
+            tasks.append(task.Task(
+                id='{}-{}'.format(i, j), project='project{}'.format(j % 7),
+                description='Task {} of estimator {}'.format(j, i),
+                priority=j % 3 + 1, estimate=j % 8 + 1,
+                date=start + datetime.timedelta(days=j % 700),
+                actual=j % 11 + 1 if done else 0,
+            ))
+        estimators.append(estimator.Estimator(
+            name='estimator{}@example.com'.format(i), tasks=tasks))
+    return {
+        'estimators': estimators,
+        'holidays': holiday.HolidayIndex(
+            start + datetime.timedelta(days=n) for n in range(0, 700, 30)),
+        'holiday_rules': [holiday.parse_rule('annual:12-25')],
+    }
+
+
+def generic_write(fp, data):
+    json.dump(data, fp, default=store._serialise)
+
+
+def generic_read(fp):
+    return json.load(fp, object_hook=store._object_hook)
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+def main(ntasks):
+    data = make_data(ntasks)
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        print '{} tasks'.format(ntasks)
+        for name, write, read in (
+            ('generic', generic_write, generic_read),
+            ('codec', store.write, store.read),
+        ):
+            with open(path, 'w') as fp:
+                save, _ = timed(write, fp, data)
+            with open(path) as fp:
+                load, result = timed(read, fp)
+            assert result == data
+            size = os.path.getsize(path) / float(1 << 20)
+            print '  {:8} save {:6.2f}s  load {:6.2f}s  size {:6.1f} MiB' \
+                .format(name, save, load, size)
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,77 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Time the startup of the ebs program.
+
+Run from the top of the source tree:
+
+    python benchmarks/startup.py [RUNS]
+
+Each command is run repeatedly in a new process against an empty
+store, and the best and mean wall-clock times are reported, with the
+time to start a bare interpreter for comparison.  Byte-code is
+compiled first, as it would be for an installed program.
+"""
+
+import compileall
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+script = os.path.join(top, 'scripts', 'ebs')
+
+
+def timings(argv, runs, env):
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for i in xrange(runs):
+            start = time.time()
+            subprocess.check_call(
+                argv, stdout=devnull, stderr=devnull, env=env)
+            times.append(time.time() - start)
+    return times
+
+
+def main(runs=20):
+    compileall.compile_dir(os.path.join(top, 'ebslib'), quiet=True)
+    tmp = tempfile.mkdtemp()
+    try:
+        env = dict(os.environ, HOME=tmp, PYTHONPATH=top)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        store = os.path.join(tmp, 'ebs')
+        cases = [
+            ('python', [sys.executable, '-c', 'pass']),
+            ('ebs --version', ['--version']),
+            ('ebs help', ['help']),
+            ('ebs lstask', ['lstask', '--store', store]),
+            ('ebs lsholiday', ['lsholiday', '--store', store]),
+        ]
+        for label, argv in cases:
+            if argv[0] != sys.executable:
+                argv = [sys.executable, script] + argv
+            times = timings(argv, runs, env)
+            print '{:16} best {:6.1f} ms, mean {:6.1f} ms'.format(
+                label, min(times) * 1000, sum(times) / runs * 1000)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,87 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare the memory held by task tables and lists of tasks.
+
+Run from the top of the source tree:
+
+    python benchmarks/tasktable.py [TASKS]
+
+Each layout is measured in a new process, by its peak resident set,
+and by the time to gather the estimates of pending tasks.
+"""
+
+import datetime
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ebslib import task
+from ebslib import tasktable
+
+
+def records(ntasks):
+    """Generate task records as decoded from JSON, strings not shared."""
+    for j in xrange(ntasks):
+        yield json.loads(json.dumps([
+            '{}'.format(j), 'project{}'.format(j % 7),
+            'Task {}'.format(j % 1000), j % 3 + 1, j % 8 + 0.5,
+            734503 + j % 700, j % 5 != 0, j % 11 + 0.5,
+        ]))
+
+
+def build(layout, ntasks):
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    if layout == 'list':
+        tasks = []
+        for record in records(ntasks):
+            record[5] = datetime.date.fromordinal(record[5])
+            tasks.append(task.Task(*record))
+    else:
+        tasks = tasktable.TaskTable.from_records(records(ntasks))
+    elapsed = time.time() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    start = time.time()
+    if layout == 'list':
+        estimates = [t.estimate for t in tasks if not t.completed]
+    else:
+        estimates = tasks.column('estimate', completed=False)
+    scan = time.time() - start
+    print '  {:6} {:5.0f} bytes/task  build {:5.2f}s  pending {:5.3f}s' \
+        .format(layout, rss * 1024.0 / ntasks, elapsed, scan)
+    return estimates
+
+
+def main(ntasks):
+    print '{} tasks'.format(ntasks)
+    for layout in ('list', 'table'):
+        sys.stdout.flush()
+        subprocess.check_call(
+            [sys.executable, __file__, str(ntasks), layout])
+
+
+if __name__ == '__main__':
+    ntasks = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    if len(sys.argv) > 2:
+        build(sys.argv[2], ntasks)
+    else:
+        main(ntasks)
@@ -0,0 +1,278 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Bulk data as rows of CSV or JSON lines.
+
+A row is a flat record of a task, an event or a holiday, keyed by the
+names of ``fields``.  In CSV files the first line names the columns,
+and empty values are missing; in JSONL files each line is a JSON
+object.  Rows may give their kind in a ``type`` field.
+
+Rows are read and written one at a time, so that files larger than
+memory may be streamed.  Rows written by ``write_rows`` may be read
+back by ``read_rows``.
+"""
+
+import csv
+import datetime
+import itertools
+import json
+import re
+
+from . import holiday
+from . import task
+
+
+formats = ('csv', 'jsonl')
+
+kinds = ('task', 'event', 'holiday')
+
+fields = {
+    'task': (
+        'estimator', 'id', 'project', 'description', 'priority',
+        'estimate', 'date', 'completed', 'actual',
+    ),
+    'event': ('estimator', 'date', 'cost', 'description'),
+    'holiday': ('date', 'rule'),
+}
+"""Fields of rows of each kind."""
+
+
+def detect_format(filename):
+    """Return the format of the named file, from its extension."""
+    return 'csv' if filename.lower().endswith('.csv') else 'jsonl'
+
+
+def read_rows(fp, format):
+    """Generate ``(line, row)`` pairs for the rows of a file.
+
+    Rows are dicts, except that lines of a JSONL file that are not
+    JSON are given as they are, to be rejected by ``parse_row``.
+    """
+    if format == 'csv':
+        reader = csv.reader(fp)
+        names = [name.strip() for name in next(reader, [])]
+        for row in reader:
+            yield reader.line_num, dict(itertools.izip(names, row))
+    else:
+        for line, text in enumerate(fp, 1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except ValueError:
+                    yield line, text
+
+
+def _text(value):
+    if type(value) is str:
+        return value.decode('utf-8')  # CSV values are UTF-8 bytes
+    if isinstance(value, unicode):
+        return value
+    if isinstance(value, (bool, list, dict)):
+        raise ValueError('not text: {!r}'.format(value))
+    return unicode(value)
+
+
+def _number(value):
+    if isinstance(value, (bool, list, dict)):
+        raise ValueError('not a number: {!r}'.format(value))
+    if isinstance(value, basestring):
+        try:
+            number = int(value)
+        except ValueError:
+            number = float(value)
+    else:
+        number = value
+    if not number >= 0:
+        raise ValueError('negative or not a number: {}'.format(value))
+    return number
+
+
+def _integer(value):
+    number = _number(value)
+    if number != int(number):
+        raise ValueError('not an integer: {}'.format(value))
+    return int(number)
+
+
+def _date(value):
+    if not isinstance(value, basestring) or not _date_re.match(value):
+        raise ValueError('not in format YYYY-MM-DD: {}'.format(value))
+    return datetime.date(int(value[:4]), int(value[5:7]), int(value[8:]))
+
+
+_date_re = re.compile(r'\d{4}-\d\d-\d\d$')
+
+
+_booleans = {'true': True, 'yes': True, '1': True,
+    'false': False, 'no': False, '0': False}
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    try:
+        return _booleans[_text(value).strip().lower()]
+    except KeyError:
+        raise ValueError('not a boolean: {}'.format(value))
+
+
+_converters = {
+    'id': _text, 'estimator': _text, 'project': _text,
+    'description': _text, 'priority': _integer, 'estimate': _number,
+    'actual': _number, 'cost': _number, 'date': _date,
+    'completed': _boolean, 'rule': holiday.parse_rule,
+}
+
+
+_field_converters = {
+    kind: [(field, _converters[field]) for field in fields[kind]]
+    for kind in kinds
+}
+
+_required = {
+    'task': frozenset(['estimator', 'id']),
+    'event': frozenset(['estimator', 'date', 'cost']),
+    'holiday': frozenset(),
+}
+
+
+def parse_row(row, kind='task'):
+    """Validate a row, and return its kind and its values.
+
+    ``kind`` is the kind of rows without a ``type`` field.  Values are
+    returned as a dict of the fields of the kind; missing values are
+    absent.  Raise ``ValueError`` if the row is invalid.
+    """
+    if not isinstance(row, dict):
+        raise ValueError('not a record')
+    kind = row.get('type') or kind
+    if kind not in kinds:
+        raise ValueError('unknown type: {}'.format(kind))
+    values = {}
+    get = row.get
+    try:
+        for field, convert in _field_converters[kind]:
+            value = get(field)
+            if value is not None and value != '':
+                values[field] = convert(value)
+    except ValueError as e:
+        raise ValueError('{}: {}'.format(field, e))
+    if not _required[kind].issubset(values):
+        missing = [
+            x for x in fields[kind]
+            if x in _required[kind] and x not in values
+        ]
+        raise ValueError('missing {}'.format(', '.join(missing)))
+    if kind == 'holiday' and len(values) != 1:
+        raise ValueError('one of date and rule is required')
+    return kind, values
+
+
+def make_task(values):
+    """Return the ``Task`` of the values of a task row."""
+    return task.Task(**{
+        k: v for k, v in values.viewitems() if k != 'estimator'})
+
+
+def task_record(values):
+    """Return the record of the values of a task row.
+
+    Records are as taken by ``TaskTable.from_records``; missing values
+    take the defaults of ``Task``.
+    """
+    get = values.get
+    date = get('date')
+    return [
+        get('id'), get('project'), get('description'), get('priority'),
+        get('estimate', 0), date.toordinal() if date else None,
+        get('completed'), get('actual', 0),
+    ]
+
+
+def make_event(values):
+    """Return the ``Event`` of the values of an event row."""
+    return task.Event(**{
+        k: v for k, v in values.viewitems() if k != 'estimator'})
+
+
+def task_row(name, t):
+    """Return the row of a task of the named estimator."""
+    row = {'type': 'task', 'estimator': name}
+    for field in task.Task.fields:
+        value = getattr(t, field)
+        if value is not None:
+            row[field] = value
+    if t.date is not None:
+        row['date'] = t.date.isoformat()
+    row['completed'] = bool(t.completed)
+    return row
+
+
+def event_row(name, e):
+    """Return the row of an event of the named estimator."""
+    row = {'type': 'event', 'estimator': name, 'date': e.date.isoformat(),
+        'cost': e.cost}
+    if e.description is not None:
+        row['description'] = e.description
+    return row
+
+
+def holiday_row(date=None, rule=None):
+    """Return the row of a holiday date or a holiday rule."""
+    if rule is not None:
+        return {'type': 'holiday', 'rule': str(rule)}
+    return {'type': 'holiday', 'date': date.isoformat()}
+
+
+def columns(kinds=kinds):
+    """Return the columns of CSV files of rows of the given kinds."""
+    names = ['type']
+    for kind in kinds:
+        names.extend(x for x in fields[kind] if x not in names)
+    return names
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def write_rows(fp, format, rows, kinds=kinds):
+    """Write rows to a file as they are generated.
+
+    ``kinds`` are the kinds of the rows, which give the columns of a
+    CSV file.  Return the number of rows written.
+    """
+    n = 0
+    if format == 'csv':
+        names = columns(kinds)
+        writer = csv.writer(fp, lineterminator='\n')
+        writer.writerow(names)
+        for n, row in enumerate(rows, 1):
+            writer.writerow([_csv_value(row.get(x)) for x in names])
+    else:
+        for n, row in enumerate(rows, 1):
+            fp.write(json.dumps(row))
+            fp.write('\n')
+    return n
@@ -0,0 +1,115 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Client of ``ebs serve``.
+
+A store served by ``ebs serve`` has a Unix socket alongside it, named
+``<store>.sock``.  A request is a JSON object, on one line, giving the
+arguments of a command and the working directory of the client; the
+reply is a JSON object giving the exit status and output of the
+command, or a null status if the server does not run the command.
+
+This module is imported by every ``ebs`` invocation, and imports
+little, so that forwarding a command costs little more than starting
+Python.
+"""
+
+import json
+import os
+import socket
+import sys
+
+
+DEFAULT_STORE = '~/.ebs'
+"""The store used by commands not given ``--store``."""
+
+
+def socket_filename(store):
+    """Return the name of the socket of the named store."""
+    return os.path.abspath(os.path.expanduser(store)) + '.sock'
+
+
+def store_argument(argv):
+    """Return the store named by the arguments of a command."""
+    for i, arg in enumerate(argv):
+        if arg == '--store' and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith('--store='):
+            return arg[len('--store='):]
+    return DEFAULT_STORE
+
+
+class NoReplyError(Exception):
+    """The server did not reply to a command sent to it.
+
+    The command may or may not have been run.
+    """
+
+
+def request(filename, argv):
+    """Send a command to the server at the named socket.
+
+    Return the reply, or ``None`` if no server is listening.  Raise
+    ``NoReplyError`` if the command was sent but no reply received.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(filename)
+        except socket.error:
+            return None  # no server, or a stale socket
+        try:
+            sock.sendall(
+                json.dumps({'argv': argv, 'cwd': os.getcwd()}) + '\n')
+            sock.shutdown(socket.SHUT_WR)
+            data = ''.join(iter(lambda: sock.recv(65536), ''))
+        except socket.error as e:
+            raise NoReplyError(str(e))
+    finally:
+        sock.close()
+    try:
+        reply = json.loads(data)
+    except ValueError:
+        raise NoReplyError('invalid reply')  # the server went away
+    if not isinstance(reply, dict) or 'status' not in reply:
+        raise NoReplyError('invalid reply')
+    return reply
+
+
+def forward(argv):
+    """Run a command in the server of its store, if there is one.
+
+    Write the output of the command, and return its exit status.
+    Return ``None`` if no server is serving the store, or if the
+    server does not run the command; it should then be run here.  If
+    the command was sent but no reply received, it must not be run
+    again, and an error is reported instead.
+    """
+    filename = socket_filename(store_argument(argv))
+    if not os.path.exists(filename):
+        return None
+    try:
+        reply = request(filename, argv)
+    except NoReplyError as e:
+        sys.stderr.write(
+            'ebs: no reply from ebs serve ({}); the command may or may '
+            'not have been run\n'.format(e))
+        return 1
+    if reply is None or reply['status'] is None:
+        return None
+    sys.stdout.write(reply['stdout'].encode('utf-8'))
+    sys.stderr.write(reply['stderr'].encode('utf-8'))
+    return reply['status']
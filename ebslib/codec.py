@@ -0,0 +1,129 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Schema codec for store documents.
+
+A store document is encoded into plain JSON values in a single pass
+over the data, following the known schema of a store, rather than by
+asking ``json`` to call back for each object and each decoded dict.
+Dates are encoded as day ordinals.  Tasks and events are encoded as
+positional records whose fields are in the order of ``Task.fields``
+and ``Event.fields``, and velocity summary entries as
+``[velocity, date, id]``.
+
+Encoded documents carry a ``codec`` key giving the version of the
+encoding.  Documents without it were written by the generic encoder
+and are decoded by ``store.read`` as before.
+"""
+
+import datetime
+import operator
+
+from . import estimator
+from . import holiday
+from . import task
+from . import tasktable
+
+
+VERSION = 1
+"""Version of the encoding, recorded in encoded documents."""
+
+_fromordinal = datetime.date.fromordinal
+
+_event_fields = operator.attrgetter(*task.Event.fields)
+_event_date = task.Event.fields.index('date')
+
+
+def _encode_event(e):
+    record = list(_event_fields(e))
+    record[_event_date] = record[_event_date].toordinal()
+    return record
+
+
+def _decode_event(record):
+    record = list(record)
+    record[_event_date] = _fromordinal(record[_event_date])
+    return task.Event(*record)
+
+
+def encode_estimator(e):
+    """Encode an estimator as plain JSON values."""
+    summary = e.summary
+    return {
+        'name': e.name,
+        'tasks': list(e.tasks.records()),
+        'events': [_encode_event(x) for x in e.events],
+        'summary': {
+            'entries': [
+                [v, date and date.toordinal(), id]
+                for v, date, id in summary.entries
+            ],
+            'total': summary.total,
+            'total_sq': summary.total_sq,
+        },
+    }
+
+
+def decode_estimator(data):
+    """Decode an estimator encoded by ``encode_estimator``."""
+    summary = data.get('summary')
+    if summary is not None:
+        summary = estimator.VelocitySummary(
+            entries=[
+                (v, date and _fromordinal(date), id)
+                for v, date, id in summary['entries']
+            ],
+            total=summary['total'],
+            total_sq=summary['total_sq'],
+        )
+    return estimator.Estimator(
+        name=data['name'],
+        tasks=tasktable.TaskTable.from_records(data.get('tasks', [])),
+        events=[_decode_event(x) for x in data.get('events', [])],
+        summary=summary,
+    )
+
+
+def encode(data):
+    """Encode a store document as plain JSON values.
+
+    Values other than the estimators, holidays and holiday rules are
+    kept as they are, and must already be plain JSON values.
+    """
+    doc = dict(data, codec=VERSION)
+    if 'estimators' in doc:
+        doc['estimators'] = [encode_estimator(e) for e in doc['estimators']]
+    if 'holidays' in doc:
+        doc['holidays'] = [date.toordinal() for date in doc['holidays']]
+    if 'holiday_rules' in doc:
+        doc['holiday_rules'] = [str(rule) for rule in doc['holiday_rules']]
+    return doc
+
+
+def decode(doc):
+    """Decode a store document encoded by ``encode``."""
+    data = dict(doc)
+    del data['codec']
+    if 'estimators' in data:
+        data['estimators'] = \
+            [decode_estimator(x) for x in data['estimators']]
+    if 'holidays' in data:
+        data['holidays'] = \
+            holiday.HolidayIndex(_fromordinal(x) for x in data['holidays'])
+    if 'holiday_rules' in data:
+        data['holiday_rules'] = \
+            [holiday.parse_rule(x) for x in data['holiday_rules']]
+    return data
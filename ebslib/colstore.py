@@ -0,0 +1,498 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Columnar binary store.
+
+Tasks are stored by estimator, one column per attribute, and the file
+is memory-mapped so that a column is read only when it is used.  The
+file consists of:
+
+- a header: the magic bytes ``EBSCOLS\\0``, a version number and the
+  length of the metadata (``<8sHHI``, little-endian);
+- metadata, as JSON: holidays, holiday rules and, for each estimator,
+  its name, events, number of tasks, project table and the location
+  of its block of columns;
+- one block of columns for each estimator.
+
+A block holds the following columns, each aligned to eight bytes:
+
+``estimate``, ``actual``
+  float64
+``date``
+  int32 day ordinal; ``0`` if the task has no date
+``project``
+  int32 index into the estimator's project table; ``-1`` if none
+``priority``
+  int32
+``completed``
+  uint8
+``nulls``
+  uint8 flags of the priority, estimate and actual costs that are
+  ``None``, whose columns then hold 0
+``id``, ``description``
+  uint32 offsets (one more than the number of tasks) into a heap of
+  JSON-encoded values
+
+Simulation reads the ``estimate``, ``actual``, ``date``, ``priority``,
+``project`` and ``completed`` columns directly; ``Task`` objects are
+only created when tasks are listed or modified.
+
+Version 1 of the format had no ``nulls`` column, and held priorities
+as int16, ``-1`` if none.  Such files are still read, and are written
+in the current version.
+"""
+
+from __future__ import division
+
+import array
+import datetime
+import itertools
+import json
+import mmap
+import struct
+import sys
+
+from . import estimator
+from . import holiday
+from . import store
+from . import task
+from . import tasktable
+
+
+VERSION = 2
+"""Version of the columnar format written by this module."""
+
+_header = struct.Struct('<8sHHI')
+
+_columns = {
+    1: (
+        ('estimate', 'd'),
+        ('actual', 'd'),
+        ('date', 'i'),
+        ('project', 'i'),
+        ('priority', 'h'),
+        ('completed', 'B'),
+    ),
+    2: (
+        ('estimate', 'd'),
+        ('actual', 'd'),
+        ('date', 'i'),
+        ('project', 'i'),
+        ('priority', 'i'),
+        ('completed', 'B'),
+        ('nulls', 'B'),
+    ),
+}
+"""The columns of a block, by version of the format."""
+
+_heaps = ('id', 'description')
+
+_NULL_PRIORITY, _NULL_ESTIMATE, _NULL_ACTUAL = 1, 2, 4
+
+
+def _dates(obj):
+    """Decode dates (only) in the metadata."""
+    if '__date__' in obj:
+        return datetime.date(*obj['ymd'])
+    return obj
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def _layout(rows, version=VERSION):
+    """Return the offset of each column within a block of ``rows`` rows.
+
+    Offsets of the heap offset tables are included; the heap itself
+    follows the last table.
+    """
+    layout = {}
+    offset = 0
+    for name, code in _columns[version]:
+        layout[name] = offset
+        offset = _align(offset + struct.calcsize('<' + code) * rows)
+    for name in _heaps:
+        layout[name] = offset
+        offset = _align(offset + 4 * (rows + 1))
+    layout['heap'] = offset
+    return layout
+
+
+def _encode_block(tasks):
+    """Encode tasks as a block of columns.
+
+    Return the block and the project table.
+    """
+    rows = len(tasks)
+    projects = []
+    project_index = {}
+    for t in tasks:
+        if t.project is not None and t.project not in project_index:
+            project_index[t.project] = len(projects)
+            projects.append(t.project)
+    values = {
+        'estimate': [float(t.estimate or 0) for t in tasks],
+        'actual': [float(t.actual or 0) for t in tasks],
+        'date': [t.date.toordinal() if t.date else 0 for t in tasks],
+        'project': [project_index.get(t.project, -1) for t in tasks],
+        'priority': [t.priority or 0 for t in tasks],
+        'completed': [1 if t.completed else 0 for t in tasks],
+        'nulls': [
+            (_NULL_PRIORITY if t.priority is None else 0)
+            | (_NULL_ESTIMATE if t.estimate is None else 0)
+            | (_NULL_ACTUAL if t.actual is None else 0)
+            for t in tasks
+        ],
+    }
+    layout = _layout(rows)
+    heap = []
+    heap_size = 0
+    offsets = {}
+    for name in _heaps:
+        offsets[name] = [heap_size]
+        for t in tasks:
+            value = json.dumps(getattr(t, name))
+            heap.append(value)
+            heap_size += len(value)
+            offsets[name].append(heap_size)
+    block = bytearray(layout['heap'])
+    for name, code in _columns[VERSION]:
+        try:
+            struct.pack_into(
+                '<{}{}'.format(rows, code), block, layout[name],
+                *values[name])
+        except struct.error as e:
+            raise UserWarning('Cannot store {}: {}'.format(name, e))
+    for name in _heaps:
+        struct.pack_into(
+            '<{}I'.format(rows + 1), block, layout[name], *offsets[name])
+    return str(block) + ''.join(heap), projects
+
+
+class _Heap(object):
+    """A column of JSON-encoded values, decoded as they are read."""
+
+    __slots__ = frozenset(['_buf', '_start', '_offsets'])
+
+    def __init__(self, buf, start, offsets):
+        self._buf = buf
+        self._start = start
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        start = self._start + self._offsets[i]
+        stop = self._start + self._offsets[i + 1]
+        return json.loads(self._buf[start:stop])
+
+
+class ColumnEstimator(estimator.Estimator):
+    """An estimator whose tasks are read from columns.
+
+    ``source``
+      The ``ColumnStore`` the estimator was read from.
+    ``entry``
+      The metadata entry of the estimator.
+
+    Velocities and simulation estimates are computed from the columns
+    until ``tasks`` is first used, which creates the ``Task`` objects.
+    """
+
+    __slots__ = frozenset([
+        '_source', '_entry', '_columns', '_rows', '_tasks', '_events',
+        '_summary',
+    ])
+
+    def __init__(self, source, entry):
+        self.name = entry['name']
+        self._digest = None
+        self._source = source
+        self._entry = entry
+        self._columns = {}
+        self._rows = {}
+        self._tasks = None
+        self._events = None
+        self._summary = None
+
+    @property
+    def materialised(self):
+        """Whether ``Task`` objects have been created for all tasks."""
+        return self._tasks is not None
+
+    def column(self, name):
+        """Return the named column as a sequence."""
+        if name not in self._columns:
+            self._columns[name] = self._source._column(self._entry, name)
+        return self._columns[name]
+
+    def _task(self, row):
+        if row not in self._rows:
+            projects = self._entry['projects']
+            project = self.column('project')[row]
+            date = self.column('date')[row]
+            nulls = self.column('nulls')[row]
+            self._rows[row] = task.Task(
+                id=self.column('id')[row],
+                project=projects[project] if project >= 0 else None,
+                description=self.column('description')[row],
+                priority=None if nulls & _NULL_PRIORITY
+                    else self.column('priority')[row],
+                estimate=None if nulls & _NULL_ESTIMATE
+                    else tasktable._number(self.column('estimate')[row]),
+                date=datetime.date.fromordinal(date) if date else None,
+                completed=bool(self.column('completed')[row]),
+                actual=None if nulls & _NULL_ACTUAL
+                    else tasktable._number(self.column('actual')[row]),
+            )
+        return self._rows[row]
+
+    @property
+    def tasks(self):
+        if self._tasks is None:
+            self._tasks = tasktable.TaskTable.adopt(
+                self._task(i) for i in xrange(self._entry['rows']))
+        return self._tasks
+
+    @tasks.setter
+    def tasks(self, value):
+        self._tasks = value
+
+    @property
+    def events(self):
+        if self._events is None:
+            self._events = \
+                [task.Event.from_dict(x) for x in self._entry['events']]
+        return self._events
+
+    @events.setter
+    def events(self, value):
+        self._events = value
+
+    @property
+    def summary(self):
+        if self._summary is None:
+            self._summary = estimator.VelocitySummary.from_tasks(
+                itertools.chain(
+                    self.tasks, self._source.archived_tasks(self.name)))
+        return self._summary
+
+    @summary.setter
+    def summary(self, value):
+        self._summary = value
+
+    def pending_tasks(self):
+        if self._tasks is not None:
+            return super(ColumnEstimator, self).pending_tasks()
+        completed = self.column('completed')
+        return (
+            self._task(i) for i in xrange(len(completed)) if not completed[i]
+        )
+
+    def update_task(self, t, **kwargs):
+        self.tasks  # columns no longer describe the tasks
+        super(ColumnEstimator, self).update_task(t, **kwargs)
+
+    def velocities(self, max_age=None):
+        if self._tasks is not None:
+            return super(ColumnEstimator, self).velocities(max_age)
+        oldest = datetime.date.today().toordinal() - abs(max_age).days \
+            if max_age else None
+        archived = (
+            (t.estimate, t.actual, True, t.date and t.date.toordinal())
+            for t in self._source.archived_tasks(self.name)
+        )
+        return sorted(
+            estimate / actual
+            for estimate, actual, completed, date in itertools.chain(
+                zip(
+                    self.column('estimate'), self.column('actual'),
+                    self.column('completed'), self.column('date')),
+                archived
+            )
+            if completed and estimate and actual
+                and not (oldest and date and date < oldest)
+        )
+
+    def _simulation_estimates(self, project=None, priority=None):
+        if self._tasks is not None:
+            return super(ColumnEstimator, self)._simulation_estimates(
+                project, priority)
+        projects = self._entry['projects']
+        if project and project not in projects:
+            return []
+        project = projects.index(project) if project else None
+        return [
+            estimate
+            for estimate, completed, p, pr in zip(
+                self.column('estimate'), self.column('completed'),
+                self.column('project'), self.column('priority'))
+            if not completed
+                and not (priority and pr > 0 and pr > priority)
+                and (project is None or p == project)
+        ]
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        return isinstance(other, estimator.Estimator) and all(
+            getattr(self, attr) == getattr(other, attr)
+            for attr in estimator.Estimator.fields
+        )
+
+    def __repr__(self):
+        return '{}(name={!r})'.format(type(self).__name__, self.name)
+
+
+class ColumnStore(store.Store):
+    """A store of task columns in a memory-mapped file.
+
+    The mapping is kept while its data are in use, so that columns
+    can still be read after the store has been written (or replaced
+    by another process).
+    """
+
+    __slots__ = ('_fp', '_mmap', '_base', '_format')
+
+    def __init__(self, filename, **kwargs):
+        super(ColumnStore, self).__init__(filename, **kwargs)
+        self._fp = None
+        self._mmap = None
+        self._base = 0
+        self._format = VERSION
+
+    def _open(self):
+        self._data = {}
+        self._version = self._disk_version()
+        try:
+            fp = open(self._filename, 'rb')
+        except IOError:
+            return
+        try:
+            buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, _, size = _header.unpack_from(buf)
+            if magic != store._columns_magic:
+                raise ValueError('bad magic')
+        except (ValueError, struct.error, mmap.error):
+            fp.close()
+            raise UserWarning(
+                'Not a columnar store: {}'.format(self._filename))
+        if version > VERSION:
+            fp.close()
+            raise UserWarning(
+                'Unsupported columnar store version {}: {}'
+                .format(version, self._filename))
+        self._fp = fp
+        self._mmap = buf
+        self._base = _align(_header.size + size)
+        self._format = version
+        metadata = json.loads(
+            buf[_header.size:_header.size + size],
+            object_hook=_dates
+        )
+        self._data['holidays'] = holiday.HolidayIndex(metadata['holidays'])
+        self._data['holiday_rules'] = \
+            [holiday.parse_rule(x) for x in metadata['holiday_rules']]
+        self._data['estimators'] = \
+            [ColumnEstimator(self, x) for x in metadata['estimators']]
+
+    def _close(self):
+        if self._fp is not None:
+            self._mmap.close()
+            self._fp.close()
+            self._fp = self._mmap = None
+
+    def _column(self, entry, name):
+        """Read a column of an estimator's block."""
+        rows = entry['rows']
+        start = self._base + entry['offset']
+        layout = _layout(rows, self._format)
+        if name == 'nulls' and self._format == 1:
+            return [
+                _NULL_PRIORITY if priority < 0 else 0
+                for priority in self._column(entry, 'priority')
+            ]
+        if name not in _heaps:
+            code = dict(_columns[self._format])[name]
+            return self._array(code, start + layout[name], rows)
+        offsets = self._array('I', start + layout[name], rows + 1)
+        return _Heap(self._mmap, start + layout['heap'], offsets)
+
+    def _array(self, code, offset, count):
+        """Return ``count`` values of the mapping as an ``array``.
+
+        The bytes are copied from the mapping at once, without being
+        parsed; values are made Python objects only as they are read.
+        """
+        values = array.array(code)
+        values.fromstring(
+            buffer(self._mmap, offset, values.itemsize * count))
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._reset_indexes()
+            self._close()
+            self._open()
+        return self._data
+
+    @data.deleter
+    def data(self):
+        store.Store.data.fdel(self)
+        self._close()
+
+    def _write(self, fp):
+        entries = []
+        blocks = []
+        offset = 0
+        for e in self.estimators:
+            entry = {'name': e.name, 'events': e.events}
+            if isinstance(e, ColumnEstimator) and e._source is self \
+                    and not e.materialised and self._format == VERSION:
+                # copy the block unchanged
+                start = self._base + e._entry['offset']
+                block = self._mmap[start:start + e._entry['length']]
+                entry['rows'] = e._entry['rows']
+                entry['projects'] = e._entry['projects']
+            else:
+                block, entry['projects'] = _encode_block(e.tasks)
+                entry['rows'] = len(e.tasks)
+            entry['offset'] = offset
+            entry['length'] = len(block)
+            entries.append(entry)
+            blocks.append(block)
+            offset = _align(offset + len(block))
+        metadata = json.dumps({
+            'holidays': self.holidays,
+            'holiday_rules': self.holiday_rules,
+            'estimators': entries,
+        }, default=store._serialise)
+        fp.write(_header.pack(
+            store._columns_magic, VERSION, 0, len(metadata)))
+        fp.write(metadata)
+        end = _header.size + len(metadata)
+        fp.write('\0' * (_align(end) - end))
+        for block in blocks:
+            fp.write(block)
+            fp.write('\0' * (_align(len(block)) - len(block)))
+
+    def _commit(self):
+        store.atomic_write(self._filename, self._write)
@@ -17,26 +17,54 @@
 from __future__ import unicode_literals
 
 import argparse
+import collections
 import datetime
 import functools
 import itertools
 import operator
+import os
 import re
+import sys
 import textwrap
 
 from . import config as _config
 from . import task as _task
 from . import estimator as _estimator
 from . import date as _date
+from . import holiday as _holiday
 from . import store as _store
+from . import tasktable as _tasktable
 
-try:
-    import bzlib.bugzilla
-    import bzlib.bug
-except ImportError:
-    pass
 
-conf = _config.Config.get_config('~/.ebsrc')
+class _Config(object):
+    """The user configuration, read from ``~/.ebsrc`` when first used."""
+
+    def __getattr__(self, name):
+        return getattr(_config.Config.get_config('~/.ebsrc'), name)
+
+
+conf = _Config()
+
+
+class _Module(object):
+    """A module of this package, imported when first used.
+
+    Modules used by only a few commands are imported this way, so
+    that other commands start without them.
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, name):
+        import importlib
+        module = importlib.import_module(self._name, __package__)
+        self.__dict__.update(vars(module))  # found without this method
+        return getattr(module, name)
+
+
+_bulk = _Module('.bulk')
+_estcache = _Module('.estcache')
 
 
 def date(s):
@@ -49,6 +77,49 @@ def date(s):
         raise argparse.ArgumentTypeError(e.message)
 
 
+def holiday_rule(s):
+    try:
+        return _holiday.parse_rule(s)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(e.message)
+
+
+def _parser_add_holiday(parser):
+    """Add mutually exclusive holiday date and holiday rule arguments."""
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--date', type=date,
+        help='Date of the holiday.')
+    group.add_argument('--rule', type=holiday_rule,
+        help='Recurring holiday rule.')
+
+
+def store_options():
+    """Return ``open_store`` keyword arguments from the configuration.
+
+    Options are read from the ``store`` section:
+
+    ``journal``
+      Whether to keep a journal of modifications to JSON stores.
+    ``journal_limit``
+      Journal size, in bytes, at which the journal is compacted.
+    ``compression_level``
+      Level at which gzip- or xz-compressed stores are compressed.
+    ``lock_timeout``
+      Seconds to wait for another ebs process to release the store.
+    """
+    options = {}
+    if conf.has_option('store', 'journal'):
+        options['journal'] = conf.getboolean('store', 'journal')
+    if conf.has_option('store', 'journal_limit'):
+        options['journal_limit'] = conf.getint('store', 'journal_limit')
+    if conf.has_option('store', 'compression_level'):
+        options['compression_level'] = \
+            conf.getint('store', 'compression_level')
+    if conf.has_option('store', 'lock_timeout'):
+        options['lock_timeout'] = conf.getfloat('store', 'lock_timeout')
+    return options
+
+
 class Command(object):
     """A command object.
 
@@ -87,7 +158,7 @@ class Command(object):
         """
         args: an argparse.Namespace
         parser: the argparse.ArgumentParser
-        commands: a dict of all Command classes keyed by __name__.lower()
+        commands: the command registry, keyed by __name__.lower()
         aliases: a dict of aliases keyed by alias
         """
         self._args = args
@@ -173,8 +244,25 @@ class EBSCommand(Command):
             help='Path to datastore'),
     ]
 
+    readonly = False
+    """Whether the command only reads the store.
+
+    Read-only commands read the latest committed version of the store
+    without waiting; other commands have exclusive use of the store
+    while they run.
+    """
+
+    forward = True
+    """Whether the command is run by ``ebs serve`` serving the store.
+
+    Commands reading or writing files other than the store, which are
+    those of the client, are not.
+    """
+
     def __call__(self):
-        with _store.Store(self._args.store) as store:
+        with _store.open_store(
+            self._args.store, readonly=self.readonly, **store_options()
+        ) as store:
             self._store = store
             self._run()
             del self._store
@@ -188,9 +276,7 @@ class AddEstimator(EBSCommand):
     ]
 
     def _run(self):
-        self._store.assert_estimator_not_exist(self._args.name)
-        self._store.estimators.append(
-            _estimator.Estimator(name=self._args.name))
+        self._store.add_estimator(_estimator.Estimator(name=self._args.name))
 
 
 class AddEvent(EBSCommand):
@@ -212,22 +298,29 @@ class AddEvent(EBSCommand):
         hpd = float(conf.get('core', 'hours_per_day'))
         if self._args.cost > hpd:
             raise UserWarning('Event cannot have cost greater than one day.')
-        self._store.assert_estimator_exist(self._args.estimator)
         event = _task.Event(
             **{attr: getattr(self._args, attr) for attr in self._attrs})
-        self._store.get_estimator(self._args.estimator).events.append(event)
+        self._store.add_event(self._args.estimator, event)
 
 
 class AddHoliday(EBSCommand):
-    """Add a holiday."""
-    args = EBSCommand.args + [
-        lambda x: x.add_argument('--date', required=True, type=date,
-            help='Date of the holiday.'),
-    ]
+    """Add a holiday.
+
+    Either a single date, or a recurring rule, may be given.  Rules
+    take one of the following forms:
+
+      annual:MM-DD    the same date every year (e.g. annual:12-25)
+      nth:N:DAY:MM    the Nth weekday DAY of month MM; N may be -1
+                      for the last such day (e.g. nth:4:thu:11)
+      easter:OFFSET   a day relative to Easter Sunday (e.g. easter:-2)
+    """
+    args = EBSCommand.args + [_parser_add_holiday]
 
     def _run(self):
-        if self._args.date not in self._store.holidays:
-            self._store.holidays.append(self._args.date)
+        if self._args.date:
+            self._store.add_holiday(self._args.date)
+        else:
+            self._store.add_holiday_rule(self._args.rule)
 
 
 class AddTask(EBSCommand):
@@ -258,15 +351,157 @@ class AddTask(EBSCommand):
     )
 
     def _run(self):
-        self._store.assert_task_not_exist(self._args.id)
-        self._store.assert_estimator_exist(self._args.estimator)
         task = _task.Task(
             **{attr: getattr(self._args, attr) for attr in self._attrs})
-        self._store.get_estimator(self._args.estimator).tasks.append(task)
+        self._store.add_task(self._args.estimator, task)
+
+
+class Archive(EBSCommand):
+    """Move old completed tasks to the archive.
+
+    Archived tasks are no longer listed or synced, but their
+    velocities are still used for estimates and statistics.
+    """
+    args = EBSCommand.args + [
+        lambda x: x.add_argument('--days', type=int, default=90,
+            help='archive tasks estimated more than DAYS days ago '
+                '(default: 90)'),
+    ]
+
+    def _run(self):
+        before = datetime.date.today() \
+            - datetime.timedelta(days=self._args.days)
+        print 'Archived {} tasks.'.format(self._store.archive_tasks(before))
+
+
+class Batch(EBSCommand):
+    """Run many commands on the store, writing it once.
+
+    Commands are read from FILE, or from standard input, one per line.
+    A line is either a command line, as would be given to ebs, or a
+    JSON record: a list of arguments, or an object giving the command
+    name as "command" and its options by name.  An option given a list
+    is repeated for each of its values.  For example:
+
+      addtask --estimator bob --id 1 --estimate 4
+      ["addtask", "--estimator", "bob", "--id", "2", "--estimate", "2"]
+      {"command": "addtask", "estimator": "bob", "id": "3", "estimate": 1}
+
+    Blank lines and lines beginning with '#' are ignored.  The store
+    is written when all commands have run; if any command fails,
+    nothing is written.
+    """
+
+    forward = False
+    args = EBSCommand.args + [
+        lambda x: x.add_argument('file', metavar='FILE', nargs='?',
+            type=argparse.FileType('r'), default='-',
+            help='file of commands (default: standard input)'),
+    ]
+
+    def _run(self):
+        self._parsers = {}
+        try:
+            for lineno, line in enumerate(self._args.file, 1):
+                try:
+                    argv = self._parse_line(line)
+                    if argv:
+                        self._dispatch(argv)
+                except UserWarning as e:
+                    raise UserWarning('line {}: {}'.format(lineno, e))
+        except:
+            self._store.discard()
+            raise
+
+    def _parse_line(self, line):
+        """Return the arguments given by a line of input."""
+        line = line.strip()
+        if not line or line.startswith('#'):
+            return []
+        if line[0] not in '[{':
+            import shlex
+            return shlex.split(line)
+        import json
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise UserWarning('Invalid JSON record.')
+        if isinstance(record, list):
+            return map(unicode, record)
+        if not isinstance(record, dict) or 'command' not in record:
+            raise UserWarning('JSON record gives no command.')
+        argv = [record.pop('command')]
+        for k, v in sorted(record.viewitems()):
+            option = '--' + k.replace('_', '-')
+            if v is True:
+                argv.append(option)
+            elif isinstance(v, list):
+                for x in v:
+                    argv.extend([option, unicode(x)])
+            elif v is not None and v is not False:
+                argv.extend([option, unicode(v)])
+        return argv
+
+    def _dispatch(self, argv):
+        """Run the command given by the arguments on the open store."""
+        if argv[0] in self._aliases:
+            argv[:1] = self._aliases[argv[0]].split()
+        name = argv[0]
+        try:
+            cls = get_command(name)
+        except KeyError:
+            raise UserWarning('Unknown command: {}'.format(name))
+        if not issubclass(cls, EBSCommand) or not hasattr(cls, '_run') \
+                or issubclass(cls, Batch):
+            raise UserWarning('Not a store command: {}'.format(name))
+        if name not in self._parsers:
+            self._parsers[name] = build_parser([name])
+        parser = self._parsers[name]
+        try:
+            args = parser.parse_args(argv + ['--store', self._args.store])
+        except SystemExit:
+            # argparse has reported the error
+            raise UserWarning('Invalid command: {}'.format(' '.join(argv)))
+        command = args.command(args, parser, self._commands, self._aliases)
+        command._store = self._store
+        command._run()
+
+
+class Convert(EBSCommand):
+    """Copy the store into a new store, possibly of another format.
+
+    The format of the new store is detected from its file name unless
+    given explicitly; file names ending in .db, .sqlite or .sqlite3
+    denote SQLite stores.  The new store must not already exist.
+    """
+
+    forward = False
+
+    readonly = True
+    args = EBSCommand.args + [
+        lambda x: x.add_argument('--output', metavar='PATH', required=True,
+            help='Path to new datastore'),
+        lambda x: x.add_argument('--format', choices=_store.formats,
+            help='Format of new datastore'),
+    ]
+
+    def _run(self):
+        output = os.path.expanduser(self._args.output)
+        if os.path.exists(output):
+            raise UserWarning('Output store exists: {}'.format(output))
+        with _store.open_store(output, format=self._args.format) as store:
+            _store.copy(self._store, store)
 
 
 class Estimate(EBSCommand):
-    """Perform an estimation using Monte Carlo simulations."""
+    """Perform an estimation using Monte Carlo simulations.
+
+    Simulated futures are cached in <store>.estimates, and are reused
+    while the velocities and estimates simulated are unchanged.  Ship
+    dates are computed afresh.
+    """
+
+    readonly = True
     args = EBSCommand.args + [
         (('--exponent',), dict(metavar='N', type=int, default=2,
             help='Perform 10^N rounds of simulation (n >=2)')),
@@ -276,44 +511,68 @@ class Estimate(EBSCommand):
             help='limit to tasks with the given priority (or higher)')),
         (('--max-velocity-age',), dict(type=int, metavar='DAYS',
             help='use velocities no older than DAYS days')),
+        (('--seed',), dict(type=int,
+            help='seed the simulations, for repeatable results')),
+        (('--no-cache',), dict(action='store_true',
+            help='simulate afresh, replacing cached simulations')),
     ]
 
+    def _simulation_inputs(self, estimator, project):
+        """Return the velocities and estimates to simulate."""
+        return estimator.simulation_inputs(
+            priority=self._args.priority,
+            project=project,
+            max_age=self.max_age
+        )
+
     def _futures(self, estimator, project):
         """Get possible futures for the given estimator and project.
 
         Return an list of ten possible futures, as an int hours
         remaining, in increasing order at an interval of 10%.
         """
-        exp = self.exp
-        futures = estimator.simulate_futures(
-            priority=self._args.priority,
-            project=project,
-            max_age=self.max_age
-        )
-        future_sums = (sum(ests) for ests in futures)
-        future_limited = sorted(itertools.islice(future_sums, 10 ** exp))
-        return future_limited[10 ** (exp - 1) - 1:10 ** exp:10 ** (exp - 1)]
-
-    def _run(self):
+        velocities, estimates = self._simulation_inputs(estimator, project)
+        key = self._cache.key(velocities, estimates, self.exp, self._args.seed)
+        futures = None if self._args.no_cache else self._cache.get(key)
+        if futures is None:
+            futures = _estimator.future_deciles(
+                velocities, estimates, self.exp, self._args.seed)
+            self._cache.set(key, futures)
+        return futures
+
+    def _setup(self):
+        """Read the arguments, configuration and holidays."""
         self.exp = self._args.exponent if self._args.exponent >= 2 else 2
-        hpd = float(conf.get('core', 'hours_per_day'))
-        today = datetime.date.today()
-        tomorrow = today + datetime.timedelta(days=1)
+        self.hpd = float(conf.get('core', 'hours_per_day'))
+        self.projects = conf.get('core', 'projects').split(',')
+        self.today = datetime.date.today()
         # maximum estimate age
         self.max_age = datetime.timedelta(days=self._args.max_velocity_age) \
             if self._args.max_velocity_age is not None else None
+        self._holidays = self._store.holiday_calendar()
+        self._cache = _estcache.EstimateCache(
+            _estcache.cache_filename(self._store.filename))
 
+    def _estimators(self):
+        """Return the estimators to estimate."""
         if self._args.estimator:
             self._store.assert_estimator_exist(self._args.estimator)
-            estimators = [self._store.get_estimator(self._args.estimator)]
-        else:
-            estimators = self._store.estimators
+            return [self._store.get_estimator(self._args.estimator)]
+        return self._store.estimators
 
+    def _run(self):
+        self._setup()
         # get sliced futures for all estimators
-        for e in estimators:
+        for e in self._estimators():
             print e.name
             try:
-                cols = list(self._project_estimates(e))
+                cols = [
+                    ['  ' + project] + [
+                        '    {:2}% : {}'.format(percent, date)
+                        for percent, hours, date in futures
+                    ]
+                    for project, futures in self._project_estimates(e)
+                ]
                 for row in xrange(len(cols[0])):
                     template = '{:{}}' * len(cols)
                     vals = [col[row] for col in cols]
@@ -323,51 +582,177 @@ class Estimate(EBSCommand):
                     )
             except _estimator.NoHistoryError as exc:
                 print '  ' + exc.message
-                est = sum(t.estimate for t in e.pending_tasks())
+                est, date = self._unsimulated_estimate(e)
                 print '  sum of estimates    = {}h'.format(est)
-                date = _date.ship_date(
-                    hours=est, hours_per_day=hpd, start_date=today,
-                    events=list(e.get_events(start=tomorrow)),
-                    holidays=self._store.holidays
-                )[0]
                 print '  estimated ship date = {}'.format(date)
-
-    def _project_estimates(self, estimator):
-        """Yield lists of strings showing outcomes with probabilities."""
-        hpd = float(conf.get('core', 'hours_per_day'))
-        today = datetime.date.today()
-        tomorrow = today + datetime.timedelta(days=1)
+        self._cache.save()
+
+    def _event_timeline(self, estimator):
+        """Return an ``EventTimeline`` of the estimator's future events."""
+        tomorrow = self.today + datetime.timedelta(days=1)
+        return _date.EventTimeline(estimator.get_events(start=tomorrow))
+
+    def _project_estimates(self, estimator, events=None):
+        """Generate ``(project, futures)`` pairs for the estimator.
+
+        Futures are ``(percent, hours, date)`` tuples of the hours
+        remaining and ship date of ten possible futures, with the
+        percentage of futures that are sooner.  The hours of each
+        project include those of the projects before it.  ``events``
+        is the ``_event_timeline`` of the estimator, which is read
+        from the estimator if not given.
+        """
         acc = [0 for i in range(10)]
-        projects = conf.get('core', 'projects').split(',')
+        if events is None:
+            events = self._event_timeline(estimator)
 
-        for project in projects:
+        for project in self.projects:
             estimates = self._futures(estimator, project)
             acc = map(operator.add, acc, estimates)
-            future_dates = [
-                _date.ship_date(
-                    hours=h, hours_per_day=hpd, start_date=today,
-                    events=list(estimator.get_events(start=tomorrow)),
-                    holidays=self._store.holidays
-                )
-                for h in acc
-            ]
-            yield ['  ' + project] + [
-                '    {:2}% : {}'.format(
-                    (i + 1) * 100 / len(future_dates) - 1,
-                    future_dates[i][0]
+            yield project, [
+                (
+                    (i + 1) * 100 / len(acc) - 1,
+                    h,
+                    _date.ship_date(
+                        hours=h, hours_per_day=self.hpd,
+                        start_date=self.today, events=events,
+                        holidays=self._holidays
+                    )[0]
                 )
-                for i in range(len(future_dates))
+                for i, h in enumerate(acc)
             ]
 
+    def _unsimulated_estimate(self, estimator):
+        """Return the sum of estimates and the ship date it gives.
+
+        This is the estimate of estimators without history.
+        """
+        tomorrow = self.today + datetime.timedelta(days=1)
+        est = sum(t.estimate for t in estimator.pending_tasks())
+        date = _date.ship_date(
+            hours=est, hours_per_day=self.hpd, start_date=self.today,
+            events=list(estimator.get_events(start=tomorrow)),
+            holidays=self._holidays
+        )[0]
+        return est, date
+
+
+class Import(EBSCommand):
+    """Import tasks, events and holidays from CSV or JSONL.
+
+    Each row of FILE, or of standard input, is a record of a task, an
+    event or a holiday, with fields named as the options of addtask,
+    addevent and addholiday; a task row may also give "completed".
+    Rows are of the kind given by --type unless they give their kind
+    in a "type" field.  CSV files name their fields in the first line.
+
+    Rows that are invalid, that name an estimator not in the store, or
+    that give the ID of a task already in the store or archived, are
+    rejected and reported.  The other rows are imported.
+
+    Rows are decoded and validated one at a time, and the tasks of
+    each chunk are then added to the store as columns.  Expect some
+    20,000 rows a second; most of the time goes to decoding and
+    validating rows, which is not done in bulk.
+    """
+
+    forward = False
+    args = EBSCommand.args + [
+        lambda x: x.add_argument('file', metavar='FILE', nargs='?',
+            type=argparse.FileType('rb'), default='-',
+            help='file of rows (default: standard input)'),
+        lambda x: x.add_argument('--format', choices=_bulk.formats,
+            help='format of rows (default: from the file name, or jsonl)'),
+        lambda x: x.add_argument('--type', choices=_bulk.kinds,
+            default='task',
+            help='kind of rows not giving a type (default: task)'),
+        lambda x: x.add_argument('--chunk-size', metavar='ROWS', type=int,
+            default=10000,
+            help='number of rows added at a time (default: 10000)'),
+    ]
+
+    def _run(self):
+        import time
+        start = time.time()
+        format = self._args.format \
+            or _bulk.detect_format(self._args.file.name)
+        self._counts = collections.Counter()
+        rows = _bulk.read_rows(self._args.file, format)
+        nrows = 0
+        while True:
+            chunk = list(itertools.islice(rows, self._args.chunk_size))
+            if not chunk:
+                break
+            nrows += len(chunk)
+            self._import_chunk(chunk)
+        elapsed = time.time() - start
+        print 'Imported {} tasks, {} events and {} holidays.'.format(
+            self._counts['task'], self._counts['event'],
+            self._counts['holiday'])
+        print 'Rejected {} rows.'.format(self._counts['rejected'])
+        print 'Read {} rows in {:.2f} s ({:.0f} rows/s).'.format(
+            nrows, elapsed, nrows / elapsed if elapsed else 0)
+
+    def _import_chunk(self, chunk):
+        """Import a chunk of rows, adding tasks an estimator at a time.
+
+        The tasks of each estimator are added as a ``TaskTable``, which
+        is copied into the store column by column.
+        """
+        tasks = collections.OrderedDict()  # new tasks, by estimator
+        ids = set()
+        for line, row in chunk:
+            try:
+                kind, values = _bulk.parse_row(row, self._args.type)
+                if 'estimator' in values and not \
+                        self._store.estimator_exists(values['estimator']):
+                    raise ValueError(
+                        'no estimator: {}'.format(values['estimator']))
+                if kind == 'task':
+                    id = values['id']
+                    if id in ids or self._store.task_exists(id) \
+                            or self._store.task_archived(id):
+                        raise ValueError('duplicate task: {}'.format(id))
+                    ids.add(id)
+                    tasks.setdefault(values['estimator'], []).append(
+                        _bulk.task_record(values))
+                elif kind == 'event':
+                    self._add_event(values)
+                elif 'date' in values:
+                    self._store.add_holiday(values['date'])
+                else:
+                    self._store.add_holiday_rule(values['rule'])
+            except (ValueError, UserWarning) as e:
+                self._counts['rejected'] += 1
+                print >>sys.stderr, 'line {}: {}'.format(line, e)
+                continue
+            self._counts[kind] += 1
+        for name, records in tasks.viewitems():
+            self._store.add_tasks(
+                name, _tasktable.TaskTable.from_records(records))
+
+    def _add_event(self, values):
+        hpd = float(conf.get('core', 'hours_per_day'))
+        if values['cost'] > hpd:
+            raise ValueError('event cannot have cost greater than one day')
+        self._store.add_event(values['estimator'], _bulk.make_event(values))
+
 
 class LsEvent(EBSCommand):
     """List events by estimator."""
+
+    readonly = True
+
+    def _events(self, estimator):
+        """Return the estimator's events from today, in date order."""
+        events = estimator.get_events(start=datetime.date.today())
+        return sorted(events, key=lambda x: x.date)
+
     def _run(self):
         for e in self._store.estimators:
             print e.name
-            events = e.get_events(start=datetime.date.today())
             n = 0
-            for event in sorted(events, key=lambda x: x.date):
+            for event in self._events(e):
                 n += 1
                 print '  {} {:4.2}h {}'.format(
                     event.date,
@@ -403,6 +788,8 @@ class LsTask(EBSCommand):
     task is complete, otherwise a space, followed by the integer
     priority of the task, if priority is set.
     """
+
+    readonly = True
     args = EBSCommand.args + [
         lambda x: x.add_argument('--estimator', metavar='NAME',
             action='append',
@@ -437,7 +824,7 @@ class LsTask(EBSCommand):
             and (self._args.id is None
                 or task.id in self._args.id)
             and (self._args.description is None or any(
-                    s.lower() in task.description.lower()
+                    s.lower() in (task.description or '').lower()
                     for s in self._args.description))
             and (self._args.priority is None
                 or task.priority <= self._args.priority)
@@ -449,10 +836,19 @@ class LsTask(EBSCommand):
                 or task.project in self._args.project)
         )
 
+    def _tasks(self):
+        """Generate the ``(estimator, task)`` pairs to include."""
+        tasks = self._store.tasks(
+            estimators=self._args.estimator,
+            ids=self._args.id,
+            projects=self._args.project,
+            completed=self._args.complete,
+            priority=self._args.priority,
+        )
+        return ((e, t) for e, t in tasks if self._include_task(e, t))
+
     def _run(self):
-        tasks = self._store.tasks()
-        filtered_tasks = ((e, t) for e, t in tasks if self._include_task(e, t))
-        for estimator, task in filtered_tasks:
+        for estimator, task in self._tasks():
             print '{}{}{} {} {}: {}'.format(
                 'E' if task.estimate else ' ',
                 'C' if task.completed else ' ',
@@ -463,11 +859,77 @@ class LsTask(EBSCommand):
             )
 
 
+class Export(LsTask):
+    """Export tasks, events and holidays as JSONL or CSV.
+
+    Rows are written as they are read from the store, in the form read
+    by import.  Tasks are limited by the options of lstask; events
+    are limited only by --estimator.  CSV files have the columns of
+    all the kinds of row exported, with a "type" column.
+    """
+
+    forward = False
+    args = LsTask.args + [
+        lambda x: x.add_argument('--output', metavar='FILE',
+            type=argparse.FileType('wb'), default='-',
+            help='file to write (default: standard output)'),
+        lambda x: x.add_argument('--format', choices=_bulk.formats,
+            help='format of rows (default: from the file name, or jsonl)'),
+        lambda x: x.add_argument('--type', action='append',
+            choices=_bulk.kinds,
+            help='kind of rows to export (default: all)'),
+    ]
+
+    def _rows(self, kinds):
+        if 'task' in kinds:
+            for estimator, task in self._tasks():
+                yield _bulk.task_row(estimator.name, task)
+        if 'event' in kinds:
+            for estimator in self._store.estimators:
+                if self._args.estimator is None \
+                        or estimator.name in self._args.estimator:
+                    for event in estimator.events:
+                        yield _bulk.event_row(estimator.name, event)
+        if 'holiday' in kinds:
+            for date in sorted(self._store.holidays):
+                yield _bulk.holiday_row(date=date)
+            for rule in self._store.holiday_rules:
+                yield _bulk.holiday_row(rule=rule)
+
+    def _run(self):
+        output = self._args.output
+        format = self._args.format or _bulk.detect_format(output.name)
+        kinds = [x for x in _bulk.kinds if x in (self._args.type or [x])]
+        _bulk.write_rows(output, format, self._rows(kinds), kinds)
+        output.flush()
+
+
 class LsHoliday(EBSCommand):
-    """List holidays."""
+    """List holidays.
+
+    Without --year, list holiday dates followed by recurring holiday
+    rules.  With --year, list every holiday falling in the given year.
+    """
+
+    readonly = True
+    args = EBSCommand.args + [
+        lambda x: x.add_argument('--year', type=int,
+            help='list all holidays falling in the given year'),
+    ]
+
     def _run(self):
-        for date in sorted(self._store.holidays):
+        if self._args.year:
+            calendar = self._store.holiday_calendar()
+            for date in calendar.between(
+                datetime.date(self._args.year, 1, 1),
+                datetime.date(self._args.year + 1, 1, 1)
+            ):
+                print date
+            return
+        for date in self._store.holidays:
             print date
+        for rule in self._store.holiday_rules:
+            print rule
 
 
 class RmEstimator(EBSCommand):
@@ -479,21 +941,19 @@ class RmEstimator(EBSCommand):
     ]
 
     def _run(self):
-        estimator = self._store.get_estimator(self._args.name)
-        self._store.estimators.remove(estimator)
+        estimator = self._store.remove_estimator(self._args.name)
         print "Removed estimator '{}'.".format(estimator.name)
 
 
 class RmHoliday(EBSCommand):
-    """Remove a holiday."""
-    args = EBSCommand.args + [
-        lambda x: x.add_argument('--date', required=True, type=date,
-            help='Date of the holiday.'),
-    ]
+    """Remove a holiday or a recurring holiday rule."""
+    args = EBSCommand.args + [_parser_add_holiday]
 
     def _run(self):
-        if self._args.date in self._store.holidays:
-            self._store.holidays.remove(self._args.date)
+        if self._args.date:
+            self._store.remove_holiday(self._args.date)
+        else:
+            self._store.remove_holiday_rule(self._args.rule)
 
 
 class RmTask(EBSCommand):
@@ -504,20 +964,26 @@ class RmTask(EBSCommand):
     ]
 
     def _run(self):
-        for estimator, task in self._store.tasks():
-            if task.id == self._args.id:
-                estimator.tasks.remove(task)
-                print 'Removed task {}.'.format(self._args.id)
-                return
-        print 'Task {} not found.'.format(self._args.id)
+        if self._store.task_exists(self._args.id):
+            self._store.remove_task(self._args.id)
+            print 'Removed task {}.'.format(self._args.id)
+        else:
+            print 'Task {} not found.'.format(self._args.id)
 
 
 class Stats(EBSCommand):
-    """Calculate velocity statistics for each estimator."""
+    """Calculate velocity statistics for each estimator.
+
+    The second line of output for each estimator shows the 10th,
+    50th (median) and 90th percentile velocities.
+    """
+
+    readonly = True
     args = EBSCommand.args + [
         (('--max-velocity-age',), dict(type=int, metavar='DAYS',
             help='use velocities no older than DAYS days')),
     ]
+    _quantiles = (0.1, 0.5, 0.9)
 
     def _run(self):
         max_age = datetime.timedelta(days=self._args.max_velocity_age) \
@@ -525,18 +991,21 @@ class Stats(EBSCommand):
         for e in self._store.estimators:
             print e.name
             try:
-                stat_fns = [
-                    lambda **kw: len(e.velocities(**kw)), e.min_velocity,
-                    e.max_velocity, e.mean_velocity, e.stddev_velocity
-                ]
-                print (
-                    '  n: {}, min: {:.2}, max: {:.2}, mean: {:.2}, '
-                    'stddev: {:.2}'.format(
-                        *(x(max_age=max_age) for x in stat_fns)
-                    )
+                stats = e.velocity_stats(max_age=max_age)
+            except _estimator.NoHistoryError as exc:
+                print '  ' + exc.message
+                continue
+            print (
+                '  n: {}, min: {:.2}, max: {:.2}, mean: {:.2}, '
+                'stddev: {:.2}'.format(
+                    stats.count, stats.min, stats.max,
+                    stats.mean, stats.stddev
                 )
-            except _estimator.NoHistoryError as e:
-                print '  ' + e.message
+            )
+            print '  ' + ', '.join(
+                '{:.0%}: {:.2}'.format(q, stats.quantile(q))
+                for q in self._quantiles
+            )
 
 
 class Sync(EBSCommand):
@@ -567,7 +1036,7 @@ class Sync(EBSCommand):
             stale_tasks = \
                 [(e, t) for e, t in self._store.tasks() if t.id not in bugs]
             for estimator, task in stale_tasks:
-                estimator.tasks.remove(task)
+                self._store.remove_task(task.id)
                 print "DELETE {} : {}".format(task.id, task.description)
 
     def _sync_project(self, project):
@@ -578,6 +1047,11 @@ class Sync(EBSCommand):
         Return the ``set`` of bugs matched by the search arguments
         for the given project.
         """
+        try:
+            import bzlib.bugzilla
+            import bzlib.bug
+        except ImportError:
+            raise UserWarning('Sync requires bzlib, which is not installed.')
         self._project = project  # set project context
         sync_conf = dict(conf.items('.'.join(['sync', project])))
         _search_args = self._parse_dict(sync_conf['search_args'])
@@ -596,6 +1070,8 @@ class Sync(EBSCommand):
         if self._store.estimator_exists(bug.data['assigned_to']):
             if self._store.task_exists(str(bug.id)):
                 self._update_task(bug)
+            elif self._store.task_archived(str(bug.id)):
+                print "SKIP   {} : task archived.".format(bug.id)
             else:
                 self._add_task(bug)
         else:
@@ -604,26 +1080,26 @@ class Sync(EBSCommand):
 
     def _add_task(self, bug):
         task = _task.Task(**dict(self._extract_task_data(bug)))
-        self._store.get_estimator(bug.data['assigned_to']).tasks.append(task)
+        self._store.add_task(bug.data['assigned_to'], task)
         print "ADD    {} : add task: {}".format(bug.id, bug.data['summary'])
 
     def _update_task(self, bug):
         old_estimator, task = self._store.get_task(str(bug.id))
         estimator = self._store.get_estimator(bug.data['assigned_to'])
-        if old_estimator != estimator:
+        if old_estimator is not estimator:
             # move task to new estimator
-            old_estimator.tasks.remove(task)
-            estimator.tasks.append(task)
+            self._store.move_task(task.id, estimator.name)
             print "MOVE   {} : reassigned from '{}' to '{}'.".format(
                 bug.id, old_estimator.name, estimator.name)
-        diff = False
+        changes = {}
         for k, v in self._extract_task_data(bug):
             oldv = getattr(task, k)
             if oldv != v:
-                diff = True
+                changes[k] = v
                 print "UPDATE {} : {}: {} -> {}".format(bug.id, k, oldv, v)
-                setattr(task, k, v)
-        if not diff:
+        if changes:
+            self._store.update_task(task.id, **changes)
+        else:
             print "NODIFF {} : task unchanged.".format(bug.id)
 
     def _extract_task_data(self, bug):
@@ -654,3 +1130,46 @@ commands = filter(
         and x not in [Command, EBSCommand],  # not abstract
     locals().viewvalues()
 )
+
+registry = {x.__name__.lower(): x for x in commands}
+registry['http'] = '.httpapi:Http'
+registry['serve'] = '.server:Serve'
+"""Commands keyed by name.
+
+Values are ``Command`` classes or, for commands defined in other
+modules, ``'module:Class'`` strings naming the class, whose modules
+are imported only when the command is used.
+"""
+
+
+def get_command(name):
+    """Return the ``Command`` class of the given name.
+
+    The module defining the command is imported if need be.  Raise
+    ``KeyError`` if there is no such command.
+    """
+    cls = registry[name]
+    if isinstance(cls, basestring):
+        module, attr = cls.split(':')
+        import importlib
+        cls = getattr(importlib.import_module(module, __package__), attr)
+        registry[name] = cls
+    return cls
+
+
+def build_parser(names, parents=(), epilog=None):
+    """Return an argument parser for the named commands.
+
+    Only the subparsers of the named commands are built, so that a
+    single command may be run without building the others.
+    """
+    parser = argparse.ArgumentParser(
+        parents=parents,
+        description='Perform evidence based scheduling.',
+        epilog=epilog,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    subparsers = parser.add_subparsers(title='subcommands')
+    for name in sorted(names):
+        get_command(name).add_parser(subparsers)
+    return parser
@@ -24,7 +24,7 @@ class ConfigError(Exception):
 
 
 def check_section(section):
-    if section in ['core', 'alias', 'sync'] \
+    if section in ['core', 'alias', 'store', 'sync'] \
             or re.match(r'server\.\w+', section):
         return section
     raise ConfigError('invalid section: {}'.format(section))
@@ -44,11 +44,36 @@ class Config(ConfigParser.SafeConfigParser):
         path = os.path.expanduser(path)
         ConfigParser.SafeConfigParser.__init__(self)
         self._path = path
+        self._stamp = self._file_stamp()
         self.read(self._path)
 
+    def _file_stamp(self):
+        """Return the modification time and size of the file."""
+        try:
+            st = os.stat(self._path)
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size
+
+    def refresh(self):
+        """Read the file again if it has changed since it was read.
+
+        Return whether it was read.  The values are replaced at once,
+        so that other threads see either the old or the new values.
+        """
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return False
+        fresh = ConfigParser.SafeConfigParser()
+        fresh.read(self._path)
+        self._defaults, self._sections = fresh._defaults, fresh._sections
+        self._stamp = stamp
+        return True
+
     def write(self):
         with open(self._path, 'w') as fp:
             ConfigParser.SafeConfigParser.write(self, fp)
+        self._stamp = self._file_stamp()
 
     def add_section(self, section):
         ConfigParser.SafeConfigParser.add_section(self, check_section(section))
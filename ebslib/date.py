@@ -18,6 +18,7 @@
 
 from __future__ import division
 
+import bisect
 import collections
 import datetime
 import math
@@ -41,7 +42,7 @@ def ship_date(
     ``hours``
       The hours of tasks remaining.
     ``events``
-      An optional sequence of events.
+      An optional sequence of events, or an ``EventTimeline``.
     ``hours_per_day``
       The number of hours in a day that can be devoted to
       completion of tasks and events.
@@ -49,7 +50,7 @@ def ship_date(
       The date from which the ship date will be calculated.  If not
       supplied, the current date will be used.
     ``holidays``
-      Optional collection of holidays; such days will not count as
+      Optional container of holidays; such days will not count as
       work days.
 
     Return a tuple of the calculated ship date and the hours remaining
@@ -62,7 +63,7 @@ def ship_date(
         raise TypeError("Argument 'hours_per_day' must be supplied.")
     if hours_per_day <= 0:
         raise ValueError("Argument 'hours_per_day' must be greater than zero.")
-    if not isinstance(events, collections.Sequence):
+    if not isinstance(events, (collections.Sequence, EventTimeline)):
         raise TypeError("Argument 'events' is not a Sequence.")
     hours = max(hours, 0)
     days = hours / hours_per_day
@@ -70,22 +71,61 @@ def ship_date(
         round((hours_per_day - (hours % hours_per_day)) % hours_per_day, 3)
     ship = apply_work_date_interval(work_days, start_date, days, holidays)
     if events:
+        if not isinstance(events, EventTimeline):
+            events = EventTimeline(events)
         return _add_events(
             start_date, ship, remaining, events, hours_per_day, holidays)
     return ship, remaining
 
 
+class EventTimeline(object):
+    """Events ordered by date, with cumulative costs.
+
+    The events are sorted once on construction; the total cost of the
+    events falling between two dates is then found by bisection
+    instead of by rescanning every event.  A timeline may be passed to
+    ``ship_date`` in place of a sequence of events, allowing it to be
+    reused across several ship date calculations.
+    """
+
+    __slots__ = frozenset(['_dates', '_costs'])
+
+    def __init__(self, events=()):
+        events = sorted(events, key=lambda e: e.date)
+        self._dates = [e.date for e in events]
+        self._costs = [0]
+        for e in events:
+            self._costs.append(self._costs[-1] + e.cost)
+
+    def __len__(self):
+        return len(self._dates)
+
+    def cost_between(self, start, end):
+        """Return the cost of events after ``start``, up to ``end``.
+
+        Events occuring on ``end`` are included; events occuring on
+        ``start`` are not.
+        """
+        lo = bisect.bisect_right(self._dates, start)
+        hi = max(lo, bisect.bisect_right(self._dates, end))
+        return self._costs[hi] - self._costs[lo]
+
+
 def _add_events(
     start, end,
     hours_remaining,
-    events, hpd,
+    timeline, hpd,
     holidays=()
 ):
     """Mix a events into an estimate.
 
     This method takes the start date from which the estimate is being
     made, the estimated completion date and the number of hours
-    remaining on that date, a sequence of events and the hours per day.
+    remaining on that date, a timeline of events and the hours per day.
+
+    The estimate is pushed forward by the cost of the events up to the
+    estimated date, then by the cost of the events that the new
+    estimated date overtakes, and so on until it no longer moves.
 
     ``start``
       Search for events starting from the given date.
@@ -93,38 +133,43 @@ def _add_events(
       Estimated date.  Used as upper bound for events.
     ``hours_remaining``
       Hours remaining on the estimated date.
-    ``events``
-      A Sequence of events.
+    ``timeline``
+      An ``EventTimeline``.
     ``hpd``
       The number of hours per day.
     ``holidays``
       Optional collection of holidays; such days will not count as
       work days.
     """
-    event_hours = sum(
-        e.cost for e in events
-        if e.date > start and e.date <= end
-    )
-    new_end, new_hours_remaining = ship_date(
-        hours=event_hours - hours_remaining,
-        hours_per_day=hpd,
-        start_date=end,
-        holidays=holidays
-    )
-    if new_end == end:
-        return end, new_hours_remaining
-    return _add_events(
-        end, new_end, new_hours_remaining, events, hpd, holidays)
+    while True:
+        event_hours = timeline.cost_between(start, end)
+        new_end, hours_remaining = ship_date(
+            hours=event_hours - hours_remaining,
+            hours_per_day=hpd,
+            start_date=end,
+            holidays=holidays
+        )
+        if new_end == end:
+            return end, hours_remaining
+        start, end = end, new_end
 
 
 def work_date_ceil(date, work_days=(), holidays=()):
-    """Return the next work date on or after the given date."""
-    # try for at most 7 days plus the number of holidays
-    for i in range(7 + len(holidays)):
+    """Return the next work date on or after the given date.
+
+    ``holidays`` may be any container of dates, including a
+    ``holiday.HolidayCalendar``.
+    """
+    # try for at most 7 days, searching a week past each holiday
+    i, limit = 0, 7
+    while i < limit:
         new_date = date + datetime.timedelta(days=i)
         weekday = new_date.weekday()
-        if weekday in work_days and new_date not in holidays:
-            return new_date
+        if weekday in work_days:
+            if new_date not in holidays:
+                return new_date
+            limit = i + 8
+        i += 1
     raise ValueError("Argument 'work_days' is invalid.")
 
 
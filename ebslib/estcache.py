@@ -0,0 +1,120 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cache of simulated futures, kept in a file beside the store.
+
+Simulation is the costly part of an estimate, and its result, the
+hours remaining in ten futures (see ``estimator.future_deciles``),
+depends only on the velocities and estimates simulated, the number of
+rounds and the random seed.  The cache keeps these hours, keyed by a
+digest of those inputs.  Ship dates, which also depend on the day,
+events and holidays, are cheaply computed from the hours and are not
+cached.
+
+The file, ``<store>.estimates``, holds a JSON list of ``[key, hours]``
+pairs, least recently used first.
+"""
+
+import collections
+import hashlib
+import json
+
+from . import store as _store
+
+
+_version = 1  # of the simulation; change to invalidate cached futures
+
+
+def cache_filename(store):
+    """Return the name of the cache file of the named store."""
+    return store + '.estimates'
+
+
+class EstimateCache(object):
+    """A cache of simulated futures, kept in the named file.
+
+    ``filename``
+      Name of the file, which is read when the cache is first used.
+    ``size``
+      The greatest number of entries kept, not a size in bytes; the
+      least recently used are evicted first.  An entry holds ten
+      numbers, and takes some 200 bytes of the file.
+
+    Using an entry makes it the most recently used, but the file is
+    written only when futures are cached: commands that only read the
+    cache do not write it.
+    """
+
+    __slots__ = frozenset(['filename', 'size', '_entries', '_dirty'])
+
+    def __init__(self, filename, size=1000):
+        self.filename = filename
+        self.size = size
+        self._entries = None
+        self._dirty = False
+
+    @staticmethod
+    def key(velocities, estimates, exponent, seed=None):
+        """Return the key of the futures of a simulation.
+
+        Arguments are those of ``estimator.future_deciles``.
+        """
+        return hashlib.md5(json.dumps(
+            [_version, list(velocities), list(estimates), exponent, seed]
+        )).hexdigest()
+
+    @property
+    def entries(self):
+        """The cached futures by key, least recently used first."""
+        if self._entries is None:
+            self._entries = collections.OrderedDict()
+            try:
+                with open(self.filename) as fp:
+                    self._entries.update(json.load(fp))
+            except (IOError, ValueError, TypeError):
+                pass  # no cache, or an unreadable one
+        return self._entries
+
+    def get(self, key):
+        """Return the futures of the given key, or ``None``."""
+        hours = self.entries.pop(key, None)
+        if hours is not None:
+            self._entries[key] = hours  # now the most recently used
+        return hours
+
+    def set(self, key, hours):
+        """Cache the futures of the given key."""
+        self.entries.pop(key, None)
+        self._entries[key] = hours
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    def save(self):
+        """Write the cache, if it has changed.
+
+        The cache is not kept if it cannot be written.
+        """
+        if not self._dirty:
+            return
+        try:
+            _store.atomic_write(
+                self.filename,
+                lambda fp: json.dump(self._entries.items(), fp)
+            )
+        except (IOError, OSError):
+            pass
+        self._dirty = False
@@ -16,47 +16,348 @@
 
 from __future__ import division
 
+import bisect
 import datetime
+import hashlib
+import json
 import math
 import random
 
 from . import task
+from . import tasktable
+
+
+_modulus = 1 << 128  # fingerprints are 128-bit MD5 digests
 
 
 class NoHistoryError(Exception):
     """The estimator has no useful estimation history."""
 
 
+class VelocityStats(object):
+    """Summary statistics of a collection of velocities.
+
+    The statistics are accumulated in a single pass over the
+    velocities; the mean and variance are maintained using Welford's
+    method.  The velocities themselves are kept in sorted order for
+    quantiles and for sampling.
+    """
+
+    __slots__ = frozenset(['count', 'min', 'max', 'mean', '_m2', 'values'])
+
+    def __init__(self, velocities=()):
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.values = []
+        for x in velocities:
+            self.count += 1
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (x - self.mean)
+            if self.min is None or x < self.min:
+                self.min = x
+            if self.max is None or x > self.max:
+                self.max = x
+            self.values.append(x)
+        self.values.sort()
+
+    @property
+    def variance(self):
+        """Return the (population) variance of the velocities."""
+        return self._m2 / self.count if self.count else 0.0
+
+    @property
+    def stddev(self):
+        """Return the (population) standard deviation of the velocities."""
+        return math.sqrt(self.variance)
+
+    def quantile(self, q):
+        """Return the ``q`` quantile (``0 <= q <= 1``) of the velocities.
+
+        Values between velocities are linearly interpolated.
+        """
+        if not self.values:
+            raise ValueError('No velocities.')
+        if not 0 <= q <= 1:
+            raise ValueError("Argument 'q' must be between 0 and 1.")
+        pos = q * (self.count - 1)
+        i = int(pos)
+        if i + 1 >= self.count:
+            return self.values[-1]
+        return self.values[i] + (pos - i) * (self.values[i + 1] - self.values[i])
+
+
+def _entry_key(entry):
+    """Return the sort key of a velocity summary entry.
+
+    Dates are given as ordinals, 0 if missing, since dates cannot be
+    compared with ``None``.
+    """
+    velocity, date, id = entry
+    return velocity, date.toordinal() if date else 0, id
+
+
+class VelocitySummary(object):
+    """A materialised summary of completed-task velocities.
+
+    The summary holds an ``(velocity, date, id)`` entry for each
+    completed task that has both an estimate and an actual cost,
+    sorted by velocity, together with the sum and the sum of squares
+    of the velocities.  It is maintained as tasks are added, removed
+    and updated, and is stored with the estimator so that velocities
+    can be read without walking the task history.
+
+    Entries of equal velocity are ordered by date, entries without a
+    date first, and then by ID.
+    """
+
+    __slots__ = frozenset(['entries', 'total', 'total_sq', '_keys'])
+
+    fields = ('entries', 'total', 'total_sq')
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data['entries'] = [tuple(x) for x in data.get('entries', [])]
+        return cls(**data)
+
+    @classmethod
+    def from_tasks(cls, tasks):
+        summary = cls()
+        summary.extend(tasks)
+        return summary
+
+    def __init__(self, entries=None, total=0, total_sq=0):
+        self.entries = entries or []
+        self.total = total
+        self.total_sq = total_sq
+        self._keys = map(_entry_key, self.entries)
+
+    @staticmethod
+    def _entry(t):
+        """Return the entry for the task, or None if it has none."""
+        if t.completed and t.estimate and t.actual:
+            return (t.estimate / t.actual, t.date, t.id)
+
+    def add(self, t):
+        """Add the velocity of the given task, if it has one."""
+        entry = self._entry(t)
+        if entry:
+            key = _entry_key(entry)
+            i = bisect.bisect_right(self._keys, key)
+            self._keys.insert(i, key)
+            self.entries.insert(i, entry)
+            self.total += entry[0]
+            self.total_sq += entry[0] ** 2
+
+    def extend(self, tasks):
+        """Add the velocities of the given tasks.
+
+        The new entries are sorted, and merged into the entries by
+        bisection, so that few entries are compared.
+        """
+        entries = sorted(
+            filter(None, (self._entry(t) for t in tasks)), key=_entry_key)
+        merged, keys = [], []
+        old, old_keys = self.entries, self._keys
+        lo = 0
+        for entry in entries:
+            key = _entry_key(entry)
+            i = bisect.bisect_right(old_keys, key, lo)
+            merged.extend(old[lo:i])
+            merged.append(entry)
+            keys.extend(old_keys[lo:i])
+            keys.append(key)
+            lo = i
+        merged.extend(old[lo:])
+        keys.extend(old_keys[lo:])
+        self.entries, self._keys = merged, keys
+        for entry in entries:
+            self.total += entry[0]
+            self.total_sq += entry[0] ** 2
+
+    def discard(self, t):
+        """Discard the velocity of the given task, if it has one."""
+        entry = self._entry(t)
+        if entry:
+            i = bisect.bisect_left(self._keys, _entry_key(entry))
+            if i < len(self.entries) and self.entries[i] == entry:
+                del self.entries[i]
+                del self._keys[i]
+                self.total -= entry[0]
+                self.total_sq -= entry[0] ** 2
+
+    @property
+    def count(self):
+        return len(self.entries)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def variance(self):
+        if not self.count:
+            return 0.0
+        return max(self.total_sq / self.count - self.mean ** 2, 0.0)
+
+    def velocities(self, max_age=None):
+        """Return the velocities, in increasing order.
+
+        ``max_age``
+          Optional ``datetime.timedelta`` to limit the velocities
+          to a maximum age.
+        """
+        if not max_age:
+            return [v for v, date, id in self.entries]
+        _today = datetime.date.today()
+        return [
+            v for v, date, id in self.entries
+            if not (date and _today - date > abs(max_age))
+        ]
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.entries == other.entries
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return '{}(count={})'.format(type(self).__name__, self.count)
+
+
 class Estimator(object):
-    """An estimator."""
+    """An estimator.
+
+    Tasks should be added, removed and updated using ``add_task``,
+    ``remove_task`` and ``update_task``, which keep the velocity
+    summary up to date.
 
-    __slots__ = frozenset(['name', 'tasks', 'events'])
+    The tasks are held in a ``TaskTable``.  ``Task`` objects given
+    in a list are kept as the items of their rows.
+    """
+
+    __slots__ = frozenset(['name', 'tasks', 'events', 'summary', '_digest'])
+
+    fields = ('name', 'tasks', 'events', 'summary')
+    """The attributes of an estimator, in the order of ``__init__``."""
 
     @classmethod
     def from_dict(cls, data):
         data = dict(data)
         if 'tasks' in data:
-            data['tasks'] = [task.Task.from_dict(x) for x in data['tasks']]
+            data['tasks'] = tasktable.TaskTable(
+                task.Task.from_dict(x) for x in data['tasks'])
         if 'events' in data:
             data['events'] = [task.Event.from_dict(x) for x in data['events']]
+        if 'summary' in data:
+            data['summary'] = VelocitySummary.from_dict(data['summary'])
         return cls(**data)
 
-    def __init__(self, name=None, tasks=None, events=None):
-        tasks = tasks or []
+    def __init__(self, name=None, tasks=None, events=None, summary=None):
+        if tasks is None:
+            tasks = tasktable.TaskTable()
+        elif not isinstance(tasks, tasktable.TaskTable):
+            tasks = tasktable.TaskTable.adopt(tasks)
         events = events or []
         if not name:
             raise TypeError("Argument 'name' not supplied.")
         self.name = name
         self.tasks = tasks
         self.events = events
+        self.summary = summary if summary is not None \
+            else VelocitySummary.from_tasks(tasks)
+        self._digest = None
+
+    @property
+    def fingerprint(self):
+        """Return a digest of the estimator's name, events and tasks.
+
+        The digest of the tasks is computed when first used, and then
+        maintained by ``add_task``, ``remove_task`` and
+        ``update_task``, so that it costs O(1) thereafter.  It does not
+        depend on the order of the tasks.  Estimators with different
+        fingerprints are not equal.
+        """
+        if self._digest is None:
+            self._digest = sum(t.fingerprint for t in self.tasks) % _modulus
+        events = json.dumps([
+            [e.date.toordinal(), float(e.cost or 0), e.description]
+            for e in self.events
+        ])
+        return int(hashlib.md5(json.dumps(
+            [self.name, events, self._digest])).hexdigest(), 16)
+
+    def _add_digest(self, t, sign=1):
+        if self._digest is not None:
+            self._digest = (self._digest + sign * t.fingerprint) % _modulus
+
+    def add_task(self, t):
+        """Add a task.
+
+        Return the task as held by the estimator, which is the task
+        given unless it is a row of another ``TaskTable``.
+        """
+        self.tasks.append(t)
+        self.summary.add(t)
+        self._add_digest(t)
+        return self.tasks[-1]
+
+    def add_tasks(self, tasks):
+        """Add many tasks.
+
+        Return the tasks as held by the estimator.  The tasks are
+        copied into new rows, and are not kept; those of a
+        ``TaskTable`` are copied column by column.
+        """
+        held = self.tasks.add_rows(tasks)
+        self.summary.extend(held)
+        if self._digest is not None:
+            for t in held:
+                self._add_digest(t)
+        return held
+
+    def remove_task(self, t):
+        """Remove a task."""
+        self.tasks.remove(t)
+        self.summary.discard(t)
+        self._add_digest(t, -1)
+
+    def update_task(self, t, **kwargs):
+        """Update attributes of a task."""
+        self.summary.discard(t)
+        self._add_digest(t, -1)
+        self.tasks.update(t, **kwargs)
+        self.summary.add(t)
+        self._add_digest(t)
+
+    def archive_tasks(self, before):
+        """Remove completed tasks estimated before the given date.
+
+        The velocities of the removed tasks remain in the velocity
+        summary.  Return the removed tasks as ``ArchivedTask`` objects.
+        """
+        hot, archived = [], []
+        for t in self.tasks:
+            if t.completed and t.date and t.date < before:
+                archived.append(task.ArchivedTask.from_task(t))
+                self._add_digest(t, -1)
+            else:
+                hot.append(t)
+        if archived:
+            self.tasks[:] = hot
+        return archived
 
     def completed_tasks(self):
         """Generate completed tasks."""
-        return (t for t in self.tasks if t.completed)
+        return self.tasks.select(completed=True)
 
     def pending_tasks(self):
         """Generate incomplete tasks."""
-        return (t for t in self.tasks if not t.completed)
+        return self.tasks.select(completed=False)
 
     def velocities(self, max_age=None):
         """Return the estimator's velocities.
@@ -65,40 +366,52 @@ class Estimator(object):
           Optional ``datetime.timedelta`` to limit the velocities
           to a maximum age.
 
-        Return a sequence of velocities.
+        Return a sequence of velocities, in increasing order.
+        Velocities are read from the velocity summary.
         """
-        _today = datetime.date.today()
-        return [
-            t.estimate / t.actual
-            for t in self.completed_tasks()
-            if not (max_age and t.date and _today - t.date > abs(max_age))
-                and t.estimate  # exclude tasks with no estimate
-                and t.actual    # exclude tasks with no actual
-        ]
+        return self.summary.velocities(max_age)
 
-    def _fn_velocity(self, f, **kwargs):
-        try:
-            return f(self.velocities(**kwargs))
-        except:
+    def velocity_stats(self, **kwargs):
+        """Return the ``VelocityStats`` of the estimator's velocities.
+
+        Keyword arguments are passed to ``velocities()``.  Raise
+        ``NoHistoryError`` if there are no velocities.
+        """
+        stats = VelocityStats(self.velocities(**kwargs))
+        if not stats.count:
             raise NoHistoryError(
                 "Estimator '{}' has no useful estimation history."
                 .format(self.name)
             )
+        return stats
 
     def min_velocity(self, **kwargs):
-        return self._fn_velocity(min, **kwargs)
+        return self.velocity_stats(**kwargs).min
 
     def max_velocity(self, **kwargs):
-        return self._fn_velocity(max, **kwargs)
+        return self.velocity_stats(**kwargs).max
 
     def mean_velocity(self, **kwargs):
-        return self._fn_velocity(lambda x: sum(x) / len(x), **kwargs)
+        return self.velocity_stats(**kwargs).mean
 
     def stddev_velocity(self, **kwargs):
-        velocities = self.velocities(**kwargs)
-        N = len(velocities)
-        mu = self.mean_velocity()
-        return math.sqrt(sum((x - mu) ** 2 for x in velocities) / N)
+        return self.velocity_stats(**kwargs).stddev
+
+    def _simulation_estimates(self, project=None, priority=None):
+        """Return the estimates of the pending tasks to be simulated."""
+        return self.tasks.column(
+            'estimate', completed=False,
+            project=project or None, priority=priority
+        )
+
+    def _simulate(self, velocities, estimates):
+        try:
+            return [x / random.choice(velocities) for x in estimates]
+        except IndexError:
+            raise NoHistoryError(
+                "Estimator '{}' has no useful estimation history."
+                .format(self.name)
+            )
 
     def simulate_future(self, project=None, max_age=None, priority=None):
         """Simulate the future once.
@@ -114,24 +427,35 @@ class Estimator(object):
           Optional priority threshold; uncompleted tasks of a lower
           priority will be omitted from the simulation.
         """
-        velocities = self.velocities(max_age)
-        try:
-            return [
-                t.estimate / random.choice(velocities)
-                for t in self.pending_tasks()
-                if not (priority and t.priority and t.priority > priority)
-                    and (not project or t.project == project)
-            ]
-        except IndexError:
-            raise NoHistoryError(
-                "Estimator '{}' has no useful estimation history."
-                .format(self.name)
-            )
+        return self._simulate(
+            VelocityStats(self.velocities(max_age)).values,
+            self._simulation_estimates(project, priority)
+        )
+
+    def simulate_futures(self, project=None, max_age=None, priority=None):
+        """Generate simulated outcomes.
 
-    def simulate_futures(self, **kwargs):
-        """Generate simulated outcomes."""
+        Velocities and pending tasks are gathered once, when the first
+        outcome is generated, and reused for every outcome.
+        """
+        velocities = VelocityStats(self.velocities(max_age)).values
+        estimates = self._simulation_estimates(project, priority)
         while True:
-            yield self.simulate_future(**kwargs)
+            yield self._simulate(velocities, estimates)
+
+    def simulation_inputs(self, project=None, max_age=None, priority=None):
+        """Return the velocities and estimates to be simulated.
+
+        These are the arguments, with the number of rounds, of
+        ``future_deciles``.  Arguments are as for ``simulate_future``.
+        Raise ``NoHistoryError`` if there are estimates to simulate
+        but no velocities.
+        """
+        velocities = VelocityStats(self.velocities(max_age)).values
+        estimates = self._simulation_estimates(project, priority)
+        if estimates and not velocities:
+            self._simulate(velocities, estimates)  # raises NoHistoryError
+        return velocities, estimates
 
     def get_events(self, start=None, stop=None):
         """Generate the estimators events, optionally filtered by date.
@@ -146,9 +470,11 @@ class Estimator(object):
         )
 
     def __eq__(self, other):
+        if self is other:
+            return True
         return type(self) == type(other) and all(
             getattr(self, attr) == getattr(other, attr)
-            for attr in self.__slots__
+            for attr in self.fields
         )
 
     def __ne__(self, other):
@@ -159,6 +485,26 @@ class Estimator(object):
             type(self),
             ', '.join(
                 '{}={!r}'.format(attr, getattr(self, attr))
-                for attr in self.__slots__
+                for attr in self.fields
             )
         )
+
+
+def future_deciles(velocities, estimates, exponent, seed=None):
+    """Simulate 10^exponent futures; return the hours remaining in ten.
+
+    The estimates are divided by velocities chosen at random, as by
+    ``Estimator.simulate_future``, and summed.  Return the sums at an
+    interval of 10% of the futures, in increasing order.  The result
+    depends only on the arguments, so that it may be computed in
+    another process, and if ``seed`` is given it is always the same.
+    """
+    rounds = 10 ** exponent
+    step = rounds // 10
+    choice = random.Random(seed).choice if seed is not None \
+        else random.choice
+    sums = sorted(
+        sum([x / choice(velocities) for x in estimates])
+        for i in xrange(rounds)
+    )
+    return sums[step - 1::step]
@@ -0,0 +1,250 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Holidays and recurring holiday rules.
+
+Rules are written as short specifications, which is also how they
+are stored:
+
+``annual:MM-DD``
+  The same date every year, e.g. ``annual:12-25``.
+``nth:N:DAY:MM``
+  The Nth given weekday of a month, e.g. ``nth:4:thu:11``.  N may be
+  ``-1`` for the last such weekday in the month.
+``easter:OFFSET``
+  A day relative to Easter Sunday, e.g. ``easter:-2`` for Good Friday.
+"""
+
+import abc
+import bisect
+import collections
+import datetime
+
+
+_weekdays = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+
+class HolidayIndex(collections.MutableSet):
+    """A set of holiday dates, kept in date order.
+
+    Membership tests are hashed; iteration is in date order.
+    """
+
+    def __init__(self, dates=()):
+        self._set = set(dates)
+        self._sorted = sorted(self._set)
+
+    def __contains__(self, date):
+        return date in self._set
+
+    def __iter__(self):
+        return iter(self._sorted)
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def add(self, date):
+        if date not in self._set:
+            self._set.add(date)
+            bisect.insort(self._sorted, date)
+
+    def discard(self, date):
+        if date in self._set:
+            self._set.remove(date)
+            del self._sorted[bisect.bisect_left(self._sorted, date)]
+
+    def between(self, start, stop):
+        """Return holidays on or after ``start`` and before ``stop``."""
+        lo = bisect.bisect_left(self._sorted, start)
+        hi = bisect.bisect_left(self._sorted, stop)
+        return self._sorted[lo:hi]
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self._sorted)
+
+
+class Rule(object):
+    """A recurring holiday.
+
+    Rules compare equal when their specifications are equal.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    __slots__ = frozenset()
+
+    @abc.abstractmethod
+    def dates(self, year):
+        """Return the dates on which the rule falls in the given year."""
+
+    def __eq__(self, other):
+        return isinstance(other, Rule) and str(self) == str(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __repr__(self):
+        return 'parse_rule({!r})'.format(str(self))
+
+
+class AnnualRule(Rule):
+    """A holiday on the same date every year."""
+
+    __slots__ = frozenset(['month', 'day'])
+
+    def __init__(self, month, day):
+        datetime.date(2012, month, day)  # validate (2012 is a leap year)
+        self.month = month
+        self.day = day
+
+    def dates(self, year):
+        try:
+            return [datetime.date(year, self.month, self.day)]
+        except ValueError:
+            return []  # 29 February in a common year
+
+    def __str__(self):
+        return 'annual:{:02}-{:02}'.format(self.month, self.day)
+
+
+class NthWeekdayRule(Rule):
+    """A holiday on the Nth weekday of a month.
+
+    ``n`` counts from 1; ``-1`` denotes the last such weekday.
+    """
+
+    __slots__ = frozenset(['n', 'weekday', 'month'])
+
+    def __init__(self, n, weekday, month):
+        if n not in (-1, 1, 2, 3, 4, 5):
+            raise ValueError('invalid week number: {}'.format(n))
+        if weekday not in range(7):
+            raise ValueError('invalid weekday: {}'.format(weekday))
+        if month not in range(1, 13):
+            raise ValueError('invalid month: {}'.format(month))
+        self.n = n
+        self.weekday = weekday
+        self.month = month
+
+    def dates(self, year):
+        if self.n > 0:
+            first = datetime.date(year, self.month, 1)
+            offset = (self.weekday - first.weekday()) % 7 + 7 * (self.n - 1)
+            date = first + datetime.timedelta(days=offset)
+        else:
+            if self.month == 12:
+                last = datetime.date(year, 12, 31)
+            else:
+                last = datetime.date(year, self.month + 1, 1) \
+                    - datetime.timedelta(days=1)
+            offset = (last.weekday() - self.weekday) % 7
+            date = last - datetime.timedelta(days=offset)
+        return [date] if date.month == self.month else []
+
+    def __str__(self):
+        return 'nth:{}:{}:{:02}'.format(
+            self.n, _weekdays[self.weekday], self.month)
+
+
+class EasterRule(Rule):
+    """A holiday a fixed number of days from (Western) Easter Sunday."""
+
+    __slots__ = frozenset(['offset'])
+
+    def __init__(self, offset=0):
+        self.offset = offset
+
+    def dates(self, year):
+        return [easter(year) + datetime.timedelta(days=self.offset)]
+
+    def __str__(self):
+        return 'easter:{:+}'.format(self.offset)
+
+
+def easter(year):
+    """Return the date of (Western) Easter Sunday in the given year."""
+    # anonymous Gregorian algorithm
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def parse_rule(spec):
+    """Parse a rule specification.
+
+    Raise ``ValueError`` if the specification is invalid.
+    """
+    kind, _, args = spec.strip().lower().partition(':')
+    try:
+        if kind == 'annual':
+            month, day = args.split('-')
+            return AnnualRule(int(month), int(day))
+        if kind == 'nth':
+            n, weekday, month = args.split(':')
+            if weekday in _weekdays:
+                weekday = _weekdays.index(weekday)
+            return NthWeekdayRule(int(n), int(weekday), int(month))
+        if kind == 'easter':
+            return EasterRule(int(args or 0))
+    except (TypeError, ValueError):
+        pass
+    raise ValueError('invalid holiday rule: {}'.format(spec))
+
+
+class HolidayCalendar(object):
+    """Explicit holidays together with recurring rules.
+
+    Rules are expanded a year at a time, only for the years that are
+    actually queried.  Explicit holidays are kept in a ``HolidayIndex``;
+    other collections are copied into one.
+    """
+
+    __slots__ = frozenset(['_holidays', '_rules', '_years'])
+
+    def __init__(self, holidays=(), rules=()):
+        if not isinstance(holidays, HolidayIndex):
+            holidays = HolidayIndex(holidays)
+        self._holidays = holidays
+        self._rules = list(rules)
+        self._years = {}
+
+    def _year(self, year):
+        if year not in self._years:
+            self._years[year] = frozenset(
+                date for rule in self._rules for date in rule.dates(year))
+        return self._years[year]
+
+    def __contains__(self, date):
+        return date in self._holidays \
+            or bool(self._rules) and date in self._year(date.year)
+
+    def between(self, start, stop):
+        """Return a sorted list of holidays in ``[start, stop)``."""
+        dates = set(self._holidays.between(start, stop))
+        for year in range(start.year, stop.year + 1):
+            dates.update(d for d in self._year(year) if start <= d < stop)
+        return sorted(dates)
@@ -0,0 +1,483 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""HTTP server of a store, answering in JSON.
+
+The resources are:
+
+  GET /estimate       the results of estimate
+  GET /stats          the results of stats
+  GET /tasks          the results of lstask, as rows (see ``bulk``)
+  GET /events         the results of lsevent, as rows
+  POST /tasks         add the tasks of a row, or of a list of rows
+  POST /events        add events, likewise
+  POST /holidays      add holidays, likewise
+  DELETE /tasks/ID    remove a task
+
+The parameters of a GET are the options of its command, without the
+leading dashes; parameters without a value are flags.  For example,
+``/tasks?estimator=Bob&incomplete`` lists the incomplete tasks of
+Bob.  Errors are answered with an object giving the ``error``.
+
+Requests are answered by threads of their own.  Requests that only
+read the store run concurrently, and those that modify it run one at
+a time.  Simulations of estimates run in a pool of worker processes,
+without the store being locked, and are cached as for the estimate
+command; results of estimates are kept until the store changes.
+"""
+
+import argparse
+import BaseHTTPServer
+import collections
+import datetime
+import json
+import multiprocessing
+import signal
+import SocketServer
+import sys
+import threading
+import urllib
+import urlparse
+
+from . import bulk
+from . import command
+from . import estimator as _estimator
+from . import holiday
+from . import server as _server
+from . import store as _store
+
+
+class HTTPError(Exception):
+    """An error answered with the given HTTP status."""
+
+    def __init__(self, status, message):
+        super(HTTPError, self).__init__(message)
+        self.status = status
+
+
+class _ArgumentParser(argparse.ArgumentParser):
+    def error(self, message):
+        raise HTTPError(400, message)
+
+
+class Estimate(command.Estimate):
+    """An estimate simulating futures in a pool of processes.
+
+    ``_submit`` reads all it needs from the store, with the store
+    locked, and starts the simulations.  ``_result`` then waits for
+    them, and computes ship dates, without reading the store.
+    """
+
+    def _submit(self, pool):
+        self._setup()
+        self._holidays = holiday.HolidayCalendar(
+            holiday.HolidayIndex(self._store.holidays),
+            self._store.holiday_rules
+        )
+        self._estimated = []
+        self._jobs = {}
+        self._unsimulated = {}
+        for e in self._estimators():
+            self._estimated.append((e, self._event_timeline(e)))
+            try:
+                for project in self.projects:
+                    args = self._simulation_inputs(e, project) \
+                        + (self.exp, self._args.seed)
+                    key = self._cache.key(*args)
+                    hours = None if self._args.no_cache \
+                        else self._cache.get(key)
+                    if hours is None:
+                        hours = pool.apply_async(
+                            _estimator.future_deciles, args)
+                    self._jobs[e.name, project] = key, hours
+            except _estimator.NoHistoryError as exc:
+                hours, date = self._unsimulated_estimate(e)
+                self._unsimulated[e.name] = {
+                    'error': exc.message, 'hours': hours,
+                    'date': date.isoformat(),
+                }
+
+    def _futures(self, estimator, project):
+        key, hours = self._jobs[estimator.name, project]
+        if isinstance(hours, list):
+            return hours
+        hours = hours.get()
+        self._cache.set(key, hours)
+        return hours
+
+    def _result(self):
+        estimators = []
+        for e, events in self._estimated:
+            estimate = {'name': e.name}
+            if e.name in self._unsimulated:
+                estimate.update(self._unsimulated[e.name])
+            else:
+                # _futures uses only the name of the estimator
+                estimate['projects'] = [
+                    {'project': project, 'futures': [
+                        {'percent': percent, 'hours': hours,
+                            'date': date.isoformat()}
+                        for percent, hours, date in futures
+                    ]}
+                    for project, futures in
+                        self._project_estimates(e, events)
+                ]
+            estimators.append(estimate)
+        self._cache.save()
+        return {'estimators': estimators}
+
+
+def _stats(cmd):
+    max_age = datetime.timedelta(days=cmd._args.max_velocity_age) \
+        if cmd._args.max_velocity_age is not None else None
+    estimators = []
+    for e in cmd._store.estimators:
+        try:
+            stats = e.velocity_stats(max_age=max_age)
+        except _estimator.NoHistoryError as exc:
+            estimators.append({'name': e.name, 'error': exc.message})
+            continue
+        estimators.append({
+            'name': e.name, 'count': stats.count, 'min': stats.min,
+            'max': stats.max, 'mean': stats.mean, 'stddev': stats.stddev,
+            'quantiles': {
+                str(q): stats.quantile(q) for q in command.Stats._quantiles},
+        })
+    return {'estimators': estimators}
+
+
+def _tasks(cmd):
+    return {'tasks': [bulk.task_row(e.name, t) for e, t in cmd._tasks()]}
+
+
+def _events(cmd):
+    return {'events': [
+        bulk.event_row(e.name, x)
+        for e in cmd._store.estimators for x in cmd._events(e)
+    ]}
+
+
+_queries = {
+    'stats': (command.Stats, _stats),
+    'tasks': (command.LsTask, _tasks),
+    'events': (command.LsEvent, _events),
+}
+"""The commands and results of GET requests, keyed by resource."""
+
+
+def _add_rows(store, kind, rows):
+    """Add rows of the given kind to the store; return how many.
+
+    Rows may give their kind, which must be the given kind.  Raise
+    ``UserWarning`` if any row is invalid; the store should then be
+    discarded.
+    """
+    if not isinstance(rows, list):
+        rows = [rows]
+    for i, row in enumerate(rows):
+        try:
+            row_kind, values = bulk.parse_row(row, kind)
+            if row_kind != kind:
+                raise ValueError('not a {}: {}'.format(kind, row_kind))
+            if kind == 'task':
+                store.add_task(values['estimator'], bulk.make_task(values))
+            elif kind == 'event':
+                hpd = float(command.conf.get('core', 'hours_per_day'))
+                if values['cost'] > hpd:
+                    raise ValueError(
+                        'event cannot have cost greater than one day')
+                store.add_event(
+                    values['estimator'], bulk.make_event(values))
+            elif 'date' in values:
+                store.add_holiday(values['date'])
+            else:
+                store.add_holiday_rule(values['rule'])
+        except (ValueError, UserWarning) as e:
+            raise UserWarning(u'row {}: {}'.format(i + 1, unicode(e)))
+    return len(rows)
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def _reply(self, status, body):
+        data = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method):
+        url = urlparse.urlsplit(self.path)
+        path = [urllib.unquote(x) for x in url.path.split('/') if x]
+        try:
+            self._check_host()
+            if method == 'GET':
+                if len(path) != 1:
+                    raise HTTPError(404, 'Not found: {}'.format(url.path))
+                query = [
+                    (k.decode('utf-8'), v.decode('utf-8')) for k, v in
+                    urlparse.parse_qsl(url.query, keep_blank_values=True)
+                ]
+                status, body = 200, self.server.query(path[0], query)
+            elif method == 'POST':
+                # forms of other sites may post text, but not JSON
+                content_type = self.headers.get('Content-Type', '')
+                if content_type.split(';')[0].strip().lower() \
+                        != 'application/json':
+                    raise HTTPError(415, 'Request must be application/json.')
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    rows = json.loads(self.rfile.read(length))
+                except ValueError:
+                    raise HTTPError(400, 'Request is not JSON.')
+                status, body = 201, self.server.add(path, rows)
+            else:
+                status, body = 200, self.server.remove(path)
+        except HTTPError as e:
+            status, body = e.status, {'error': unicode(e)}
+        except UserWarning as e:
+            status, body = 400, {'error': unicode(e)}
+        except Exception as e:
+            status, body = 500, {'error': unicode(e)}
+        self._reply(status, body)
+
+    def _check_host(self):
+        """Refuse requests for other hosts, as made by DNS rebinding."""
+        host = self.headers.get('Host')
+        if host is None:
+            return
+        if host.startswith('['):
+            host = host[1:].split(']')[0]
+        else:
+            host = host.split(':')[0]
+        if host.lower() not in self.server.hosts:
+            raise HTTPError(400, 'Unknown host: {}'.format(host))
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(
+                self, format, *args)
+
+
+class HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """An HTTP server of a store.
+
+    ``address``
+      The ``(host, port)`` to listen on.
+    ``store``
+      The ``Store`` to serve.
+    ``pool``
+      The ``multiprocessing.Pool`` running simulations.
+    ``cache_size``
+      The number of estimates kept.
+
+    Requests must name the host of ``address``, or the local host, and
+    POST requests must be of JSON, so that other sites visited in a
+    browser cannot use the server.
+    """
+
+    daemon_threads = True
+    quiet = False
+
+    def __init__(self, address, store, pool, cache_size=64):
+        BaseHTTPServer.HTTPServer.__init__(self, address, _Handler)
+        self.hosts = set(['localhost', '127.0.0.1', '::1', address[0].lower()])
+        self.store = store
+        self.pool = pool
+        self.lock = _server.ReadWriteLock()
+        self.cache_size = cache_size
+        self._estimates = collections.OrderedDict()
+        self._generation = 0  # changed whenever the store changes
+        self._cache_lock = threading.Lock()
+
+    def _command(self, cls, query):
+        """Return a command, with the given query as its arguments."""
+        parser = _ArgumentParser()
+        cls.add_parser(parser.add_subparsers())
+        argv = [cls.__name__.lower()]
+        for key, value in query:
+            argv.append('--' + key.replace('_', '-'))
+            if value:
+                argv.append(value)
+        cmd = cls(parser.parse_args(argv), parser, command.registry, {})
+        cmd._store = self.store
+        return cmd
+
+    def refresh(self):
+        """Read the store again if a new version has been committed.
+
+        The configuration is read again if it has changed; estimates,
+        which depend on it, are then computed afresh.
+        """
+        if command.conf.refresh():
+            with self.lock.write():
+                self._generation += 1
+        if self.store.changed_on_disk():
+            with self.lock.write():
+                if self.store.refresh():
+                    self._generation += 1
+                    _server.load(self.store)
+
+    def query(self, resource, query):
+        """Return the result of the command of a resource."""
+        self.refresh()
+        if resource == 'estimate':
+            return self.estimate(query)
+        if resource not in _queries:
+            raise HTTPError(404, 'Not found: /{}'.format(resource))
+        cls, result = _queries[resource]
+        cmd = self._command(cls, query)
+        with self.lock.read():
+            return result(cmd)
+
+    def estimate(self, query):
+        """Return the result of estimate, from the cache if possible.
+
+        The generation of the store is read with the store locked, as
+        the store is read by ``_submit``, so that results are cached
+        under the generation of the store they were computed from.
+        """
+        cmd = self._command(Estimate, query)
+        with self.lock.read():
+            key = (
+                self._generation, datetime.date.today(),
+                tuple(sorted(query)))
+            with self._cache_lock:
+                if key in self._estimates:
+                    return self._estimates[key]
+            cmd._submit(self.pool)
+        result = cmd._result()
+        self._cache_estimate(key, result)
+        return result
+
+    def _cache_estimate(self, key, result):
+        """Cache the result of estimate under the given key.
+
+        Results of earlier generations, or of earlier days, are evicted
+        first, and the result is not cached if it is one of them.
+        """
+        with self._cache_lock:
+            current = self._generation, datetime.date.today()
+            for old in self._estimates.keys():
+                if old[:2] != current:
+                    del self._estimates[old]
+            if key[:2] == current:
+                self._estimates[key] = result
+            while len(self._estimates) > self.cache_size:
+                self._estimates.popitem(last=False)
+
+    def _modify(self, f, *args):
+        """Call ``f(store, *args)`` with the store locked, and write it."""
+        self.refresh()
+        with self.lock.write():
+            with self.store:
+                try:
+                    result = f(self.store, *args)
+                except:
+                    self.store.discard()
+                    _server.load(self.store)
+                    raise
+                finally:
+                    self._generation += 1
+        return result
+
+    def add(self, path, rows):
+        """Add the rows of a resource to the store."""
+        kinds = {'tasks': 'task', 'events': 'event', 'holidays': 'holiday'}
+        if len(path) != 1 or path[0] not in kinds:
+            raise HTTPError(405, 'Cannot add to: /{}'.format('/'.join(path)))
+        return {'added': self._modify(_add_rows, kinds[path[0]], rows)}
+
+    def remove(self, path):
+        """Remove the task of a resource from the store."""
+        if len(path) != 2 or path[0] != 'tasks':
+            raise HTTPError(405, 'Cannot remove: /{}'.format('/'.join(path)))
+        id = path[1].decode('utf-8')
+
+        def remove_task(store):
+            if not store.task_exists(id):
+                raise HTTPError(404, 'Task not found: {}'.format(id))
+            store.remove_task(id)
+
+        self._modify(remove_task)
+        return {'removed': id}
+
+
+def _init_worker():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def http_serve(store, address, workers=None, quiet=False):
+    """Serve the store over HTTP until interrupted or terminated."""
+    pool = multiprocessing.Pool(workers, _init_worker)
+    try:
+        _server.load(store)
+        httpd = HTTPServer(address, store, pool)
+        httpd.quiet = quiet
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            httpd.server_close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class Http(command.EBSCommand):
+    """Serve estimates, stats, tasks and events over HTTP as JSON.
+
+    GET /estimate, /stats, /tasks and /events answer as the commands
+    of those names, taking their options as parameters; for example,
+    /tasks?estimator=Bob&incomplete.  POST /tasks, /events and
+    /holidays add the rows (as for import) given as JSON, and
+    DELETE /tasks/ID removes a task.
+
+    Simulations run in worker processes, and their results are kept
+    until the store changes.  SQLite stores cannot be served.
+    """
+
+    forward = False
+    args = command.EBSCommand.args + [
+        lambda x: x.add_argument('--host', default='localhost',
+            help='address to listen on (default: localhost)'),
+        lambda x: x.add_argument('--port', type=int, default=8000,
+            help='port to listen on (default: 8000)'),
+        lambda x: x.add_argument('--workers', metavar='N', type=int,
+            help='number of simulation processes (default: one per CPU)'),
+        lambda x: x.add_argument('--quiet', action='store_true',
+            help='do not log requests'),
+    ]
+
+    def __call__(self):
+        store = _store.open_store(
+            self._args.store, **command.store_options())
+        if not isinstance(store, _store.Store):
+            raise UserWarning('Store cannot be served: {}'.format(
+                self._args.store))
+        http_serve(store, (self._args.host, self._args.port),
+            workers=self._args.workers, quiet=self._args.quiet)
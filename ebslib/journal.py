@@ -0,0 +1,224 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Journaled JSON store.
+
+A journaled store keeps a snapshot (an ordinary JSON store file) and
+a journal alongside it (the same path with a ``.journal`` suffix).
+Each modification of the store is appended to the journal as a
+single line, so the cost of writing does not depend on the size of
+the store.  The store is read by loading the snapshot and replaying
+the journal.
+
+When the journal grows past a limit, it is compacted: the snapshot is
+rewritten to include every modification and the journal is emptied.
+Snapshot and journal carry a generation number, incremented by each
+compaction, so that a journal is only ever replayed on top of the
+snapshot it belongs to.
+"""
+
+import functools
+import json
+import os
+
+from . import estimator
+from . import holiday
+from . import store
+from . import task
+
+
+DEFAULT_LIMIT = 1 << 20
+"""Journal size, in bytes, beyond which the journal is compacted."""
+
+_ops = (
+    'add_estimator', 'remove_estimator', 'add_event',
+    'add_task', 'add_tasks', 'remove_task', 'move_task', 'update_task',
+    'add_holiday', 'remove_holiday', 'add_holiday_rule', 'remove_holiday_rule',
+)
+
+# decoders for arguments that are not plain JSON values
+_decoders = {
+    'add_estimator': lambda e: [estimator.Estimator.from_dict(e)],
+    'add_event': lambda name, e: [name, task.Event.from_dict(e)],
+    'add_task': lambda name, t: [name, task.Task.from_dict(t)],
+    'add_tasks':
+        lambda name, ts: [name, [task.Task.from_dict(t) for t in ts]],
+    'add_holiday_rule': lambda r: [holiday.parse_rule(r)],
+    'remove_holiday_rule': lambda r: [holiday.parse_rule(r)],
+}
+
+
+def encode_record(op, args, kwargs):
+    """Encode a modification as a journal line."""
+    return json.dumps([op, args, kwargs], default=store._serialise) + '\n'
+
+
+def decode_record(line):
+    """Decode a journal line into ``(op, args, kwargs)``."""
+    op, args, kwargs = json.loads(line, object_hook=store._object_hook)
+    if op not in _ops:
+        raise ValueError('Unknown journal operation: {}'.format(op))
+    if op in _decoders:
+        args = _decoders[op](*args)
+    return op, args, {str(k): v for k, v in kwargs.viewitems()}
+
+
+class JournalStore(store.Store):
+    """A JSON store that appends modifications to a journal.
+
+    ``limit``
+      Journal size in bytes beyond which the journal is compacted
+      into the snapshot when the store is flushed.
+
+    Other keyword arguments are as for ``Store``; a compressed
+    snapshot is compressed at ``compression_level``, but the journal
+    itself is never compressed.
+    """
+
+    __slots__ = ('_pending', '_generation', '_limit')
+
+    def __init__(self, filename, limit=DEFAULT_LIMIT, **kwargs):
+        super(JournalStore, self).__init__(filename, **kwargs)
+        self._pending = []
+        self._generation = 0
+        self._limit = limit
+
+    @property
+    def journal_filename(self):
+        return self._filename + '.journal'
+
+    def _read_journal(self, records=True):
+        """Read the journal.
+
+        Return the generation of the journal (``None`` if there is no
+        journal) and a list of its complete records.  If ``records``
+        is false, read only the generation.
+        """
+        try:
+            with open(self.journal_filename) as fp:
+                header = fp.readline()
+                lines = [line for line in fp if line.endswith('\n')] \
+                    if records else []
+        except IOError:
+            return None, []
+        try:
+            return json.loads(header)['generation'], lines
+        except (ValueError, KeyError, TypeError):
+            return None, []
+
+    def _load(self):
+        for attempt in range(10):
+            self._version = self._disk_version()
+            self._compression = store.detect_compression(self._filename)
+            try:
+                data = store.read_file(self._filename, self._compression)
+            except (IOError, ValueError):
+                data = {}
+            generation = data.pop('journal', 0)
+            journal_generation, lines = self._read_journal()
+            if journal_generation > generation:
+                continue  # compacted since snapshot was read; read again
+            self._data = data
+            self._reset_indexes()
+            self._generation = generation
+            if journal_generation == generation:
+                # replaying is not modification, even of read-only stores
+                readonly, self._readonly = self._readonly, False
+                try:
+                    for line in lines:
+                        op, args, kwargs = decode_record(line)
+                        getattr(store.Store, op)(self, *args, **kwargs)
+                finally:
+                    self._readonly = readonly
+            self._dirty = False
+            return
+        raise UserWarning(
+            'Journal does not match store: {}'.format(self.journal_filename))
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._load()
+        return self._data
+
+    def _disk_version(self):
+        return (
+            store.file_version(self._filename),
+            store.file_version(self.journal_filename),
+        )
+
+    @data.deleter
+    def data(self):
+        self._data = None
+        self._dirty = False
+        self._pending = []
+        self._reset_indexes()
+        self._reset_archive()
+
+    def _write_snapshot(self):
+        data = dict(self._data, journal=self._generation)
+        store.write_file(
+            self._filename, data, self._compression, self._compression_level)
+
+    def _start_journal(self):
+        header = json.dumps({'generation': self._generation}) + '\n'
+        store.atomic_write(self.journal_filename, lambda fp: fp.write(header))
+
+    def compact(self):
+        """Write all modifications to a new snapshot and empty the journal."""
+        self.data  # ensure data are loaded
+        self._generation += 1
+        self._flush_archive()
+        self._write_snapshot()
+        self._start_journal()
+        self._pending = []
+        self._dirty = False
+        self._version = self._disk_version()
+
+    def flush(self):
+        """Append modifications to the journal, compacting if needed."""
+        if self._data is None or not self._dirty:
+            return
+        if self._archive_dirty or not os.path.exists(self._filename):
+            return self.compact()  # archiving is not journaled
+        journal_generation, _ = self._read_journal(records=False)
+        if journal_generation is None or journal_generation < self._generation:
+            self._start_journal()
+        records = ''.join(self._pending)
+        if os.path.getsize(self.journal_filename) + len(records) > self._limit:
+            return self.compact()
+        with open(self.journal_filename, 'a') as fp:
+            fp.write(records)
+            fp.flush()
+            os.fsync(fp.fileno())
+        self._pending = []
+        self._dirty = False
+        self._version = self._disk_version()
+
+
+def _journaled(op):
+    method = getattr(store.Store, op)
+
+    @functools.wraps(method)
+    def journaled_method(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self._pending.append(encode_record(op, args, kwargs))
+        return result
+    return journaled_method
+
+
+for _op in _ops:
+    setattr(JournalStore, _op, _journaled(_op))
@@ -0,0 +1,98 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Advisory file locks.
+
+Locks are taken with ``flock(2)`` on a separate lock file, rather than
+on the store file itself, because stores are written by replacing the
+store file.  On platforms without ``fcntl`` locks are not taken.
+"""
+
+import errno
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+DEFAULT_TIMEOUT = 10.0
+"""Seconds to wait for a lock before giving up."""
+
+
+class FileLock(object):
+    """An advisory lock, shared or exclusive, on the named lock file.
+
+    The lock file is created if it does not exist.
+    """
+
+    __slots__ = frozenset(['filename', '_fd'])
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._fd = None
+
+    @property
+    def locked(self):
+        """Whether the lock is held."""
+        return self._fd is not None
+
+    def acquire(self, exclusive=True, timeout=DEFAULT_TIMEOUT):
+        """Acquire the lock.
+
+        ``exclusive``
+          Whether to take an exclusive lock (otherwise a shared lock).
+        ``timeout``
+          Seconds to wait for the lock; ``None`` to wait indefinitely.
+
+        Raise ``UserWarning`` if the lock is not acquired in time.  A
+        shared lock is not taken if the lock file cannot be created
+        (e.g. on a read-only file system).
+        """
+        if fcntl is None or self._fd is not None:
+            return
+        try:
+            fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o666)
+        except OSError:
+            if exclusive:
+                raise
+            return
+        mode = (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB
+        deadline = time.time() + timeout if timeout is not None else None
+        delay = 0.01
+        while True:
+            try:
+                fcntl.flock(fd, mode)
+                break
+            except IOError as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    os.close(fd)
+                    raise
+            if deadline is not None and time.time() >= deadline:
+                os.close(fd)
+                raise UserWarning(
+                    'Timed out waiting for lock: {}'.format(self.filename))
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+        self._fd = fd
+
+    def release(self):
+        """Release the lock, if held."""
+        if self._fd is not None:
+            os.close(self._fd)  # closing the file releases the lock
+            self._fd = None
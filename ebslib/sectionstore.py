@@ -0,0 +1,305 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Sectioned store.
+
+A sectioned store holds the same data as a JSON store, split into
+separately encoded sections: the holidays, the holiday rules and,
+for each estimator, its events, pending tasks, completed tasks, the
+positions of the pending tasks among all its tasks, and its velocity
+summary.  The file starts with a header giving the offset
+and length of every section, and a section is decoded only when it
+is first used.  Listing holidays decodes no tasks at all, and
+estimating ship dates decodes no completed tasks.
+
+When the store is written, sections that were never decoded are
+copied unchanged from the file they were read from.
+
+Tasks are read back in the order they were written.  Files written
+before the positions of pending tasks were kept have no ``order``
+section; their pending tasks are read first.
+"""
+
+import itertools
+import json
+
+from . import estimator
+from . import holiday
+from . import store
+from . import task
+from . import tasktable
+
+
+_estimator_sections = ('events', 'pending', 'completed', 'order', 'summary')
+
+
+def _encode(value):
+    return json.dumps(value, default=store._serialise)
+
+
+class SectionEstimator(estimator.Estimator):
+    """An estimator whose sections are decoded on first use.
+
+    ``source``
+      The ``SectionStore`` the estimator was read from.
+    ``entry``
+      The header entry of the estimator, giving its name and the
+      location of each of its sections.
+
+    Pending tasks can be read without decoding completed tasks;
+    anything else that touches ``tasks`` decodes both.
+    """
+
+    __slots__ = frozenset([
+        '_source', '_entry', '_pending', '_tasks', '_events', '_summary',
+    ])
+
+    def __init__(self, source, entry):
+        self.name = entry['name']
+        self._digest = None
+        self._source = source
+        self._entry = entry
+        self._pending = None
+        self._tasks = None
+        self._events = None
+        self._summary = None
+
+    def _section(self, name):
+        return self._source._section(self._entry, name)
+
+    def loaded(self, name):
+        """Return whether the named section has been decoded."""
+        if name == 'pending':
+            return self._pending is not None or self._tasks is not None
+        if name in ('completed', 'order'):
+            return self._tasks is not None
+        return getattr(self, '_' + name) is not None
+
+    def _pending_tasks(self):
+        if self._pending is None:
+            self._pending = [
+                task.Task.from_dict(x)
+                for x in self._section('pending') or []
+            ]
+        return self._pending
+
+    @property
+    def tasks(self):
+        if self._tasks is None:
+            pending = self._pending_tasks()
+            completed = [
+                task.Task.from_dict(x)
+                for x in self._section('completed') or []
+            ]
+            order = self._section('order')
+            if order is None:
+                tasks = pending + completed
+            else:
+                rows = xrange(len(pending) + len(completed))
+                order = frozenset(order)
+                pending, completed = iter(pending), iter(completed)
+                tasks = [
+                    next(pending if i in order else completed) for i in rows]
+            self._tasks = tasktable.TaskTable.adopt(tasks)
+        return self._tasks
+
+    @tasks.setter
+    def tasks(self, value):
+        self._tasks = value
+
+    @property
+    def events(self):
+        if self._events is None:
+            self._events = [
+                task.Event.from_dict(x)
+                for x in self._section('events') or []
+            ]
+        return self._events
+
+    @events.setter
+    def events(self, value):
+        self._events = value
+
+    @property
+    def summary(self):
+        if self._summary is None:
+            data = self._section('summary')
+            self._summary = estimator.VelocitySummary.from_dict(data) \
+                if data is not None \
+                else estimator.VelocitySummary.from_tasks(
+                    itertools.chain(
+                        self.tasks, self._source.archived_tasks(self.name)))
+        return self._summary
+
+    @summary.setter
+    def summary(self, value):
+        self._summary = value
+
+    def pending_tasks(self):
+        if self._tasks is None:
+            return iter(self._pending_tasks())
+        return super(SectionEstimator, self).pending_tasks()
+
+    def update_task(self, t, **kwargs):
+        self.tasks  # a completed task moves to the other section
+        super(SectionEstimator, self).update_task(t, **kwargs)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        return isinstance(other, estimator.Estimator) and all(
+            getattr(self, attr) == getattr(other, attr)
+            for attr in estimator.Estimator.fields
+        )
+
+    def __repr__(self):
+        return '{}(name={!r})'.format(type(self).__name__, self.name)
+
+
+class SectionStore(store.Store):
+    """A store whose sections are decoded on first use.
+
+    The file read from is kept open while its data are in use, so
+    that sections can still be decoded after the store has been
+    written (or replaced by another process).
+    """
+
+    __slots__ = ('_fp', '_header', '_base')
+
+    def __init__(self, filename, **kwargs):
+        super(SectionStore, self).__init__(filename, **kwargs)
+        self._fp = None
+        self._header = {}
+        self._base = 0
+
+    def _open(self):
+        self._header = {}
+        self._data = {}
+        self._version = self._disk_version()
+        try:
+            fp = open(self._filename, 'rb')
+        except IOError:
+            return
+        try:
+            if fp.readline() != store._sections_magic:
+                raise ValueError('bad magic')
+            self._header = json.loads(fp.readline())
+        except ValueError:
+            fp.close()
+            raise UserWarning(
+                'Not a sectioned store: {}'.format(self._filename))
+        self._fp = fp
+        self._base = fp.tell()
+        self._data['estimators'] = [
+            SectionEstimator(self, entry)
+            for entry in self._header.get('estimators', [])
+        ]
+
+    def _close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def _raw(self, entry, name):
+        """Return the undecoded section, or ``None`` if absent."""
+        if name not in entry:
+            return None
+        offset, length = entry[name]
+        self._fp.seek(self._base + offset)
+        return self._fp.read(length)
+
+    def _section(self, entry, name):
+        """Decode the section, returning ``None`` if absent."""
+        raw = self._raw(entry, name)
+        if raw is None:
+            return None
+        return json.loads(raw, object_hook=store._object_hook)
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._reset_indexes()
+            self._close()
+            self._open()
+        return self._data
+
+    @data.deleter
+    def data(self):
+        store.Store.data.fdel(self)
+        self._close()
+
+    @property
+    def holidays(self):
+        """Return the holidays in this store as a ``HolidayIndex``."""
+        if 'holidays' not in self.data:
+            self.data['holidays'] = holiday.HolidayIndex(
+                self._section(self._header, 'holidays') or [])
+        return self.data['holidays']
+
+    @property
+    def holiday_rules(self):
+        """Return the recurring holiday rules in this store as a list."""
+        if 'holiday_rules' not in self.data:
+            self.data['holiday_rules'] = [
+                holiday.parse_rule(x)
+                for x in self._section(self._header, 'holiday_rules') or []
+            ]
+        return self.data['holiday_rules']
+
+    def _sections(self, header):
+        """Generate ``(entry, name, raw)`` for each section to write.
+
+        ``entry`` is the part of ``header`` that locates the section.
+        """
+        for name in ('holidays', 'holiday_rules'):
+            if name in self._data:
+                yield header, name, _encode(self._data[name])
+            else:
+                yield header, name, self._raw(self._header, name)
+        for e in self._data.get('estimators', []):
+            entry = {'name': e.name}
+            header['estimators'].append(entry)
+            own = isinstance(e, SectionEstimator) and e._source is self
+            encoders = {
+                'events': lambda: e.events,
+                'pending': lambda: list(e.pending_tasks()),
+                'completed': lambda: list(e.completed_tasks()),
+                'order': lambda: [
+                    i for i, t in enumerate(e.tasks) if not t.completed],
+                'summary': lambda: e.summary,
+            }
+            for name in _estimator_sections:
+                if own and not e.loaded(name):
+                    yield entry, name, self._raw(e._entry, name)
+                else:
+                    yield entry, name, _encode(encoders[name]())
+
+    def _write(self, fp):
+        header = {'estimators': []}
+        chunks = []
+        offset = 0
+        for entry, name, raw in self._sections(header):
+            if raw is not None:
+                entry[name] = [offset, len(raw)]
+                chunks.append(raw + '\n')
+                offset += len(raw) + 1
+        fp.write(store._sections_magic)
+        fp.write(json.dumps(header) + '\n')
+        for chunk in chunks:
+            fp.write(chunk)
+
+    def _commit(self):
+        store.atomic_write(self._filename, self._write)
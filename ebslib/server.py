@@ -0,0 +1,287 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Server keeping a store in memory for other ebs processes.
+
+The server listens on the socket of its store (see ``client``), and
+runs each command sent to it on a thread of its own, against the
+store it holds.  Commands that only read the store run concurrently;
+commands that modify it run one at a time, with the store locked,
+and the store is written before the reply is sent.  If another
+process commits a new version of the store, the server reads it
+before running the next command; so too the configuration, if
+``~/.ebsrc`` has changed.
+
+Output of commands is captured by replacing ``sys.stdout`` and
+``sys.stderr`` with streams that write to a buffer of the thread
+running the command.
+"""
+
+import contextlib
+import errno
+import json
+import os
+import signal
+import SocketServer
+import sys
+import threading
+import traceback
+
+from . import client
+from . import command
+from . import store as _store
+
+
+class ReadWriteLock(object):
+    """A lock held by any number of readers, or by one writer.
+
+    Waiting writers take the lock before new readers.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextlib.contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+_local = threading.local()
+
+
+class _Buffer(object):
+    """Output of a command, as UTF-8."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, s):
+        self._parts.append(s.encode('utf-8') if isinstance(s, unicode) else s)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return ''.join(self._parts).decode('utf-8', 'replace')
+
+
+class _ThreadStream(object):
+    """A stream writing to the buffer of the current thread, if any."""
+
+    def __init__(self, name, stream):
+        self._name = name
+        self._stream = stream
+
+    def _target(self):
+        return getattr(_local, self._name, None) or self._stream
+
+    def write(self, s):
+        self._target().write(s)
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            reply = self.server.execute(request['argv'], request['cwd'])
+        except (ValueError, KeyError, TypeError):
+            reply = {'status': None}
+        self.wfile.write(json.dumps(reply))
+
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """A server of a store.
+
+    ``filename``
+      Name of the socket.
+    ``store``
+      The ``Store`` to serve.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, filename, store):
+        SocketServer.UnixStreamServer.__init__(self, filename, _Handler)
+        self.store = store
+        self.lock = ReadWriteLock()
+        self._parsers = {}
+        self._parsers_lock = threading.Lock()
+
+    def _parser(self, name):
+        with self._parsers_lock:
+            if name not in self._parsers:
+                self._parsers[name] = command.build_parser([name])
+            return self._parsers[name]
+
+    def execute(self, argv, cwd):
+        """Run a command; return the reply to send.
+
+        The status of the reply is ``None`` if the server does not run
+        the command.
+        """
+        _local.stdout = stdout = _Buffer()
+        _local.stderr = stderr = _Buffer()
+        try:
+            status = self._run(argv, cwd)
+        except SystemExit as e:  # argparse has reported an error
+            status = e.code if isinstance(e.code, int) else 1
+        except UserWarning as e:
+            print >>sys.stderr, 'ebs: {}'.format(e)
+            status = 1
+        except Exception:
+            traceback.print_exc(file=sys.stderr)
+            status = 1
+        finally:
+            del _local.stdout, _local.stderr
+        return {
+            'status': status,
+            'stdout': stdout.getvalue(),
+            'stderr': stderr.getvalue(),
+        }
+
+    def _run(self, argv, cwd):
+        """Run a command; return its status, or ``None`` if not run."""
+        try:
+            cls = command.get_command(argv[0])
+        except (KeyError, IndexError):
+            return None
+        if not issubclass(cls, command.EBSCommand) or not cls.forward:
+            return None
+        parser = self._parser(argv[0])
+        args = parser.parse_args(argv)
+        path = os.path.join(cwd, os.path.expanduser(args.store))
+        if os.path.realpath(path) != os.path.realpath(self.store.filename):
+            return None
+        command.conf.refresh()  # the configuration may have changed
+        cmd = args.command(args, parser, command.registry, {})
+        cmd._store = self.store
+        if cls.readonly:
+            self.refresh()
+            with self.lock.read():
+                cmd._run()
+        else:
+            with self.lock.write():
+                with self.store:
+                    try:
+                        cmd._run()
+                    except:
+                        self.store.discard()
+                        load(self.store)
+                        raise
+        return 0
+
+    def refresh(self):
+        """Read the store again if a new version has been committed.
+
+        The store is read while no command is running, and not by the
+        commands themselves, which may run concurrently.
+        """
+        if self.store.changed_on_disk():
+            with self.lock.write():
+                if self.store.refresh():
+                    load(self.store)
+
+
+def load(store):
+    """Read the store, and build its indexes."""
+    store.estimators
+    store.task_exists(None)
+
+
+def serve(store):
+    """Serve the store until interrupted or terminated."""
+    filename = client.socket_filename(store.filename)
+    try:
+        served = client.request(filename, []) is not None
+    except client.NoReplyError:
+        served = True  # something is listening
+    if served:
+        raise UserWarning('Store is already served: {}'.format(store.filename))
+    try:
+        os.unlink(filename)  # a stale socket
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+    load(store)
+    server = Server(filename, store)
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = _ThreadStream('stdout', stdout)
+    sys.stderr = _ThreadStream('stderr', stderr)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        server.server_close()
+        os.unlink(filename)
+
+
+class Serve(command.EBSCommand):
+    """Keep the store in memory, and run ebs commands sent to it.
+
+    The store is served on a Unix socket, <store>.sock, until the
+    server is interrupted or terminated.  While the store is served,
+    ebs commands on it are run by the server; commands that read or
+    write files of their own, and commands on other stores, are run
+    as usual.  Commands that modify the store are run one at a time,
+    and the store is written as each completes; commands that only
+    read the store run concurrently.
+
+    JSON stores are rewritten in full by each modification; journaled
+    or sharded stores are better served.  SQLite stores cannot be
+    served.
+    """
+
+    forward = False
+
+    def __call__(self):
+        store = _store.open_store(self._args.store, **command.store_options())
+        if not isinstance(store, _store.Store):
+            raise UserWarning('Store cannot be served: {}'.format(
+                self._args.store))
+        serve(store)
@@ -0,0 +1,325 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Sharded store.
+
+A sharded store is a directory holding a manifest, ``manifest.json``,
+and one shard file per estimator.  The manifest holds the holidays,
+the holiday rules and, for each estimator, its name, the file of its
+shard and the IDs of its tasks; each shard is a JSON store holding
+only that estimator.
+
+Shards are read only when their estimators are used.  Looking up an
+estimator, or a task by ID, reads only the shard holding it, and
+listing the tasks of given estimators or IDs reads only their
+shards; the other shards are read when all the estimators are used.
+Shards are read one after another: decoding JSON holds the
+interpreter lock, so threads would not read them any faster.
+
+When the store is written, only the shards of modified estimators
+are written, each to a new file named for the generation of the
+store being committed.  The manifest, which is small, is rewritten
+last and so commits the new version of the store; the files of
+replaced and removed shards are deleted after that.  A crash part way
+through a commit leaves the previous version intact.
+"""
+
+import os
+import urllib
+
+from . import estimator
+from . import store
+
+
+def _shard_filename(name, generation):
+    """Return the file name of a shard of the named estimator."""
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    return '{}.{}.json'.format(urllib.quote(name, safe='@+'), generation)
+
+
+def _read_shard(filename):
+    try:
+        data = store.read_file(filename)
+        if 'estimators' not in data:
+            # a bare estimator, as written by the generic encoder
+            return estimator.Estimator.from_dict(data)
+        return data['estimators'][0]
+    except (IOError, ValueError, KeyError, IndexError):
+        raise UserWarning('Cannot read shard: {}'.format(filename))
+
+
+class ShardedStore(store.Store):
+    """A store kept in a directory, with a shard per estimator.
+
+    Keyword arguments are as for ``Store``; shards are not compressed.
+    The lock and archive files are kept alongside the directory, as
+    ``<filename>.lock`` and ``<filename>.archive``.
+
+    Until all the estimators are used, the store answers lookups from
+    the manifest and the shards read so far.  Manifests written before
+    task IDs were recorded do not locate tasks, and looking up a task
+    then reads every shard.
+    """
+
+    __slots__ = ('_shards', '_task_shard_index', '_dirty_shards')
+
+    def __init__(self, filename, **kwargs):
+        filename = os.path.normpath(os.path.expanduser(filename))
+        super(ShardedStore, self).__init__(filename, **kwargs)
+        self._shards = {}
+        self._task_shard_index = None
+        self._dirty_shards = set()
+
+    @property
+    def manifest_filename(self):
+        return os.path.join(self._filename, 'manifest.json')
+
+    def _shard_path(self, filename):
+        return os.path.join(self._filename, filename)
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._reset_indexes()
+            self._shards = {}
+            self._task_shard_index = None
+            self._version = self._disk_version()
+            try:
+                self._data = store.read_file(self.manifest_filename)
+            except (IOError, ValueError):
+                self._data = {}
+        return self._data
+
+    @data.deleter
+    def data(self):
+        store.Store.data.fdel(self)
+        self._dirty_shards = set()
+
+    def _disk_version(self):
+        return store.file_version(self.manifest_filename)
+
+    @property
+    def _partial(self):
+        """Whether some estimators may not have been read."""
+        return 'estimators' not in self.data
+
+    def _shard_names(self):
+        """Return the names of the estimators, in store order."""
+        return [entry[0] for entry in self.data.get('shards', [])]
+
+    def _read_shards(self, names=None):
+        """Return the named estimators, or all, in store order.
+
+        Shards not yet read are read.  If they have been replaced by a
+        newer version of the store, the newer version is read instead.
+        """
+        if names is not None:
+            names = set(names)
+        entries = [
+            entry for entry in self.data.get('shards', [])
+            if names is None or entry[0] in names
+        ]
+        try:
+            for entry in entries:
+                if entry[0] not in self._shards:
+                    self._shards[entry[0]] = \
+                        _read_shard(self._shard_path(entry[1]))
+        except UserWarning:
+            if self._dirty or not self.changed_on_disk():
+                raise
+            # the shards were replaced by a newer version; read it
+            del self.data
+            return self._read_shards(names)
+        return [self._shards[entry[0]] for entry in entries]
+
+    @property
+    def _task_shards(self):
+        """Return the names of the estimators holding each task ID.
+
+        The names are as recorded by the manifest, and are kept up to
+        date until all the estimators are read.  Return ``None`` if
+        all the estimators have been read, or if the manifest does not
+        record task IDs.
+        """
+        if not self._partial:
+            return None
+        if self._task_shard_index is None:
+            entries = self.data.get('shards', [])
+            if any(len(entry) < 3 for entry in entries):
+                return None
+            self._task_shard_index = {
+                id: entry[0] for entry in entries for id in entry[2]}
+        return self._task_shard_index
+
+    @property
+    def estimators(self):
+        """Return the estimators in this store as a sequence.
+
+        The shards not yet read are read when all the estimators are
+        first used.
+        """
+        if self._partial:
+            estimators = self._read_shards()
+            self.data['estimators'] = estimators
+        return self.data['estimators']
+
+    def get_estimator(self, name):
+        if not self._partial:
+            return super(ShardedStore, self).get_estimator(name)
+        estimators = self._read_shards([name])
+        if not estimators:
+            raise UserWarning('Estimator does not exist: {}'.format(name))
+        return estimators[0]
+
+    def estimator_exists(self, name):
+        if not self._partial:
+            return super(ShardedStore, self).estimator_exists(name)
+        return name in self._shard_names()
+
+    def tasks(self, **kwargs):
+        names, ids = kwargs.get('estimators'), kwargs.get('ids')
+        index = self._task_shards
+        if names is None and (ids is None or index is None):
+            return super(ShardedStore, self).tasks(**kwargs)
+        if ids is not None and index is not None:
+            holding = set(index[x] for x in ids if x in index)
+            names = holding if names is None else holding & set(names)
+        return self._shard_tasks(names, **kwargs)
+
+    def _shard_tasks(self, names, **kwargs):
+        """Yield the tasks of the named estimators, as for ``tasks``."""
+        pending = kwargs.get('completed') is False
+        for estimator in self._read_shards(names):
+            for task in (
+                estimator.pending_tasks() if pending else estimator.tasks
+            ):
+                if store._include_task(estimator, task, **kwargs):
+                    yield estimator, task
+
+    def get_task(self, id):
+        index = self._task_shards
+        if index is None:
+            return super(ShardedStore, self).get_task(id)
+        if id in index:
+            estimators = self._read_shards([index[id]])
+            if self._task_shards is not index:
+                # a newer version of the store was read
+                return self.get_task(id)
+            for estimator in estimators:
+                for task in estimator.tasks:
+                    if task.id == id:
+                        return estimator, task
+        raise UserWarning('Task does not exist: {}'.format(id))
+
+    def task_exists(self, id):
+        index = self._task_shards
+        if index is None:
+            return super(ShardedStore, self).task_exists(id)
+        return id in index
+
+    def _commit(self):
+        if not os.path.isdir(self._filename):
+            os.makedirs(self._filename)
+        generation = self._data.get('generation', 0) + 1
+        entries = self._data.get('shards', [])
+        old = {entry[0]: entry for entry in entries}
+        if 'estimators' in self._data:
+            estimators = [(e.name, e) for e in self._data['estimators']]
+        else:
+            # only the shards read may have been modified
+            estimators = [
+                (entry[0], self._shards.get(entry[0])) for entry in entries]
+        shards = []
+        for name, e in estimators:
+            if e is None:
+                shards.append(old[name])
+                continue
+            if name in self._dirty_shards or name not in old:
+                filename = _shard_filename(name, generation)
+                store.write_file(
+                    self._shard_path(filename), {'estimators': [e]})
+            else:
+                filename = old[name][1]
+            ids = [t.id for t in e.tasks if t.id is not None]
+            shards.append([name, filename, ids])
+        manifest = {
+            k: v for k, v in self._data.viewitems() if k != 'estimators'}
+        manifest['shards'] = shards
+        manifest['generation'] = generation
+        store.write_file(self.manifest_filename, manifest)
+        self._data['shards'] = shards
+        self._data['generation'] = generation
+        self._task_shard_index = None
+        self._dirty_shards = set()
+        # delete replaced and removed shards, and any left by a crash
+        current = set(entry[1] for entry in shards)
+        for filename in os.listdir(self._filename):
+            if filename.endswith('.json') and filename != 'manifest.json' \
+                    and filename not in current:
+                try:
+                    os.unlink(self._shard_path(filename))
+                except OSError:
+                    pass
+
+    def add_estimator(self, estimator):
+        super(ShardedStore, self).add_estimator(estimator)
+        self._dirty_shards.add(estimator.name)
+
+    def remove_estimator(self, name):
+        self.estimators  # index the estimators before one is removed
+        estimator = super(ShardedStore, self).remove_estimator(name)
+        self._dirty_shards.discard(name)
+        return estimator
+
+    def add_event(self, name, event):
+        super(ShardedStore, self).add_event(name, event)
+        self._dirty_shards.add(name)
+
+    def add_task(self, name, task):
+        super(ShardedStore, self).add_task(name, task)
+        self._dirty_shards.add(name)
+
+    def add_tasks(self, name, tasks):
+        super(ShardedStore, self).add_tasks(name, tasks)
+        self._dirty_shards.add(name)
+
+    def remove_task(self, id):
+        index = self._task_shards
+        if index is None:
+            estimator, task = super(ShardedStore, self).remove_task(id)
+        else:
+            # only the shard of the task need be read
+            estimator, task = self.get_task(id)
+            estimator.remove_task(task)
+            del index[id]
+            self.mark_dirty()
+        self._dirty_shards.add(estimator.name)
+        return estimator, task
+
+    def move_task(self, id, name):
+        old_estimator, task = self.get_task(id)
+        super(ShardedStore, self).move_task(id, name)
+        self._dirty_shards.update([old_estimator.name, name])
+
+    def update_task(self, id, **kwargs):
+        estimator, task = self.get_task(id)
+        super(ShardedStore, self).update_task(id, **kwargs)
+        self._dirty_shards.add(estimator.name)
+
+    def add_archived_tasks(self, name, tasks):
+        super(ShardedStore, self).add_archived_tasks(name, tasks)
+        self._dirty_shards.add(name)  # archived tasks leave the shard
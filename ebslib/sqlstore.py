@@ -0,0 +1,642 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""SQLite store backend.
+
+Tasks, events and holidays are stored as rows, indexed by task ID,
+estimator, project, priority and completion.  Archived tasks are kept
+in a table of their own, and count towards the velocities of their
+estimators as they do in other stores.  Estimators are kept once
+requested, so that an estimator retrieved twice from the same store is
+the same object, but their tasks and events are read only when first
+used.  Queries and modifications of single tasks read and write only
+the rows of those tasks.  Modifications are written to the database as
+they are made and committed when the store is flushed.
+"""
+
+import datetime
+import itertools
+import os
+import sqlite3
+
+from . import estimator as _estimator
+from . import holiday
+from . import store
+from . import task as _task
+from . import tasktable
+
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS estimator (
+    name TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS task (
+    rowid INTEGER PRIMARY KEY,
+    estimator TEXT NOT NULL,
+    id,
+    project TEXT,
+    description TEXT,
+    priority INTEGER,
+    estimate REAL,
+    date INTEGER,
+    completed INTEGER,
+    actual REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS task_id ON task (id);
+CREATE INDEX IF NOT EXISTS task_estimator ON task (estimator, completed);
+CREATE INDEX IF NOT EXISTS task_project ON task (project);
+CREATE INDEX IF NOT EXISTS task_priority ON task (priority);
+CREATE INDEX IF NOT EXISTS task_completed ON task (completed);
+CREATE TABLE IF NOT EXISTS event (
+    estimator TEXT NOT NULL,
+    date INTEGER,
+    cost REAL,
+    description TEXT
+);
+CREATE INDEX IF NOT EXISTS event_estimator ON event (estimator, date);
+CREATE TABLE IF NOT EXISTS archived_task (
+    estimator TEXT NOT NULL,
+    id,
+    estimate REAL,
+    actual REAL,
+    date INTEGER
+);
+CREATE INDEX IF NOT EXISTS archived_task_estimator
+    ON archived_task (estimator);
+CREATE INDEX IF NOT EXISTS archived_task_id ON archived_task (id);
+CREATE TABLE IF NOT EXISTS holiday (
+    date INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS holiday_rule (
+    spec TEXT PRIMARY KEY
+);
+'''
+
+_task_columns = (
+    'id', 'project', 'description', 'priority',
+    'estimate', 'date', 'completed', 'actual',
+)
+
+
+_cost_columns = frozenset(['estimate', 'actual', 'cost'])
+
+
+def _to_db(attr, value):
+    if attr == 'date' and value is not None:
+        return value.toordinal()
+    if attr == 'completed':
+        return int(bool(value))
+    return value
+
+
+def _from_db(attr, value):
+    if attr == 'date' and value is not None:
+        return datetime.date.fromordinal(value)
+    if attr == 'completed':
+        return bool(value)
+    if attr in _cost_columns and isinstance(value, float):
+        # REAL columns hold integral costs as floats
+        return tasktable._number(value)
+    return value
+
+
+def _task_from_row(row):
+    return _task.Task(**{
+        attr: _from_db(attr, value) for attr, value in zip(_task_columns, row)
+    })
+
+
+def _task_to_row(task):
+    return tuple(_to_db(attr, getattr(task, attr)) for attr in _task_columns)
+
+
+class SQLiteEstimator(_estimator.Estimator):
+    """An estimator whose tasks and events are read from the database.
+
+    ``source``
+      The ``SQLiteStore`` the estimator is read from.
+    ``name``
+      Name of the estimator.
+
+    Tasks, events and the velocity summary are read together, when
+    any of them is first used.  The summary includes the velocities
+    of archived tasks.
+    """
+
+    __slots__ = frozenset(['_source', '_tasks', '_events', '_summary'])
+
+    def __init__(self, source, name):
+        self.name = name
+        self._digest = None
+        self._source = source
+        self._tasks = self._events = self._summary = None
+
+    @property
+    def loaded(self):
+        """Whether the tasks and events have been read."""
+        return self._tasks is not None
+
+    def _load(self):
+        if self._tasks is None:
+            self._tasks = tasktable.TaskTable.adopt(
+                self._source._load_tasks(self.name))
+            self._events = self._source._load_events(self.name)
+            self._summary = _estimator.VelocitySummary.from_tasks(
+                itertools.chain(
+                    self._tasks, self._source.archived_tasks(self.name)))
+
+    @property
+    def tasks(self):
+        self._load()
+        return self._tasks
+
+    @tasks.setter
+    def tasks(self, value):
+        self._load()
+        self._tasks = value
+
+    @property
+    def events(self):
+        self._load()
+        return self._events
+
+    @events.setter
+    def events(self, value):
+        self._load()
+        self._events = value
+
+    @property
+    def summary(self):
+        self._load()
+        return self._summary
+
+    @summary.setter
+    def summary(self, value):
+        self._load()
+        self._summary = value
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        return isinstance(other, _estimator.Estimator) and all(
+            getattr(self, attr) == getattr(other, attr)
+            for attr in _estimator.Estimator.fields
+        )
+
+    def __repr__(self):
+        return '{}(name={!r})'.format(type(self).__name__, self.name)
+
+
+class SQLiteStore(store.AbstractStore):
+    """A store backed by an SQLite database."""
+
+    __slots__ = (
+        '_filename', '_conn', '_dirty',
+        '_estimators', '_rows', '_holidays', '_holiday_rules',
+    )
+
+    def __init__(self, filename):
+        self._filename = os.path.expanduser(filename)
+        self._conn = None
+        self._dirty = False
+        self._estimators = {}  # estimators retrieved, by name
+        self._rows = {}        # tasks retrieved, by rowid
+        self._holidays = None
+        self._holiday_rules = None
+
+    @property
+    def filename(self):
+        """The name of the database file."""
+        return self._filename
+
+    @property
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self._filename)
+            self._conn.executescript(_schema)
+        return self._conn
+
+    def _execute(self, sql, *args):
+        return self._db.execute(sql, args)
+
+    @property
+    def dirty(self):
+        """Whether there are uncommitted modifications."""
+        return self._dirty
+
+    def mark_dirty(self):
+        """Record that the data have been modified."""
+        self._dirty = True
+
+    def flush(self):
+        """Commit modifications to the database."""
+        if self._conn is not None and self._dirty:
+            self._conn.commit()
+            self._dirty = False
+
+    def discard(self):
+        """Discard uncommitted modifications."""
+        self.close()
+
+    def close(self):
+        """Discard uncommitted modifications and close the database."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._dirty = False
+        self._estimators.clear()
+        self._rows.clear()
+        self._holidays = self._holiday_rules = None
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.flush()
+        self.close()
+
+    def _task(self, row):
+        """Return the task of a ``rowid, <task columns>`` row.
+
+        A task retrieved twice from the same store is the same object.
+        """
+        if row[0] not in self._rows:
+            self._rows[row[0]] = _task_from_row(row[1:])
+        return self._rows[row[0]]
+
+    def _load_tasks(self, name):
+        """Read the tasks of the named estimator from the database."""
+        return [
+            self._task(row) for row in self._execute(
+                'SELECT rowid, {} FROM task WHERE estimator = ? '
+                'ORDER BY rowid'.format(', '.join(_task_columns)),
+                name
+            )
+        ]
+
+    def _load_events(self, name):
+        """Read the events of the named estimator from the database."""
+        return [
+            _task.Event(
+                date=_from_db('date', date), cost=_from_db('cost', cost),
+                description=desc)
+            for date, cost, desc in self._execute(
+                'SELECT date, cost, description FROM event '
+                'WHERE estimator = ? ORDER BY rowid',
+                name
+            )
+        ]
+
+    def _loaded_estimator(self, name):
+        """Return the named estimator if its tasks are in memory.
+
+        Otherwise return ``None``; the tasks will be read from the
+        database, as modified, when first used.
+        """
+        estimator = self._estimators.get(name)
+        if isinstance(estimator, SQLiteEstimator) and not estimator.loaded:
+            return None
+        return estimator
+
+    @property
+    def estimators(self):
+        """Return the estimators in this store as a sequence."""
+        return [
+            self.get_estimator(name) for name, in
+            self._execute('SELECT name FROM estimator ORDER BY rowid')
+        ]
+
+    def get_estimator(self, name):
+        """Get an estimator by name."""
+        if name not in self._estimators:
+            self.assert_estimator_exist(name)
+            self._estimators[name] = SQLiteEstimator(self, name)
+        return self._estimators[name]
+
+    def estimator_exists(self, name):
+        """Return whether the named estimator exists in the data store."""
+        return name in self._estimators or bool(self._execute(
+            'SELECT 1 FROM estimator WHERE name = ?', name).fetchone())
+
+    def add_estimator(self, estimator):
+        """Add an estimator, with its tasks and events.
+
+        Raise ``UserWarning`` if an estimator of the same name exists,
+        or if a task of the estimator has the ID of another task.
+        """
+        self.assert_estimator_not_exist(estimator.name)
+        self._execute('INSERT INTO estimator (name) VALUES (?)', estimator.name)
+        rows = {}
+        try:
+            for task in estimator.tasks:
+                rows[self._insert_task(estimator.name, task)] = task
+        except UserWarning:
+            for table, column in (
+                ('task', 'estimator'), ('estimator', 'name')
+            ):
+                self._execute(
+                    'DELETE FROM {} WHERE {} = ?'.format(table, column),
+                    estimator.name
+                )
+            raise
+        self._rows.update(rows)
+        self._db.executemany(
+            'INSERT INTO event (estimator, date, cost, description) '
+            'VALUES (?, ?, ?, ?)',
+            (
+                (estimator.name, _to_db('date', e.date), e.cost, e.description)
+                for e in estimator.events
+            )
+        )
+        self._estimators[estimator.name] = estimator
+        self.mark_dirty()
+
+    def remove_estimator(self, name):
+        """Remove the named estimator and return it."""
+        estimator = self.get_estimator(name)
+        estimator.tasks  # read before the rows are deleted
+        for rowid, in self._execute(
+                'SELECT rowid FROM task WHERE estimator = ?', name):
+            self._rows.pop(rowid, None)
+        for table, column in (
+            ('task', 'estimator'), ('event', 'estimator'),
+            ('archived_task', 'estimator'), ('estimator', 'name')
+        ):
+            self._execute(
+                'DELETE FROM {} WHERE {} = ?'.format(table, column), name)
+        del self._estimators[name]
+        self.mark_dirty()
+        return estimator
+
+    def add_event(self, name, event):
+        """Add an event to the named estimator."""
+        self.assert_estimator_exist(name)
+        self._execute(
+            'INSERT INTO event (estimator, date, cost, description) '
+            'VALUES (?, ?, ?, ?)',
+            name, _to_db('date', event.date), event.cost, event.description
+        )
+        estimator = self._loaded_estimator(name)
+        if estimator is not None:
+            estimator.events.append(event)
+        self.mark_dirty()
+
+    def archived_tasks(self, name):
+        """Return the archived tasks of the named estimator."""
+        return [
+            _task.ArchivedTask.from_row((
+                id, _from_db('estimate', estimate), _from_db('actual', actual),
+                date
+            )) for id, estimate, actual, date in self._execute(
+                'SELECT id, estimate, actual, date FROM archived_task '
+                'WHERE estimator = ? ORDER BY rowid',
+                name
+            )
+        ]
+
+    def task_archived(self, id):
+        """Return whether the task of the given ID has been archived."""
+        return bool(self._execute(
+            'SELECT 1 FROM archived_task WHERE id = ?', id).fetchone())
+
+    def _insert_archived(self, name, rows):
+        self._db.executemany(
+            'INSERT INTO archived_task '
+            '(estimator, id, estimate, actual, date) VALUES (?, ?, ?, ?, ?)',
+            ([name] + list(row) for row in rows)
+        )
+
+    def add_archived_tasks(self, name, tasks):
+        """Add ``ArchivedTask`` objects to the named estimator's archive."""
+        self.assert_estimator_exist(name)
+        self._insert_archived(name, (t.to_row() for t in tasks))
+        self.mark_dirty()
+
+    def archive_tasks(self, before):
+        """Archive completed tasks estimated before the given date.
+
+        The tasks are moved to the archive table, and removed from
+        their estimators if these are in memory.  Return the number
+        of tasks archived.
+        """
+        count = 0
+        for name, in self._execute(
+                'SELECT name FROM estimator ORDER BY rowid').fetchall():
+            rows = self._execute(
+                'SELECT rowid, id, estimate, actual, date FROM task '
+                'WHERE estimator = ? AND completed AND date < ? '
+                'ORDER BY rowid',
+                name, before.toordinal()
+            ).fetchall()
+            if not rows:
+                continue
+            self._insert_archived(name, (row[1:] for row in rows))
+            self._db.executemany(
+                'DELETE FROM task WHERE rowid = ?',
+                ((row[0],) for row in rows)
+            )
+            for row in rows:
+                self._rows.pop(row[0], None)
+            estimator = self._loaded_estimator(name)
+            if estimator is not None:
+                estimator.archive_tasks(before)
+            count += len(rows)
+        if count:
+            self.mark_dirty()
+        return count
+
+    @property
+    def holidays(self):
+        """Return the holidays in this store as a ``HolidayIndex``."""
+        if self._holidays is None:
+            self._holidays = holiday.HolidayIndex(
+                datetime.date.fromordinal(x) for x, in
+                self._execute('SELECT date FROM holiday')
+            )
+        return self._holidays
+
+    @property
+    def holiday_rules(self):
+        """Return the recurring holiday rules in this store as a list."""
+        if self._holiday_rules is None:
+            self._holiday_rules = [
+                holiday.parse_rule(x) for x, in
+                self._execute('SELECT spec FROM holiday_rule ORDER BY rowid')
+            ]
+        return self._holiday_rules
+
+    def add_holiday(self, date):
+        """Add a holiday, if not already present."""
+        if date not in self.holidays:
+            self._execute(
+                'INSERT INTO holiday (date) VALUES (?)', date.toordinal())
+            self.holidays.add(date)
+            self.mark_dirty()
+
+    def remove_holiday(self, date):
+        """Remove a holiday, if present."""
+        if date in self.holidays:
+            self._execute(
+                'DELETE FROM holiday WHERE date = ?', date.toordinal())
+            self.holidays.remove(date)
+            self.mark_dirty()
+
+    def add_holiday_rule(self, rule):
+        """Add a recurring holiday rule, if not already present."""
+        if rule not in self.holiday_rules:
+            self._execute('INSERT INTO holiday_rule (spec) VALUES (?)', str(rule))
+            self.holiday_rules.append(rule)
+            self.mark_dirty()
+
+    def remove_holiday_rule(self, rule):
+        """Remove a recurring holiday rule, if present."""
+        if rule in self.holiday_rules:
+            self._execute('DELETE FROM holiday_rule WHERE spec = ?', str(rule))
+            self.holiday_rules.remove(rule)
+            self.mark_dirty()
+
+    def tasks(self, estimators=None, ids=None, projects=None,
+            completed=None, priority=None):
+        """Yield tasks from the data store.
+
+        Tasks are yielded as ``(estimator, task)`` pairs.  The filters
+        are those of ``Store.tasks``, and are evaluated by the
+        database, which reads only the rows of the tasks yielded.
+        """
+        where, args = [], []
+        for column, values in (
+            ('estimator', estimators), ('id', ids), ('project', projects)
+        ):
+            if values is not None:
+                values = list(values)
+                where.append('task.{} IN ({})'.format(
+                    column, ', '.join('?' * len(values))))
+                args.extend(values)
+        if completed is not None:
+            where.append('task.completed = ?')
+            args.append(int(bool(completed)))
+        if priority is not None:
+            where.append('(task.priority IS NULL OR task.priority <= ?)')
+            args.append(priority)
+        rows = self._db.execute(
+            'SELECT task.estimator, task.rowid, {} FROM task '
+            'JOIN estimator ON task.estimator = estimator.name {} '
+            'ORDER BY estimator.rowid, task.rowid'.format(
+                ', '.join('task.' + column for column in _task_columns),
+                'WHERE ' + ' AND '.join(where) if where else ''),
+            args
+        ).fetchall()
+        for row in rows:
+            yield self.get_estimator(row[0]), self._task(row[1:])
+
+    def _task_rowid(self, id):
+        row = self._execute('SELECT rowid FROM task WHERE id = ?', id).fetchone()
+        return row[0] if row else None
+
+    def _get_task_row(self, id):
+        """Return the ``(estimator, task, rowid)`` of the given ID."""
+        row = self._execute(
+            'SELECT estimator, rowid, {} FROM task WHERE id = ?'.format(
+                ', '.join(_task_columns)),
+            id
+        ).fetchone()
+        if not row:
+            raise UserWarning('Task does not exist: {}'.format(id))
+        return self.get_estimator(row[0]), self._task(row[1:]), row[1]
+
+    def get_task(self, id):
+        """Retrieve the task of the given ID.
+
+        Return an ``(estimator, task)`` pair.  Only the row of the
+        task is read.
+        """
+        return self._get_task_row(id)[:2]
+
+    def task_exists(self, id):
+        """Return whether the task of the given id exists in the data store."""
+        return self._task_rowid(id) is not None
+
+    def _insert_task(self, name, task):
+        try:
+            cursor = self._execute(
+                'INSERT INTO task (estimator, {}) VALUES (?, {})'.format(
+                    ', '.join(_task_columns),
+                    ', '.join('?' * len(_task_columns))),
+                name, *_task_to_row(task)
+            )
+        except sqlite3.IntegrityError:
+            raise UserWarning('Task exists: {}'.format(task.id))
+        return cursor.lastrowid
+
+    def add_task(self, name, task):
+        """Add a task to the named estimator.
+
+        Raise ``UserWarning`` if a task with the same ID exists or has
+        been archived.  The estimator is not loaded if it has not been
+        already.
+        """
+        self.assert_task_not_exist(task.id)
+        if task.id is not None and self.task_archived(task.id):
+            raise UserWarning('Task archived: {}'.format(task.id))
+        self.assert_estimator_exist(name)
+        rowid = self._insert_task(name, task)
+        estimator = self._loaded_estimator(name)
+        if estimator is not None:
+            self._rows[rowid] = estimator.add_task(task)
+        self.mark_dirty()
+
+    def remove_task(self, id):
+        """Remove the task of the given ID.
+
+        Return the ``(estimator, task)`` pair that was removed.
+        """
+        estimator, task, rowid = self._get_task_row(id)
+        self._execute('DELETE FROM task WHERE rowid = ?', rowid)
+        del self._rows[rowid]
+        if self._loaded_estimator(estimator.name) is not None:
+            estimator.remove_task(task)
+        self.mark_dirty()
+        return estimator, task
+
+    def move_task(self, id, name):
+        """Move the task of the given ID to the named estimator."""
+        old_estimator, task, rowid = self._get_task_row(id)
+        estimator = self.get_estimator(name)
+        if old_estimator is not estimator:
+            self._execute(
+                'UPDATE task SET estimator = ? WHERE rowid = ?', name, rowid)
+            if self._loaded_estimator(old_estimator.name) is not None:
+                old_estimator.remove_task(task)
+            if self._loaded_estimator(name) is not None:
+                self._rows[rowid] = estimator.add_task(task)
+            self.mark_dirty()
+
+    def update_task(self, id, **kwargs):
+        """Update attributes of the task of the given ID.
+
+        Only the row of the task is read and written.
+        """
+        estimator, task, rowid = self._get_task_row(id)
+        attrs = [attr for attr in _task_columns if attr in kwargs]
+        if attrs:
+            self._execute(
+                'UPDATE task SET {} WHERE rowid = ?'.format(
+                    ', '.join('{} = ?'.format(attr) for attr in attrs)),
+                *[_to_db(attr, kwargs[attr]) for attr in attrs] + [rowid]
+            )
+        if self._loaded_estimator(estimator.name) is not None:
+            estimator.update_task(task, **kwargs)
+        else:
+            for attr, value in kwargs.viewitems():
+                setattr(task, attr, value)
+        self.mark_dirty()
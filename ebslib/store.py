@@ -15,16 +15,39 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import datetime
+import gzip
 import json
-import os.path
+import os
+import re
+import tempfile
 
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+from . import codec
 from . import estimator
+from . import holiday
+from . import lock as _lock
+from . import task as _task
+from . import tasktable
 
 
 def _serialise(obj):
     if isinstance(obj, datetime.date):
         return dict(__date__=True, ymd=[obj.year, obj.month, obj.day])
-    return {attr: getattr(obj, attr) for attr in obj.__slots__}
+    if isinstance(obj, (holiday.HolidayIndex, tasktable.TaskTable)):
+        return list(obj)
+    if isinstance(obj, holiday.Rule):
+        return str(obj)
+    # subclasses of estimators (e.g. lazily loaded estimators) and rows
+    # of task tables serialise their fields, as estimators and tasks do
+    fields = getattr(obj, 'fields', obj.__slots__)
+    return {attr: getattr(obj, attr) for attr in fields}
 
 
 def _object_hook(dict):
@@ -33,42 +56,608 @@ def _object_hook(dict):
     if 'estimators' in dict:
         dict['estimators'] = \
             [estimator.Estimator.from_dict(x) for x in dict['estimators']]
+    if 'holidays' in dict:
+        dict['holidays'] = holiday.HolidayIndex(dict['holidays'])
+    if 'holiday_rules' in dict:
+        dict['holiday_rules'] = \
+            [holiday.parse_rule(x) for x in dict['holiday_rules']]
     return dict
 
 
+def _decode_tree(value):
+    """Apply ``_object_hook`` to the dicts of a decoded JSON value.
+
+    Dicts are given to the hook innermost first, as ``json`` would
+    give them when decoding with the hook.
+    """
+    if isinstance(value, dict):
+        return _object_hook(
+            {k: _decode_tree(v) for k, v in value.iteritems()})
+    if isinstance(value, list):
+        return [_decode_tree(x) for x in value]
+    return value
+
+
+def _dumps(value):
+    # json.dumps encodes in C; json.dump would encode in Python
+    return json.dumps(value, separators=(',', ':'))
+
+
 def write(fp, data):
-    """Write the data to the given file."""
-    json.dump(data, fp, default=_serialise)
+    """Write the data to the given file.
+
+    Store documents (dicts) are encoded by ``codec.encode``; other
+    data must be plain JSON values.  A document is written a member at
+    a time, beginning with the ``codec`` key, and its estimators one at
+    a time, so that the text of the whole document is never held in
+    memory.
+    """
+    if not isinstance(data, dict):
+        fp.write(_dumps(data))
+        return
+    doc = codec.encode(
+        {k: v for k, v in data.viewitems() if k != 'estimators'})
+    fp.write('{"codec":' + _dumps(doc.pop('codec')))
+    for key, value in doc.viewitems():
+        fp.write(',' + _dumps(key) + ':' + _dumps(value))
+    if 'estimators' in data:
+        fp.write(',"estimators":[')
+        for i, e in enumerate(data['estimators']):
+            if i:
+                fp.write(',')
+            fp.write(_dumps(codec.encode_estimator(e)))
+        fp.write(']')
+    fp.write('}')
+
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+_chunk_size = 1 << 16
+
+
+class _JSONReader(object):
+    """Decode JSON text as it is read from a file.
+
+    Values are decoded one at a time by the C decoder of ``json``;
+    only the text of the value being decoded is held.
+    """
+
+    __slots__ = ('_fp', '_text', '_pos', '_last')
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, fp):
+        self._fp = fp
+        self._text = ''
+        self._pos = 0
+        self._last = 0
+
+    def _read(self):
+        """Read more text, and return whether there was any.
+
+        At least as much text is read as is held, so that a long value
+        is read in a number of reads logarithmic in its length, and as
+        the last value decoded, so that values of similar lengths (the
+        estimators of a store) are usually decoded at the first try.
+        """
+        chunk = self._fp.read(
+            max(_chunk_size, len(self._text) - self._pos, self._last))
+        if not chunk:
+            return False
+        self._text = self._text[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """Return the next character other than whitespace.
+
+        Return an empty string at the end of the file.
+        """
+        while True:
+            self._pos = _whitespace.match(self._text, self._pos).end()
+            if self._pos < len(self._text):
+                return self._text[self._pos]
+            if not self._read():
+                return ''
+
+    def take(self, chars):
+        """Consume the next character, which must be one of ``chars``."""
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError('Expecting one of {!r}'.format(chars))
+        self._pos += 1
+        return c
+
+    def value(self):
+        """Decode the next value."""
+        self.peek()
+        if len(self._text) - self._pos < self._last:
+            self._read()  # rather than fail to decode a partial value
+        while True:
+            try:
+                value, end = \
+                    self._decoder.raw_decode(self._text, self._pos)
+            except ValueError:
+                if not self._read():
+                    raise
+                continue
+            # only a number may continue in the text not yet read
+            if end == len(self._text) and self._text[end - 1].isdigit() \
+                    and self._read():
+                continue
+            self._last = end - self._pos
+            self._pos = end
+            return value
+
+    def items(self):
+        """Decode the items of the next value, an array, one at a time."""
+        self.take('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.take(',]') == ']':
+                return
+
+    def end(self):
+        """Check that nothing but whitespace remains."""
+        if self.peek():
+            raise ValueError('Extra data')
 
 
 def read(fp):
-    """Read data from the given file."""
-    return json.load(fp, object_hook=_object_hook)
+    """Read data from the given file.
+
+    The text is decoded as it is read.  The estimators of documents
+    written by ``write``, which begin with the ``codec`` key, are
+    decoded one at a time, so that neither the text nor the plain JSON
+    values of the whole document are held in memory.  Data written by
+    the generic encoder (without the ``codec`` key) are also read, and
+    are decoded whole, as are other documents.
+    """
+    reader = _JSONReader(fp)
+    if reader.peek() != '{':
+        doc = reader.value()
+        reader.end()
+        return doc
+    doc = {}
+    estimators = None
+    reader.take('{')
+    if reader.peek() == '}':
+        reader.take('}')
+    else:
+        while True:
+            key = reader.value()
+            reader.take(':')
+            if key == 'estimators' and 'codec' in doc \
+                    and reader.peek() == '[':
+                estimators = map(codec.decode_estimator, reader.items())
+            else:
+                doc[key] = reader.value()
+            if reader.take(',}') == '}':
+                break
+    reader.end()
+    if 'codec' not in doc:
+        return _decode_tree(doc)
+    data = codec.decode(doc)
+    if estimators is not None:
+        data['estimators'] = estimators
+    return data
+
+
+_compression_magic = (('gzip', '\x1f\x8b'), ('xz', '\xfd7zXZ\x00'))
+_compression_extensions = (('gzip', '.gz'), ('xz', '.xz'))
+
+
+def detect_compression(filename):
+    """Detect the compression of the named file.
+
+    Compression is detected from the magic bytes of an existing file,
+    otherwise from the file name extension.  Return ``'gzip'``,
+    ``'xz'`` or ``None``.
+    """
+    try:
+        with open(filename, 'rb') as fp:
+            magic = fp.read(6)
+    except IOError:
+        magic = ''
+    for compression, prefix in _compression_magic:
+        if magic.startswith(prefix):
+            return compression
+    if not magic:
+        for compression, extension in _compression_extensions:
+            if filename.endswith(extension):
+                return compression
+    return None
+
+
+def _stream(fp, mode, compression, level=None):
+    """Wrap a file object in a (de)compressing stream."""
+    if compression == 'gzip':
+        if level is None:
+            return gzip.GzipFile(fileobj=fp, mode=mode)
+        return gzip.GzipFile(fileobj=fp, mode=mode, compresslevel=level)
+    if compression == 'xz':
+        if lzma is None:
+            raise UserWarning('xz compression requires the lzma module')
+        return lzma.LZMAFile(fp, mode=mode, preset=level)
+    raise UserWarning('Unknown compression: {}'.format(compression))
+
+
+def read_file(filename, compression=None):
+    """Read data from the named file, decompressing it as it is read."""
+    with open(filename, 'rb') as fp:
+        if compression is None:
+            return read(fp)
+        with _stream(fp, 'rb', compression) as stream:
+            return read(stream)
+
+
+def write_file(filename, data, compression=None, level=None):
+    """Atomically write data to the named file, compressing as it is written.
+
+    ``level``
+      Compression level; the default of the compressor if not given.
+    """
+    def writer(fp):
+        if compression is None:
+            return write(fp, data)
+        with _stream(fp, 'wb', compression, level) as stream:
+            write(stream, data)
+    atomic_write(filename, writer)
+
+
+def file_version(filename):
+    """Return a token identifying the version of the named file.
+
+    Files are replaced, rather than modified, when stores are written,
+    so the token changes whenever a new version of a store is
+    committed.  Return ``None`` if the file does not exist.
+    """
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime, st.st_ctime
 
 
-class Store(object):
+def atomic_write(filename, writer):
+    """Atomically replace the named file.
+
+    ``writer`` is called with a temporary file in the same directory,
+    which is flushed to disk and then renamed over ``filename``.  A
+    crash part way through leaves the original file intact.  The mode
+    of an existing file is preserved.
+    """
+    filename = os.path.realpath(filename)
+    dirname, basename = os.path.split(filename)
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.' + basename + '.')
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            writer(fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        try:
+            mode = os.stat(filename).st_mode & 0o7777
+        except OSError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp, mode)
+        os.rename(tmp, filename)
+    except:
+        os.unlink(tmp)
+        raise
+    try:
+        dirfd = os.open(dirname, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dirfd)  # make the rename durable
+    except OSError:
+        pass
+    finally:
+        os.close(dirfd)
+
+
+_sqlite_magic = 'SQLite format 3\x00'
+_sqlite_extensions = ('.db', '.sqlite', '.sqlite3')
+_sections_magic = 'ebs-sections 1\n'
+_columns_magic = 'EBSCOLS\x00'
+
+formats = ('json', 'journal', 'sqlite', 'sections', 'columnar', 'sharded')
+"""The store formats understood by ``open_store``."""
+
+
+def detect_format(filename):
+    """Detect the format of the store at the given path.
+
+    The format is detected from the magic bytes of an existing file,
+    otherwise from the file name extension.  A JSON store with a
+    journal is a journaled store, and a directory is a sharded store.
+    Default to ``'json'``.
+    """
+    if os.path.isdir(filename):
+        return 'sharded'
+    try:
+        with open(filename, 'rb') as fp:
+            magic = fp.read(max(len(_sqlite_magic), len(_sections_magic)))
+    except IOError:
+        magic = ''
+    if magic.startswith(_sqlite_magic):
+        return 'sqlite'
+    if magic.startswith(_sections_magic):
+        return 'sections'
+    if magic.startswith(_columns_magic):
+        return 'columnar'
+    if not magic and filename.endswith(_sqlite_extensions):
+        return 'sqlite'
+    if os.path.exists(filename + '.journal'):
+        return 'journal'
+    return 'json'
+
+
+def open_store(
+    filename, format=None, journal=False, journal_limit=None,
+    compression_level=None, readonly=False, lock_timeout=None
+):
+    """Open the store at the given path.
+
+    ``format``
+      One of ``formats``.  If not given, the format is detected by
+      ``detect_format``.
+    ``journal``
+      Whether to open JSON stores as journaled stores.
+    ``journal_limit``
+      Journal size, in bytes, at which a journaled store is compacted.
+    ``compression_level``
+      Level at which compressed JSON stores (and snapshots of
+      journaled stores) are compressed.
+    ``readonly``
+      Whether the store is opened only for reading.  Read-only stores
+      are not locked, and may not be modified.
+    ``lock_timeout``
+      Seconds to wait for the store's lock.
+    """
+    filename = os.path.expanduser(filename)
+    options = {'readonly': readonly}
+    if lock_timeout is not None:
+        options['lock_timeout'] = lock_timeout
+    format = format or detect_format(filename)
+    if format == 'json' and journal:
+        format = 'journal'
+    if format == 'sqlite':
+        from . import sqlstore
+        return sqlstore.SQLiteStore(filename)
+    if format == 'journal':
+        from . import journal
+        if journal_limit is None:
+            journal_limit = journal.DEFAULT_LIMIT
+        return journal.JournalStore(
+            filename, limit=journal_limit,
+            compression_level=compression_level, **options
+        )
+    if format == 'sections':
+        from . import sectionstore
+        return sectionstore.SectionStore(filename, **options)
+    if format == 'columnar':
+        from . import colstore
+        return colstore.ColumnStore(filename, **options)
+    if format == 'sharded':
+        from . import shardstore
+        return shardstore.ShardedStore(filename, **options)
+    if format == 'json':
+        return Store(
+            filename, compression_level=compression_level, **options)
+    raise UserWarning('Unknown store format: {}'.format(format))
+
+
+def copy(src, dst):
+    """Copy the contents of one store into another."""
+    for e in src.estimators:
+        dst.add_estimator(e)
+        archived = src.archived_tasks(e.name)
+        if archived:
+            dst.add_archived_tasks(e.name, archived)
+    for date in src.holidays:
+        dst.add_holiday(date)
+    for rule in src.holiday_rules:
+        dst.add_holiday_rule(rule)
+
+
+def _include_task(estimator, task,
+    estimators=None, ids=None, projects=None, completed=None, priority=None
+):
+    """Determine whether a task matches the ``tasks()`` filters."""
+    return (
+        (estimators is None or estimator.name in estimators)
+        and (ids is None or task.id in ids)
+        and (projects is None or task.project in projects)
+        and (completed is None or bool(task.completed) == completed)
+        and (priority is None or task.priority <= priority)
+    )
+
+
+class AbstractStore(object):
+    """Operations common to all kinds of store.
+
+    A store is a context manager; the store is locked when the
+    context is entered, and modifications are written and the store
+    unlocked when the context is left.  Data should be modified only
+    by the mutation methods of the store (``add_task``,
+    ``remove_estimator``, etc.).
+
+    Subclasses provide the ``estimators``, ``holidays`` and
+    ``holiday_rules`` properties, the ``get_*``, ``*_exists`` and
+    ``tasks`` queries, the mutation methods, ``flush`` and ``discard``,
+    and may provide ``lock`` and ``unlock``.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        self.lock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        try:
+            self.flush()
+        finally:
+            self.unlock()
+
+    def lock(self):
+        """Lock the store against other processes.  Do nothing by default."""
+
+    def unlock(self):
+        """Release the lock taken by ``lock``."""
+
+    def holiday_calendar(self):
+        """Return a ``HolidayCalendar`` of holidays and holiday rules."""
+        return holiday.HolidayCalendar(self.holidays, self.holiday_rules)
+
+    def archived_tasks(self, name):
+        """Return the archived tasks of the named estimator.
+
+        Stores without an archive have no archived tasks.
+        """
+        return []
+
+    def task_archived(self, id):
+        """Return whether the task of the given ID has been archived."""
+        return False
+
+    def archive_tasks(self, before):
+        """Archive completed tasks estimated before the given date."""
+        raise UserWarning('This store does not support archiving.')
+
+    def add_archived_tasks(self, name, tasks):
+        """Add ``ArchivedTask`` objects to the named estimator's archive."""
+        raise UserWarning('This store does not support archiving.')
+
+    def add_tasks(self, name, tasks):
+        """Add many tasks to the named estimator, by ``add_task``."""
+        for task in tasks:
+            self.add_task(name, task)
+
+    def assert_estimator_exist(self, name):
+        if not self.estimator_exists(name):
+            raise UserWarning('Estimator does not exist: {}'.format(name))
+
+    def assert_estimator_not_exist(self, name):
+        if self.estimator_exists(name):
+            raise UserWarning('Estimator exists: {}'.format(name))
+
+    def assert_task_exist(self, id):
+        if not self.task_exists(id):
+            raise UserWarning('Task does not exist: {}'.format(id))
+
+    def assert_task_not_exist(self, id):
+        if self.task_exists(id):
+            raise UserWarning('Task exists: {}'.format(id))
+
+
+class Store(AbstractStore):
     """A data store.
 
     A store is a context manager that reads data from a file and
-    writes its data back to that file.
+    writes its data back to that file, if the data were modified.
 
     Data is accessed via the ``data`` attribute.  It may be reset by
     invoking ``del store.data``.  The ``data`` attribute may not be
     set.
+
+    Data should be modified only by the mutation methods of the store
+    (``add_task``, ``remove_estimator``, etc.), which record that the
+    data have changed and keep the store's indexes of estimators by
+    name and tasks by ID up to date.  Unmodified data are never
+    written back.
+
+    Tasks without an ID are not indexed.  As in SQLite stores, any
+    number of tasks may lack an ID, and ``task_exists(None)`` is false.
+
+    A store file may be compressed with gzip or xz; the compression
+    is detected by ``detect_compression`` and kept when the store is
+    written.  ``compression_level`` gives the level to compress at.
+
+    While the store is used as a context manager it holds an
+    exclusive lock on ``<filename>.lock``, so that concurrent writers
+    take turns rather than overwriting each other's modifications.
+    ``lock_timeout`` gives the seconds to wait for the lock.
+
+    Completed tasks may be moved to an archive, which is kept in a
+    separate file, ``<filename>.archive``, and read only when used.
+    The velocities of archived tasks remain in the velocity summaries
+    of their estimators, so estimates and statistics do not need the
+    archive.
+
+    Stores opened ``readonly`` take no lock and never wait.  Each
+    write commits a new version of the store by atomically replacing
+    the file, so readers always see a complete version: the latest
+    when they read it, which stays readable until they are done with
+    it, however many versions are committed meanwhile.  Data that are
+    no longer the latest may be discarded with ``refresh``.
     """
 
-    __slots__ = ('_filename', '_data')
+    __slots__ = (
+        '_filename', '_data', '_dirty', '_estimator_index', '_task_index',
+        '_compression', '_compression_level', '_readonly', '_lock',
+        '_lock_timeout', '_version', '_archive', '_archived_ids',
+        '_archive_dirty',
+    )
 
-    def __init__(self, filename):
+    def __init__(
+        self, filename, compression_level=None,
+        readonly=False, lock_timeout=_lock.DEFAULT_TIMEOUT
+    ):
         self._data = None
+        self._dirty = False
+        self._estimator_index = None
+        self._task_index = None
         self._filename = os.path.expanduser(filename)
+        self._compression = None
+        self._compression_level = compression_level
+        self._readonly = readonly
+        self._lock = _lock.FileLock(self._filename + '.lock')
+        self._lock_timeout = lock_timeout
+        self._version = None
+        self._archive = None
+        self._archived_ids = None
+        self._archive_dirty = False
+
+    @property
+    def filename(self):
+        """The name of the store file."""
+        return self._filename
+
+    @property
+    def readonly(self):
+        """Whether the store may not be modified."""
+        return self._readonly
+
+    def lock(self):
+        """Lock the store file, unless the store is read-only.
+
+        Data read before the lock was taken are stale if a new version
+        of the store has been committed since, and are then discarded
+        unless modified.
+        """
+        if self._readonly or self._lock.locked:
+            return
+        self._lock.acquire(
+            exclusive=not self._readonly, timeout=self._lock_timeout)
+        self.refresh()
+
+    def unlock(self):
+        self._lock.release()
 
     @property
     def data(self):
         if self._data is None:
+            self._reset_indexes()
+            self._version = self._disk_version()
+            self._compression = detect_compression(self._filename)
             try:
-                with open(self._filename) as fp:
-                    self._data = read(fp)
+                self._data = read_file(self._filename, self._compression)
             except (IOError, ValueError):
                 self._data = {}
         return self._data
@@ -76,17 +665,168 @@ class Store(object):
     @data.deleter
     def data(self):
         self._data = None
+        self._dirty = False
+        self._reset_indexes()
+        self._reset_archive()
+
+    def _reset_archive(self):
+        self._archive = None
+        self._archived_ids = None
+        self._archive_dirty = False
+
+    @property
+    def archive_filename(self):
+        return self._filename + '.archive'
+
+    @property
+    def archive(self):
+        """Return the archive, as lists of ``ArchivedTask`` by name."""
+        if self._archive is None:
+            filename = self.archive_filename
+            try:
+                rows = read_file(filename, detect_compression(filename))
+            except (IOError, ValueError):
+                rows = []
+            self._archive = {
+                name: [_task.ArchivedTask.from_row(row) for row in tasks]
+                for name, tasks in rows
+            }
+        return self._archive
+
+    def _flush_archive(self):
+        """Write the archive if it has been modified."""
+        if self._archive_dirty:
+            rows = [
+                [name, [t.to_row() for t in tasks]]
+                for name, tasks in sorted(self._archive.viewitems())
+            ]
+            write_file(
+                self.archive_filename, rows,
+                self._compression, self._compression_level
+            )
+            self._archive_dirty = False
+
+    def archived_tasks(self, name):
+        return self.archive.get(name, [])
+
+    def task_archived(self, id):
+        if self._archived_ids is None:
+            self._archived_ids = set(
+                t.id for tasks in self.archive.viewvalues() for t in tasks)
+        return id in self._archived_ids
+
+    def archive_tasks(self, before):
+        """Archive completed tasks estimated before the given date.
+
+        Archived tasks are removed from their estimators; they are no
+        longer listed and their IDs may not be reused.  Return the
+        number of tasks archived.
+        """
+        count = 0
+        for estimator in self.estimators:
+            archived = estimator.archive_tasks(before)
+            if archived:
+                self.add_archived_tasks(estimator.name, archived)
+                if self._task_index is not None:
+                    for t in archived:
+                        self._task_index.pop(t.id, None)
+                count += len(archived)
+        return count
+
+    def add_archived_tasks(self, name, tasks):
+        self.archive.setdefault(name, []).extend(tasks)
+        self._archived_ids = None
+        self._archive_dirty = True
+        self.mark_dirty()
+
+    def _reset_indexes(self):
+        self._estimator_index = None
+        self._task_index = None
+
+    def _index_tasks(self, estimator):
+        """Add the tasks of the estimator to the task index."""
+        for task in estimator.tasks:
+            if task.id is not None:
+                self._task_index[task.id] = estimator, task
+
+    @property
+    def _estimators(self):
+        """Return the index of estimators by name."""
+        if self._estimator_index is None:
+            estimators = self.estimators  # loading data resets indexes
+            self._estimator_index = {e.name: e for e in estimators}
+        return self._estimator_index
+
+    @property
+    def _tasks(self):
+        """Return the index of ``(estimator, task)`` pairs by task ID.
+
+        The task index is built separately from the estimator index,
+        so that looking up an estimator does not require its tasks.
+        """
+        if self._task_index is None:
+            estimators = self._estimators.values()
+            self._task_index = {}
+            for estimator in estimators:
+                self._index_tasks(estimator)
+        return self._task_index
+
+    @property
+    def dirty(self):
+        """Whether the data have been modified since last written."""
+        return self._dirty
+
+    def _disk_version(self):
+        """Return a token identifying the version of the store on disk."""
+        return file_version(self._filename)
+
+    def changed_on_disk(self):
+        """Return whether a new version of the store has been committed.
+
+        Only versions committed since the data were read are
+        considered; if the data have not been read, return false.
+        """
+        return self._data is not None \
+            and self._disk_version() != self._version
+
+    def refresh(self):
+        """Discard the data if a new version has been committed.
+
+        Modified data are never discarded.  Return whether the data
+        were discarded.
+        """
+        if self._dirty or not self.changed_on_disk():
+            return False
+        del self.data
+        return True
+
+    def mark_dirty(self):
+        """Record that the data have been modified.
+
+        Raise ``UserWarning`` if the store is read-only.
+        """
+        if self._readonly:
+            raise UserWarning('Store is read-only: {}'.format(self._filename))
+        self._dirty = True
 
     def flush(self):
-        if self._data is not None:
-            with open(self._filename, 'w') as fp:
-                write(fp, self._data)
+        """Write the data to the file if they have been modified."""
+        if self._data is not None and self._dirty:
+            self._flush_archive()  # before tasks leave the store file
+            self._commit()
+            self._dirty = False
+            self._version = self._disk_version()
 
-    def __enter__(self):
-        return self
+    def discard(self):
+        """Discard modifications not yet written."""
+        del self.data
 
-    def __exit__(self, exc_type, exc_value, exc_tb):
-        self.flush()
+    def _commit(self):
+        """Write the data, committing a new version of the store."""
+        write_file(
+            self._filename, self._data,
+            self._compression, self._compression_level
+        )
 
     @property
     def estimators(self):
@@ -97,35 +837,119 @@ class Store(object):
 
     @property
     def holidays(self):
-        """Return the holidays in this store as a sequence."""
+        """Return the holidays in this store as a ``HolidayIndex``."""
         if 'holidays' not in self.data:
-            self.data['holidays'] = []
+            self.data['holidays'] = holiday.HolidayIndex()
         return self.data['holidays']
 
+    @property
+    def holiday_rules(self):
+        """Return the recurring holiday rules in this store as a list."""
+        if 'holiday_rules' not in self.data:
+            self.data['holiday_rules'] = []
+        return self.data['holiday_rules']
+
+    def add_holiday(self, date):
+        """Add a holiday, if not already present."""
+        if date not in self.holidays:
+            self.holidays.add(date)
+            self.mark_dirty()
+
+    def remove_holiday(self, date):
+        """Remove a holiday, if present."""
+        if date in self.holidays:
+            self.holidays.remove(date)
+            self.mark_dirty()
+
+    def add_holiday_rule(self, rule):
+        """Add a recurring holiday rule, if not already present."""
+        if rule not in self.holiday_rules:
+            self.holiday_rules.append(rule)
+            self.mark_dirty()
+
+    def remove_holiday_rule(self, rule):
+        """Remove a recurring holiday rule, if present."""
+        if rule in self.holiday_rules:
+            self.holiday_rules.remove(rule)
+            self.mark_dirty()
+
     def get_estimator(self, name):
         """Get an estimator by name."""
-        self.assert_estimator_exist(name)
-        return [e for e in self.estimators if e.name == name][0]
+        try:
+            return self._estimators[name]
+        except KeyError:
+            raise UserWarning('Estimator does not exist: {}'.format(name))
 
     def estimator_exists(self, name):
         """Return whether the named estimator exists in the data store."""
-        return any(e.name == name for e in self.estimators)
+        return name in self._estimators
 
-    def assert_estimator_exist(self, name):
-        if not self.estimator_exists(name):
-            raise UserWarning('Estimator does not exist: {}'.format(name))
+    def add_estimator(self, estimator):
+        """Add an estimator.
 
-    def assert_estimator_not_exist(self, name):
-        if self.estimator_exists(name):
-            raise UserWarning('Estimator exists: {}'.format(name))
+        Raise ``UserWarning`` if an estimator of the same name exists.
+        """
+        self.assert_estimator_not_exist(estimator.name)
+        self.estimators.append(estimator)
+        self._estimators[estimator.name] = estimator
+        if self._task_index is not None:
+            self._index_tasks(estimator)
+        self.mark_dirty()
+
+    def remove_estimator(self, name):
+        """Remove the named estimator and return it."""
+        estimator = self.get_estimator(name)
+        self.estimators.remove(estimator)
+        del self._estimators[name]
+        if self.archive.pop(name, None):
+            self._archived_ids = None
+            self._archive_dirty = True
+        if self._task_index is not None:
+            for task in estimator.tasks:
+                self._task_index.pop(task.id, None)
+        self.mark_dirty()
+        return estimator
+
+    def add_event(self, name, event):
+        """Add an event to the named estimator."""
+        self.get_estimator(name).events.append(event)
+        self.mark_dirty()
 
-    def tasks(self):
+    def tasks(self, **kwargs):
         """Yield tasks from the data store.
 
-        Tasks are yielded as ``(estimator, task)`` pairs.
+        Tasks are yielded as ``(estimator, task)`` pairs.  They may be
+        filtered with the following keyword arguments:
+
+        ``estimators``, ``ids``, ``projects``
+          Collections of estimator names, task IDs or projects; only
+          tasks matching one of the members are yielded.
+        ``completed``
+          Yield only completed (if true) or pending (if false) tasks.
+        ``priority``
+          Yield only tasks without a priority, or with the given
+          priority or higher.
         """
-        for estimator in self.estimators:
-            for task in estimator.tasks:
+        if kwargs.get('ids') is not None:
+            # look the tasks up by ID, and visit them in store order
+            index = self._tasks
+            positions = {id(e): i for i, e in enumerate(self.estimators)}
+            pairs = sorted(
+                (index[x] for x in set(kwargs['ids']) if x in index),
+                key=lambda pair: (
+                    positions[id(pair[0])], pair[0].tasks.index(pair[1]))
+            )
+        else:
+            # visit only the tasks that the filters could match
+            names = kwargs.get('estimators')
+            pending = kwargs.get('completed') is False
+            pairs = (
+                (e, t) for e in self.estimators
+                if names is None or e.name in names
+                for t in (e.pending_tasks() if pending else e.tasks)
+            )
+        for estimator, task in pairs:
+            if _include_task(estimator, task, **kwargs):
                 yield estimator, task
 
     def get_task(self, id):
@@ -133,17 +957,78 @@ class Store(object):
 
         Return an ``(estimator, task)`` pair.
         """
-        self.assert_task_exist(id)
-        return [(e, t) for e, t in self.tasks() if t.id == id][0]
+        try:
+            return self._tasks[id]
+        except KeyError:
+            raise UserWarning('Task does not exist: {}'.format(id))
 
     def task_exists(self, id):
         """Return whether the task of the given id exists in the data store."""
-        return any(t.id == id for e, t in self.tasks())
+        return id in self._tasks
 
-    def assert_task_exist(self, id):
-        if not self.task_exists(id):
-            raise UserWarning('Task does not exist: {}'.format(id))
+    def add_task(self, name, task):
+        """Add a task to the named estimator.
 
-    def assert_task_not_exist(self, id):
-        if self.task_exists(id):
-            raise UserWarning('Task exists: {}'.format(id))
+        Raise ``UserWarning`` if a task with the same ID exists or has
+        been archived.
+        """
+        self.assert_task_not_exist(task.id)
+        if task.id is not None and self.task_archived(task.id):
+            raise UserWarning('Task archived: {}'.format(task.id))
+        estimator = self.get_estimator(name)
+        task = estimator.add_task(task)
+        if task.id is not None:
+            self._tasks[task.id] = estimator, task
+        self.mark_dirty()
+
+    def add_tasks(self, name, tasks):
+        """Add many tasks to the named estimator.
+
+        As for ``add_task``, but the tasks are checked before any is
+        added, and the estimator's velocity summary is sorted once.
+        The tasks are copied into a ``TaskTable`` unless given as one.
+        """
+        if not isinstance(tasks, tasktable.TaskTable):
+            tasks = tasktable.TaskTable(tasks)
+        index = self._tasks
+        ids = tasks.ids()
+        seen = set()
+        for id in ids:
+            if id is None:
+                continue
+            if id in index or id in seen:
+                raise UserWarning('Task exists: {}'.format(id))
+            if self.task_archived(id):
+                raise UserWarning('Task archived: {}'.format(id))
+            seen.add(id)
+        estimator = self.get_estimator(name)
+        for id, task in zip(ids, estimator.add_tasks(tasks)):
+            if id is not None:
+                index[id] = estimator, task
+        self.mark_dirty()
+
+    def remove_task(self, id):
+        """Remove the task of the given ID.
+
+        Return the ``(estimator, task)`` pair that was removed.
+        """
+        estimator, task = self.get_task(id)
+        estimator.remove_task(task)
+        del self._tasks[id]
+        self.mark_dirty()
+        return estimator, task
+
+    def move_task(self, id, name):
+        """Move the task of the given ID to the named estimator."""
+        old_estimator, task = self.get_task(id)
+        estimator = self.get_estimator(name)
+        if old_estimator is not estimator:
+            old_estimator.remove_task(task)
+            self._tasks[id] = estimator, estimator.add_task(task)
+            self.mark_dirty()
+
+    def update_task(self, id, **kwargs):
+        """Update attributes of the task of the given ID."""
+        estimator, task = self.get_task(id)
+        estimator.update_task(task, **kwargs)
+        self.mark_dirty()
@@ -19,6 +19,11 @@ from __future__ import division
 
 import datetime
 import functools
+import hashlib
+import json
+
+
+_setattr = object.__setattr__
 
 
 class NotCompletedError(Exception):
@@ -37,9 +42,15 @@ class Task(object):
 
     __slots__ = frozenset([
         'id', 'project', 'priority', 'description',
-        'estimate', 'date', 'completed', 'actual',
+        'estimate', 'date', 'completed', 'actual', '_fingerprint',
     ])
 
+    fields = (
+        'id', 'project', 'description', 'priority',
+        'estimate', 'date', 'completed', 'actual',
+    )
+    """The attributes of a task, in the order of ``__init__`` arguments."""
+
     @classmethod
     def from_dict(cls, data):
         return cls(**data)
@@ -70,14 +81,22 @@ class Task(object):
         ``project``
           The project to which the task belongs.
         """
-        self.id = id
-        self.description = description
-        self.priority = priority
-        self.estimate = estimate
-        self.date = date
-        self.actual = actual
-        self.completed = bool(actual) if completed is None else completed
-        self.project = project
+        # set the slots directly, bypassing __setattr__
+        _setattr(self, 'id', id)
+        _setattr(self, 'description', description)
+        _setattr(self, 'priority', priority)
+        _setattr(self, 'estimate', estimate)
+        _setattr(self, 'date', date)
+        _setattr(self, 'actual', actual)
+        _setattr(self, 'completed',
+            bool(actual) if completed is None else completed)
+        _setattr(self, 'project', project)
+        _setattr(self, '_fingerprint', None)
+
+    def __setattr__(self, name, value):
+        # every field is fingerprinted; forget the cached fingerprint
+        _setattr(self, name, value)
+        _setattr(self, '_fingerprint', None)
 
     @property
     def velocity(self):
@@ -89,6 +108,83 @@ class Task(object):
             raise NotCompletedError
         return self.estimate / self.actual
 
+    @property
+    def fingerprint(self):
+        """Return a digest of the task's attributes, as an integer.
+
+        Tasks with different fingerprints are not equal.  Strings are
+        compared as text and costs as numbers, so that tasks read
+        from a store and tasks made from command-line arguments have
+        the same fingerprint if equal.  The digest is computed when
+        first used, and again only after an attribute is set.
+        """
+        if self._fingerprint is None:
+            _setattr(self, '_fingerprint', self._compute_fingerprint())
+        return self._fingerprint
+
+    def _compute_fingerprint(self):
+        values = [getattr(self, attr) for attr in self.fields]
+        if self.date is not None:
+            values[_date_field] = self.date.toordinal()
+        for i in _cost_fields:
+            values[i] = float(values[i] or 0)
+        return int(hashlib.md5(json.dumps(values)).hexdigest(), 16)
+
+    def __eq__(self, other):
+        # rows of task tables have the same fields, and compare alike
+        if self is other:
+            return True
+        return getattr(other, 'fields', None) == self.fields and all(
+            getattr(self, attr) == getattr(other, attr)
+            for attr in self.fields
+        )
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+_date_field = Task.fields.index('date')
+_cost_fields = (Task.fields.index('estimate'), Task.fields.index('actual'))
+
+
+class ArchivedTask(object):
+    """A completed task that has been moved to the archive.
+
+    Only the ID of the task and the attributes its velocity is
+    computed from are kept.  Archived tasks are stored as rows of
+    ``[id, estimate, actual, date]``, the date as a day ordinal.
+    """
+
+    __slots__ = frozenset(['id', 'estimate', 'actual', 'date'])
+
+    completed = True
+
+    @classmethod
+    def from_task(cls, task):
+        return cls(task.id, task.estimate, task.actual, task.date)
+
+    @classmethod
+    def from_row(cls, row):
+        id, estimate, actual, date = row
+        if date is not None:
+            date = datetime.date.fromordinal(date)
+        return cls(id, estimate, actual, date)
+
+    def __init__(self, id=None, estimate=0, actual=0, date=None):
+        self.id = id
+        self.estimate = estimate
+        self.actual = actual
+        self.date = date
+
+    def to_row(self):
+        date = self.date.toordinal() if self.date is not None else None
+        return [self.id, self.estimate, self.actual, date]
+
+    @property
+    def velocity(self):
+        """Return the velocity for this task."""
+        return self.estimate / self.actual
+
     def __eq__(self, other):
         return type(self) == type(other) and all(
             getattr(self, attr) == getattr(other, attr)
@@ -98,6 +194,15 @@ class Task(object):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __repr__(self):
+        return '{!r}({})'.format(
+            type(self),
+            ', '.join(
+                '{}={!r}'.format(attr, getattr(self, attr))
+                for attr in self.__slots__
+            )
+        )
+
 
 @functools.total_ordering
 class Event(object):
@@ -112,6 +217,9 @@ class Event(object):
 
     __slots__ = frozenset(['date', 'cost', 'description'])
 
+    fields = ('date', 'cost', 'description')
+    """The attributes of an event, in the order of ``__init__`` arguments."""
+
     @classmethod
     def from_dict(cls, data):
         return cls(**data)
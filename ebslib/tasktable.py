@@ -0,0 +1,529 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Columnar task tables.
+
+A ``TaskTable`` is a sequence of tasks held as typed columns rather
+than as ``Task`` objects: costs in arrays of doubles, dates as day
+ordinals, priorities and project numbers in arrays of integers, and
+the completion flags in an array of bytes.  Projects are numbered,
+and descriptions are interned, so that each distinct string is held
+once.  A byte of null flags per row records which of the priority,
+estimate and actual cost are ``None``; the columns then hold a
+placeholder that filters treat as ``None`` is treated.  A date of
+``None`` is held as 0, which is not the ordinal of any date, and a
+project of ``None`` as -1.
+
+Items of a table are ``TaskRow`` views, which have the attributes of
+a ``Task`` and read and write the columns.  Views are made as they
+are needed, and a view is reused while it is in use elsewhere.
+Filters over the completion flags, projects and priorities are
+applied a column at a time, by the iterator functions of
+``itertools`` and ``operator``, without making views of the rows
+they reject.
+
+Rows are appended and removed through the ``Estimator`` methods.
+Removed rows are dropped from the sequence at once, and their storage
+is reclaimed by ``compact`` once they outnumber the rows in use.
+"""
+
+import array
+import collections
+import datetime
+import itertools
+import operator
+import weakref
+
+from . import task
+
+
+_NULL_PRIORITY, _NULL_ESTIMATE, _NULL_ACTUAL = 1, 2, 4
+"""Null flags of a row."""
+
+_NO_PRIORITY = -2 ** 31
+"""Priority column placeholder of rows without a priority.
+
+It is the least value of the column, so rows without a priority are
+selected by any priority threshold.
+"""
+
+
+def _number(value):
+    """Return integral costs as ints, as they were given."""
+    return int(value) if value.is_integer() else value
+
+
+def _date(ordinal):
+    return datetime.date.fromordinal(ordinal) if ordinal else None
+
+
+class TaskRow(object):
+    """A view of a row of a ``TaskTable``, with the attributes of a Task."""
+
+    __slots__ = frozenset(['_table', '_row', '__weakref__'])
+
+    fields = task.Task.fields
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    id = property(
+        lambda self: self._table._ids[self._row],
+        lambda self, value: self._table._ids.__setitem__(self._row, value),
+    )
+    project = property(
+        lambda self: self._table._project_name(
+            self._table._projects[self._row]),
+        lambda self, value: self._table._projects.__setitem__(
+            self._row, self._table._project_number(value)),
+    )
+    description = property(
+        lambda self: self._table._descriptions[self._row],
+        lambda self, value: self._table._descriptions.__setitem__(
+            self._row, self._table._intern(value)),
+    )
+    priority = property(
+        lambda self: self._table._get_null(
+            self._table._priorities, _NULL_PRIORITY, self._row),
+        lambda self, value: self._table._set_null(
+            self._table._priorities, _NULL_PRIORITY, self._row,
+            value, _NO_PRIORITY),
+    )
+    estimate = property(
+        lambda self: self._table._get_cost(
+            self._table._estimates, _NULL_ESTIMATE, self._row),
+        lambda self, value: self._table._set_null(
+            self._table._estimates, _NULL_ESTIMATE, self._row, value, 0),
+    )
+    date = property(
+        lambda self: _date(self._table._dates[self._row]),
+        lambda self, value: self._table._dates.__setitem__(
+            self._row, value.toordinal() if value else 0),
+    )
+    completed = property(
+        lambda self: bool(self._table._completed[self._row]),
+        lambda self, value: self._table._completed.__setitem__(
+            self._row, 1 if value else 0),
+    )
+    actual = property(
+        lambda self: self._table._get_cost(
+            self._table._actuals, _NULL_ACTUAL, self._row),
+        lambda self, value: self._table._set_null(
+            self._table._actuals, _NULL_ACTUAL, self._row, value, 0),
+    )
+
+    velocity = task.Task.__dict__['velocity']
+    fingerprint = property(task.Task.__dict__['_compute_fingerprint'])
+    __eq__ = task.Task.__dict__['__eq__']
+    __ne__ = task.Task.__dict__['__ne__']
+
+    def __repr__(self):
+        return '{}({})'.format(
+            type(self).__name__,
+            ', '.join(
+                '{}={!r}'.format(attr, getattr(self, attr))
+                for attr in self.fields
+            )
+        )
+
+
+class TaskTable(collections.MutableSequence):
+    """A sequence of tasks held as columns.
+
+    ``tasks``
+      Tasks to copy into the table.
+
+    Plain ``Task`` objects appended or inserted afterwards are kept,
+    and are the items of their rows, so that callers may go on using
+    them; they should then be modified only through ``update``.
+    """
+
+    _columns = (
+        'ids', 'descriptions', 'projects', 'priorities', 'estimates',
+        'actuals', 'dates', 'completed', 'nulls',
+    )
+    """The columns of a table, which hold a value for every row."""
+
+    min_garbage = 1024
+    """Number of removed rows below which storage is not reclaimed."""
+
+    def __init__(self, tasks=()):
+        self._ids = []
+        self._descriptions = []
+        self._projects = array.array('i')
+        self._priorities = array.array('i')
+        self._estimates = array.array('d')
+        self._actuals = array.array('d')
+        self._dates = array.array('i')
+        self._completed = array.array('B')
+        self._nulls = array.array('B')
+        self._order = array.array('l')
+        self._identity = True  # whether rows are in storage order
+        self._project_names = []
+        self._project_numbers = {}
+        self._strings = {}
+        self._objects = {}
+        self._object_rows = {}
+        self._views = {}  # weak references to views, by row
+        for t in tasks:
+            self._order.append(self._add(t))
+
+    @classmethod
+    def adopt(cls, tasks):
+        """Make a table of the tasks, keeping plain ``Task`` objects.
+
+        As with ``append``, the tasks are the items of their rows.
+        """
+        table = cls()
+        table._order.extend(array.array(
+            'l', (table._adopt(t) for t in tasks)))
+        return table
+
+    @classmethod
+    def from_records(cls, records):
+        """Make a table from records of the values of ``Task.fields``.
+
+        Dates are given as day ordinals.  Records may omit trailing
+        fields, which take the defaults of ``Task``.
+        """
+        table = cls()
+        for record in records:
+            record = list(record) + _defaults[len(record):]
+            if record[_completed] is None:
+                record[_completed] = bool(record[_actual])
+            table._order.append(table._add_values(*record))
+        return table
+
+    def records(self):
+        """Generate records of the values of ``Task.fields``.
+
+        Dates are given as day ordinals.
+        """
+        project_name = self._project_name
+        for row in self._order:
+            nulls = self._nulls[row]
+            yield [
+                self._ids[row],
+                project_name(self._projects[row]),
+                self._descriptions[row],
+                None if nulls & _NULL_PRIORITY else self._priorities[row],
+                None if nulls & _NULL_ESTIMATE
+                    else _number(self._estimates[row]),
+                self._dates[row] or None,
+                bool(self._completed[row]),
+                None if nulls & _NULL_ACTUAL
+                    else _number(self._actuals[row]),
+            ]
+
+    def _intern(self, s):
+        return s if s is None else self._strings.setdefault(s, s)
+
+    def _project_number(self, project):
+        if project is None:
+            return -1
+        if project not in self._project_numbers:
+            self._project_numbers[project] = len(self._project_names)
+            self._project_names.append(project)
+        return self._project_numbers[project]
+
+    def _project_name(self, number):
+        return self._project_names[number] if number >= 0 else None
+
+    def _get_null(self, column, flag, row):
+        """Return the value of a nullable column."""
+        return None if self._nulls[row] & flag else column[row]
+
+    def _get_cost(self, column, flag, row):
+        return None if self._nulls[row] & flag else _number(column[row])
+
+    def _set_null(self, column, flag, row, value, placeholder):
+        """Set the value of a nullable column, and its null flag."""
+        if value is None:
+            column[row] = placeholder
+            self._nulls[row] |= flag
+        else:
+            column[row] = value
+            self._nulls[row] &= ~flag
+
+    def _add_values(
+        self, id, project, description, priority,
+        estimate, date, completed, actual
+    ):
+        """Store the values of a new row; return the row."""
+        row = len(self._ids)
+        nulls = 0
+        if priority is None:
+            nulls |= _NULL_PRIORITY
+            priority = _NO_PRIORITY
+        if estimate is None:
+            nulls |= _NULL_ESTIMATE
+            estimate = 0
+        if actual is None:
+            nulls |= _NULL_ACTUAL
+            actual = 0
+        self._ids.append(id)
+        self._descriptions.append(self._intern(description))
+        self._projects.append(self._project_number(project))
+        self._priorities.append(priority)
+        self._estimates.append(estimate)
+        self._actuals.append(actual)
+        self._dates.append(date or 0)
+        self._completed.append(1 if completed else 0)
+        self._nulls.append(nulls)
+        return row
+
+    def _add(self, t):
+        date = t.date
+        return self._add_values(
+            t.id, t.project, t.description, t.priority, t.estimate,
+            date.toordinal() if date else None, t.completed, t.actual)
+
+    def _row(self, t):
+        """Return the row of the task, or ``None`` if not in the table."""
+        if isinstance(t, TaskRow):
+            return t._row if t._table is self else None
+        row = self._object_rows.get(id(t))
+        return row if row is not None and self._objects[row] is t else None
+
+    def _item(self, row):
+        obj = self._objects.get(row)
+        if obj is None:
+            ref = self._views.get(row)
+            obj = ref() if ref is not None else None
+            if obj is None:
+                obj = TaskRow(self, row)
+                self._views[row] = weakref.ref(obj)
+        return obj
+
+    def _forget(self, row):
+        obj = self._objects.pop(row, None)
+        if obj is not None:
+            del self._object_rows[id(obj)]
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._item(row) for row in self._order[i]]
+        return self._item(self._order[i])
+
+    def __iter__(self):
+        return itertools.imap(self._item, self._order)
+
+    def __setitem__(self, i, value):
+        if not isinstance(i, slice):
+            i = slice(i, i + 1 or None)
+            value = [value]
+        rows = []
+        for t in value:
+            row = self._row(t)
+            rows.append(self._adopt(t) if row is None else row)
+        kept = set(rows)
+        for row in self._order[i]:
+            if row not in kept:
+                self._forget(row)
+        self._order[i] = array.array('l', rows)
+        self._identity = False
+        self._reclaim()
+
+    def __delitem__(self, i):
+        rows = self._order[i] if isinstance(i, slice) else [self._order[i]]
+        for row in rows:
+            self._forget(row)
+        del self._order[i]
+        self._identity = False
+        self._reclaim()
+
+    def _reclaim(self):
+        """Compact the table if most of its storage is of removed rows."""
+        garbage = len(self._ids) - len(self._order)
+        if garbage >= self.min_garbage and garbage > len(self._order):
+            self.compact()
+
+    def compact(self):
+        """Reclaim the storage of removed rows.
+
+        The rows in use are stored afresh, in order.  Views of them
+        in use elsewhere are moved to the new rows, and views of
+        removed rows are given tables of their own, so that all views
+        keep their values.
+        """
+        if self._identity and len(self._ids) == len(self._order):
+            return
+        moved = array.array('l', [-1]) * len(self._ids)
+        for new, old in enumerate(self._order):
+            moved[old] = new
+        views = [
+            (old, view) for old, view in (
+                (old, ref()) for old, ref in self._views.viewitems())
+            if view is not None
+        ]
+        for old, view in views:
+            if moved[old] < 0:
+                view._table = TaskTable([view])
+                view._row = 0
+        for name in self._columns:
+            values = self._column(name)
+            column = getattr(self, '_' + name)
+            setattr(self, '_' + name, list(values) if isinstance(column, list)
+                else array.array(column.typecode, values))
+        self._objects = {moved[row]: t for row, t in self._objects.items()}
+        self._object_rows = {id(t): row for row, t in self._objects.items()}
+        self._views = {}
+        for old, view in views:
+            if moved[old] >= 0:
+                view._row = moved[old]
+                self._views[view._row] = weakref.ref(view)
+        self._order = array.array('l', xrange(len(self._order)))
+        self._identity = True
+
+    def _adopt(self, t):
+        """Add a row for the task, keeping it if a plain object."""
+        row = self._add(t)
+        if not isinstance(t, TaskRow):
+            self._objects[row] = t
+            self._object_rows[id(t)] = row
+        return row
+
+    def insert(self, i, t):
+        row = self._adopt(t)
+        if i < len(self._order):
+            self._identity = False
+        self._order.insert(i, row)
+
+    def _add_table(self, other):
+        """Copy the rows of another table, column by column.
+
+        Return the new rows.
+        """
+        start = len(self._ids)
+        self._ids.extend(other._column('ids'))
+        self._descriptions.extend(
+            itertools.imap(self._intern, other._column('descriptions')))
+        numbers = [self._project_number(p) for p in other._project_names]
+        self._projects.extend(
+            numbers[n] if n >= 0 else -1 for n in other._column('projects'))
+        for name in self._columns[3:]:
+            getattr(self, '_' + name).extend(other._column(name))
+        return array.array('l', xrange(start, len(self._ids)))
+
+    def add_rows(self, tasks):
+        """Copy the tasks into new rows at the end of the table.
+
+        Unlike ``append``, plain ``Task`` objects are not kept.  The
+        rows of another ``TaskTable`` are copied column by column.
+        Return the items of the new rows.
+        """
+        if isinstance(tasks, TaskTable):
+            rows = self._add_table(tasks)
+        else:
+            rows = array.array('l', (self._add(t) for t in tasks))
+        self._order.extend(rows)
+        return [self._item(row) for row in rows]
+
+    def index(self, t):
+        row = self._row(t)
+        if row is None:
+            return super(TaskTable, self).index(t)
+        return self._order.index(row)
+
+    def update(self, t, **kwargs):
+        """Update attributes of the task, and of its row."""
+        for k, v in kwargs.viewitems():
+            setattr(t, k, v)
+        row = self._row(t)
+        if row is not None and not isinstance(t, TaskRow):
+            view = TaskRow(self, row)
+            for k, v in kwargs.viewitems():
+                setattr(view, k, v)
+
+    def __eq__(self, other):
+        return isinstance(other, collections.Sequence) \
+            and len(self) == len(other) \
+            and all(a == b for a, b in itertools.izip(self, other))
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, list(self))
+
+    def _column(self, name):
+        """Return the values of the column, in order of the rows."""
+        values = getattr(self, '_' + name)
+        if self._identity:
+            return values
+        if len(self._order) < 2:
+            return [values[row] for row in self._order]
+        return operator.itemgetter(*self._order)(values)
+
+    def ids(self):
+        """Return the IDs of the tasks, in order."""
+        return list(self._column('ids'))
+
+    def _mask(self, completed=None, project=None, priority=None):
+        """Return an iterator of flags selecting the matching rows.
+
+        ``completed``
+          Select only completed (if true) or pending (if false) tasks.
+        ``project``
+          Select only tasks of the given project.
+        ``priority``
+          Select only tasks without a priority, or with the given
+          priority or higher.
+        """
+        masks = []
+        if completed is not None:
+            flags = self._column('completed')
+            masks.append(flags if completed
+                else itertools.imap(operator.not_, flags))
+        if project is not None:
+            number = self._project_numbers.get(project, -2)
+            masks.append(itertools.imap(
+                operator.eq, self._column('projects'),
+                itertools.repeat(number)))
+        if priority:
+            # rows without a priority hold _NO_PRIORITY, and are selected
+            masks.append(itertools.imap(
+                operator.le, self._column('priorities'),
+                itertools.repeat(priority)))
+        if not masks:
+            return itertools.repeat(True, len(self))
+        return reduce(
+            lambda a, b: itertools.imap(operator.and_, a, b), masks)
+
+    def select(self, **filters):
+        """Generate the tasks matching the filters of ``_mask``."""
+        rows = itertools.compress(self._order, self._mask(**filters))
+        return itertools.imap(self._item, rows)
+
+    def column(self, name, **filters):
+        """Return the values of the named attribute of matching tasks.
+
+        Filters are as for ``select``.  Only ``estimate`` and
+        ``actual`` are supported; the values are floats, and costs of
+        ``None`` are given as 0.
+        """
+        values = self._column(_cost_columns[name])
+        return list(itertools.compress(values, self._mask(**filters)))
+
+
+_cost_columns = {'estimate': 'estimates', 'actual': 'actuals'}
+_defaults = [None, None, None, None, 0, None, None, 0]
+_completed = task.Task.fields.index('completed')
+_actual = task.Task.fields.index('actual')
@@ -0,0 +1,143 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import StringIO
+import unittest
+
+from . import bulk
+from . import holiday
+from . import task
+from . import tasktable
+
+
+class ReadRowsTestCase(unittest.TestCase):
+    def test_csv(self):
+        fp = StringIO.StringIO(
+            'id, estimator,estimate\n'
+            '1,Bob,4\n'
+            '2,J\xc3\xb6rg,\n'
+        )
+        self.assertEqual(list(bulk.read_rows(fp, 'csv')), [
+            (2, {'id': '1', 'estimator': 'Bob', 'estimate': '4'}),
+            (3, {'id': '2', 'estimator': 'J\xc3\xb6rg', 'estimate': ''}),
+        ])
+
+    def test_jsonl(self):
+        fp = StringIO.StringIO('{"id": 1}\n\nnot json\n')
+        self.assertEqual(list(bulk.read_rows(fp, 'jsonl')), [
+            (1, {'id': 1}), (3, 'not json\n')])
+
+    def test_detect_format(self):
+        self.assertEqual(bulk.detect_format('tasks.CSV'), 'csv')
+        self.assertEqual(bulk.detect_format('tasks.jsonl'), 'jsonl')
+        self.assertEqual(bulk.detect_format('<stdin>'), 'jsonl')
+
+
+class ParseRowTestCase(unittest.TestCase):
+    def test_task(self):
+        kind, values = bulk.parse_row({
+            'estimator': 'J\xc3\xb6rg', 'id': '7', 'project': '',
+            'priority': '2', 'estimate': '2.5', 'actual': '3',
+            'date': '2012-03-04', 'completed': 'yes', 'other': 'x',
+        })
+        self.assertEqual(kind, 'task')
+        self.assertEqual(values, {
+            'estimator': u'J\xf6rg', 'id': u'7', 'priority': 2,
+            'estimate': 2.5, 'actual': 3, 'completed': True,
+            'date': datetime.date(2012, 3, 4),
+        })
+        self.assertIsInstance(values['actual'], int)
+        self.assertEqual(
+            bulk.make_task(values),
+            task.Task(id=u'7', priority=2, estimate=2.5, actual=3,
+                date=datetime.date(2012, 3, 4), completed=True)
+        )
+        self.assertEqual(
+            list(tasktable.TaskTable.from_records([bulk.task_record(values)])),
+            [bulk.make_task(values)]
+        )
+
+    def test_json_values(self):
+        kind, values = bulk.parse_row(
+            {'estimator': 'Bob', 'id': 7, 'estimate': 1, 'completed': False})
+        self.assertEqual(
+            values,
+            {'estimator': 'Bob', 'id': u'7', 'estimate': 1, 'completed': False}
+        )
+
+    def test_types(self):
+        self.assertEqual(
+            bulk.parse_row({'type': 'holiday', 'rule': 'annual:12-25'}),
+            ('holiday', {'rule': holiday.AnnualRule(12, 25)})
+        )
+        kind, values = bulk.parse_row(
+            {'estimator': 'Bob', 'date': '2012-01-02', 'cost': '3'},
+            kind='event'
+        )
+        self.assertEqual(
+            bulk.make_event(values),
+            task.Event(date=datetime.date(2012, 1, 2), cost=3)
+        )
+
+    def test_invalid(self):
+        for row, message in [
+            ('text', r'not a record'),
+            ({'type': 'foo'}, r'unknown type'),
+            ({'id': '1'}, r'missing estimator'),
+            ({'type': 'event', 'estimator': 'Bob'}, r'missing date, cost'),
+            ({'type': 'holiday'}, r'one of date and rule'),
+            ({'estimator': 'Bob', 'id': '1', 'estimate': '-1'},
+                r'estimate: negative'),
+            ({'estimator': 'Bob', 'id': '1', 'estimate': 'x'}, r'estimate'),
+            ({'estimator': 'Bob', 'id': '1', 'priority': '1.5'},
+                r'priority: not an integer'),
+            ({'estimator': 'Bob', 'id': '1', 'date': '2012-1-2'}, r'date'),
+            ({'estimator': 'Bob', 'id': [1]}, r'id: not text'),
+        ]:
+            with self.assertRaisesRegexp(ValueError, message):
+                bulk.parse_row(row)
+
+
+class WriteRowsTestCase(unittest.TestCase):
+    def _rows(self):
+        yield bulk.task_row('Bob', task.Task(
+            id='1', description=u'\xfcber', estimate=2.5, actual=1,
+            date=datetime.date(2012, 3, 4)))
+        yield bulk.event_row('Bob', task.Event(
+            date=datetime.date(2012, 1, 2), cost=3))
+        yield bulk.holiday_row(rule=holiday.AnnualRule(12, 25))
+
+    def test_round_trip(self):
+        for format in bulk.formats:
+            fp = StringIO.StringIO()
+            self.assertEqual(bulk.write_rows(fp, format, self._rows()), 3)
+            fp.seek(0)
+            self.assertEqual(
+                [bulk.parse_row(row) for line, row in
+                    bulk.read_rows(fp, format)],
+                [bulk.parse_row(row) for row in self._rows()]
+            )
+
+    def test_csv(self):
+        fp = StringIO.StringIO()
+        bulk.write_rows(fp, 'csv', self._rows(), kinds=['event', 'holiday'])
+        self.assertEqual(fp.getvalue().splitlines(), [
+            'type,estimator,date,cost,description,rule',
+            'task,Bob,2012-03-04,,\xc3\xbcber,',
+            'event,Bob,2012-01-02,3,,',
+            'holiday,,,,,annual:12-25',
+        ])
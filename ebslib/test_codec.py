@@ -0,0 +1,80 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import datetime
+import json
+import unittest
+
+from . import codec
+from . import estimator
+from . import holiday
+from . import task
+
+
+_date = datetime.date(2012, 3, 4)
+
+_data = {
+    'estimators': [
+        estimator.Estimator.from_dict({
+            'name': 'Bob',
+            'tasks': [
+                {'id': 'a', 'estimate': 4, 'project': 'A', 'priority': 1,
+                    'description': 'Foo'},
+                {'id': 'b', 'estimate': 2, 'actual': 3, 'date': _date},
+                {'estimate': 2, 'actual': 1},
+            ],
+            'events': [{'date': _date, 'cost': 2, 'description': 'Bar'}],
+        }),
+        estimator.Estimator(name='Jane'),
+    ],
+    'holidays': holiday.HolidayIndex([_date]),
+    'holiday_rules': [holiday.parse_rule('annual:12-25')],
+    'journal': 3,
+}
+
+
+class CodecTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        doc = json.loads(json.dumps(codec.encode(_data)))
+        self.assertEqual(doc['codec'], codec.VERSION)
+        self.assertEqual(codec.decode(doc), _data)
+
+    def test_records(self):
+        doc = codec.encode(_data)
+        bob = doc['estimators'][0]
+        self.assertEqual(
+            bob['tasks'][0], ['a', 'A', 'Foo', 1, 4, None, False, 0])
+        self.assertEqual(
+            bob['tasks'][1], ['b', None, None, None, 2, 734566, True, 3])
+        self.assertEqual(bob['events'], [[734566, 2, 'Bar']])
+        self.assertEqual(
+            bob['summary']['entries'], [[2 / 3, 734566, 'b'], [2, None, None]])
+        self.assertEqual(doc['holidays'], [734566])
+        self.assertEqual(doc['holiday_rules'], ['annual:12-25'])
+        self.assertEqual(doc['journal'], 3)
+
+    def test_task_fields(self):
+        t = task.Task('a', 'A', 'Foo', 1, 4, _date, True, 3)
+        self.assertEqual(
+            [getattr(t, attr) for attr in task.Task.fields],
+            ['a', 'A', 'Foo', 1, 4, _date, True, 3]
+        )
+        self.assertEqual(
+            set(task.Task.fields), task.Task.__slots__ - {'_fingerprint'})
+        self.assertEqual(
+            sorted(task.Event.fields), sorted(task.Event.__slots__))
@@ -0,0 +1,151 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import array
+import datetime
+import json
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from . import colstore
+from . import store
+from . import task
+from . import test_stores
+
+
+_today = datetime.date.today()
+_old = _today - datetime.timedelta(days=100)
+
+
+def _estimators():
+    """The shared estimators, with tasks for the edge cases of columns."""
+    bob, jane = test_stores.estimators()
+    bob.add_tasks([
+        task.Task(id=1, estimate=5, project='B', priority=3),
+        task.Task(
+            id=None, estimate=3, actual=1, date=_old,
+            description=u'caf\xe9'),
+        task.Task(id='e', estimate=6),
+    ])
+    jane.add_task(task.Task(id='n', priority=40000))
+    return [bob, jane]
+
+
+class ColumnStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._json = os.path.join(self._dir, 'ebs.json')
+        self._path = os.path.join(self._dir, 'ebs.col')
+        test_stores.populate(store.Store(self._json), _estimators)
+        with colstore.ColumnStore(self._path) as s:
+            store.copy(store.Store(self._json), s)
+        self._store = colstore.ColumnStore(self._path)
+
+    def tearDown(self):
+        del self._store.data
+        shutil.rmtree(self._dir)
+
+    def test_round_trip_text(self):
+        """Converting a JSON store to columns and back changes nothing."""
+        path = os.path.join(self._dir, 'copy.json')
+        with store.Store(path) as s:
+            store.copy(self._store, s)
+        with open(path) as a, open(self._json) as b:
+            self.assertEqual(json.load(a), json.load(b))
+
+    def test_version_1(self):
+        """Files of version 1, with int16 priorities, are read."""
+        del self._store.data
+        layout = colstore._layout(2, 1)
+        block = bytearray(layout['heap'])
+        for name, code, values in [
+            ('estimate', 'd', (4, 2)), ('actual', 'd', (0, 3)),
+            ('date', 'i', (0, 0)), ('project', 'i', (-1, -1)),
+            ('priority', 'h', (7, -1)), ('completed', 'B', (0, 1)),
+            ('id', 'I', (0, 3, 6)), ('description', 'I', (6, 10, 14)),
+        ]:
+            struct.pack_into(
+                '<{}{}'.format(len(values), code), block, layout[name],
+                *values)
+        with open(self._path, 'wb') as fp:
+            metadata = json.dumps({
+                'holidays': [], 'holiday_rules': [],
+                'estimators': [{
+                    'name': 'Bob', 'events': [], 'rows': 2,
+                    'projects': [], 'offset': 0, 'length': 0,
+                }],
+            })
+            fp.write(struct.pack(
+                '<8sHHI', store._columns_magic, 1, 0, len(metadata)))
+            fp.write(metadata)
+            fp.write('\0' * (-fp.tell() % 8))
+            fp.write(str(block) + '"a""b"nullnull')
+        tasks = [
+            task.Task(id='a', estimate=4, priority=7),
+            task.Task(id='b', estimate=2, actual=3),
+        ]
+        with self._store as s:
+            self.assertEqual(s.get_estimator('Bob').velocities(), [2.0 / 3])
+            s.add_holiday(_today)  # written in the current version
+        del self._store.data
+        self.assertEqual(list(self._store.get_estimator('Bob').tasks), tasks)
+
+    def test_simulation_reads_columns(self):
+        bob = self._store.get_estimator('Bob')
+        self.assertEqual(bob.velocities(), [2.0 / 3, 3])
+        self.assertEqual(
+            bob.velocities(max_age=datetime.timedelta(days=30)), [2.0 / 3])
+        self.assertEqual(bob._simulation_estimates(), [4, 5, 6])
+        self.assertEqual(bob._simulation_estimates(project='B'), [5])
+        self.assertEqual(bob._simulation_estimates(project='C'), [])
+        self.assertEqual(bob._simulation_estimates(priority=2), [4, 6])
+        self.assertNotIn('description', bob._columns)
+        self.assertIsInstance(bob.column('estimate'), array.array)
+        self.assertEqual(
+            [t.id for e, t in self._store.tasks(completed=False)],
+            ['a', 1, 'e', 'c', 'n']
+        )
+        self.assertFalse(bob.materialised)
+
+    def test_mutations(self):
+        with self._store as s:
+            s.update_task(1, actual=2, completed=True)
+            s.add_task('Jane', task.Task(id='f', estimate=1, project='A'))
+            s.add_event('Jane', task.Event(date=_today, cost=1))
+        del self._store.data
+        bob = self._store.get_estimator('Bob')
+        self.assertEqual(bob.velocities(), [2.0 / 3, 2.5, 3])
+        jane = self._store.get_estimator('Jane')
+        self.assertEqual(jane._simulation_estimates(project='A'), [1])
+        self.assertEqual(jane.events, [task.Event(date=_today, cost=1)])
+
+    def test_unchanged_blocks_copied(self):
+        with self._store as s:
+            s.add_holiday(datetime.date(2013, 1, 1))
+        self.assertFalse(self._store.get_estimator('Bob').materialised)
+        del self._store.data
+        self.assertEqual(self._store.estimators, _estimators())
+        self.assertEqual(len(self._store.holidays), 2)
+
+    def test_version(self):
+        with open(self._path, 'r+b') as fp:
+            fp.seek(8)
+            fp.write(struct.pack('<H', colstore.VERSION + 1))
+        with self.assertRaisesRegexp(UserWarning, r'Unsupported'):
+            self._store.estimators
@@ -15,9 +15,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
+import csv
 import datetime
+import json
 import os
 import re
+import sys
 import tempfile
 import unittest
 
@@ -37,6 +40,9 @@ class CommandTestCase(unittest.TestCase):
     def tearDown(self):
         del self._store
         os.unlink(self._tmp)
+        for suffix in ('.lock', '.archive', '.estimates'):
+            if os.path.exists(self._tmp + suffix):
+                os.unlink(self._tmp + suffix)
         del self._tmp
 
     def run_command(self, args):
@@ -70,7 +76,7 @@ class AddEventTestCase(CommandTestCase):
     def setUp(self):
         super(AddEventTestCase, self).setUp()
         with self._store as store:
-            store.estimators.append(
+            store.add_estimator(
                 estimator.Estimator(name='JoeBloggs@example.com'))
 
     def test_add_event(self):
@@ -91,13 +97,257 @@ class AddEventTestCase(CommandTestCase):
         )
 
 
+class ArchiveTestCase(CommandTestCase):
+    _command = command.Archive
+
+    def setUp(self):
+        super(ArchiveTestCase, self).setUp()
+        today = datetime.date.today()
+        old = today - datetime.timedelta(days=100)
+        with self._store as store:
+            store.add_estimator(
+                estimator.Estimator(
+                    name='JoeBloggs@example.com',
+                    tasks=[
+                        task.Task(id='foo', estimate=2, actual=1, date=old),
+                        task.Task(id='bar', estimate=1, actual=1, date=today),
+                        task.Task(id='baz', estimate=1, date=old),
+                    ]
+                )
+            )
+        del self._store.data
+
+    def test_archive(self):
+        self.run_command(['--days', '30'])
+        est = self._store.get_estimator('JoeBloggs@example.com')
+        self.assertEqual([t.id for t in est.tasks], ['bar', 'baz'])
+        self.assertEqual(est.velocities(), [1, 2])
+        self.assertTrue(self._store.task_archived('foo'))
+        with self.assertRaisesRegexp(UserWarning, r'archived'):
+            self._store.add_task(est.name, task.Task(id='foo'))
+
+
+class BatchTestCase(CommandTestCase):
+    _command = command.Batch
+
+    def setUp(self):
+        super(BatchTestCase, self).setUp()
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self._input = path
+
+    def tearDown(self):
+        os.unlink(self._input)
+        super(BatchTestCase, self).tearDown()
+
+    def run_batch(self, lines):
+        with open(self._input, 'w') as fp:
+            fp.write('\n'.join(lines))
+        self.run_command([self._input])
+        del self._store.data  # purge
+
+    def test_batch(self):
+        self.run_batch([
+            '# estimators',
+            'addestimator --name bob',
+            '',
+            'addtask --estimator bob --id 1 --estimate 4 --desc "Foo bar"',
+            '["addtask", "--estimator", "bob", "--id", "2", '
+                '"--estimate", "2"]',
+            '{"command": "addtask", "estimator": "bob", "id": 3, '
+                '"estimate": 1.5, "project": "A"}',
+            'rmtask --id 2',
+        ])
+        self.assertEqual(
+            [(t.id, t.description, t.estimate, t.project)
+                for e, t in self._store.tasks()],
+            [('1', 'Foo bar', 4, None), ('3', None, 1.5, 'A')]
+        )
+
+    def test_list_values(self):
+        """An option given a list is repeated for each value."""
+        output = self._input + '.csv'
+        self.run_batch([
+            'addestimator --name bob',
+            'addtask --estimator bob --id 1 --estimate 1',
+            'addtask --estimator bob --id 2 --estimate 1',
+            'addtask --estimator bob --id 3 --estimate 1',
+            json.dumps({'command': 'export', 'id': ['1', '3'],
+                'type': ['task'], 'output': output}),
+        ])
+        self.addCleanup(os.unlink, output)
+        with open(output) as fp:
+            self.assertEqual(
+                [row['id'] for row in csv.DictReader(fp)], ['1', '3'])
+
+    def test_failure_writes_nothing(self):
+        with self._store as store:
+            store.add_estimator(estimator.Estimator(name='bob'))
+        for bad in (
+            'addtask --estimator nobody --id 2 --estimate 1',
+            'nosuchcommand',
+            'config --list',
+            '{"estimator": "bob"}',
+        ):
+            with self.assertRaisesRegexp(UserWarning, r'^line 2: '):
+                self.run_batch([
+                    'addtask --estimator bob --id 1 --estimate 1', bad])
+            del self._store.data  # purge
+            self.assertFalse(self._store.task_exists('1'))
+
+
+@unittest.skipUnless(
+    command.conf.has_section('core'), 'core configuration required')
+class EstimateTestCase(CommandTestCase):
+    _command = command.Estimate
+
+    def setUp(self):
+        super(EstimateTestCase, self).setUp()
+        self._project = command.conf.get('core', 'projects').split(',')[0]
+        with self._store as store:
+            store.add_estimator(estimator.Estimator(name='bob', tasks=[
+                task.Task(id='1', estimate=1, actual=2, completed=True),
+                task.Task(id='2', estimate=2, actual=1, completed=True),
+                task.Task(id='3', estimate=4, project=self._project),
+            ]))
+
+    def cached(self):
+        with open(self._tmp + '.estimates') as fp:
+            return len(json.load(fp))
+
+    def estimate(self, args):
+        stdout = sys.stdout
+        with tempfile.TemporaryFile() as fp:
+            sys.stdout = fp
+            try:
+                self.run_command(args)
+            finally:
+                sys.stdout = stdout
+            fp.seek(0)
+            return fp.read()
+
+    def test_cache(self):
+        output = self.estimate(['--seed', '1'])
+        n = self.cached()
+        self.assertEqual(self.estimate(['--seed', '1']), output)
+        self.assertEqual(self.estimate(['--seed', '1', '--no-cache']), output)
+        self.assertEqual(self.cached(), n)
+        with self._store as store:
+            store.add_task(
+                'bob', task.Task(id='4', estimate=40, project=self._project))
+        self.assertNotEqual(self.estimate(['--seed', '1']), output)
+        self.assertEqual(self.cached(), n + 1)
+
+
+class ImportTestCase(CommandTestCase):
+    _command = command.Import
+
+    def setUp(self):
+        super(ImportTestCase, self).setUp()
+        with self._store as store:
+            store.add_estimator(estimator.Estimator(
+                name='bob', tasks=[task.Task(id='1', estimate=1)]))
+        self._input = self._tmp + '.csv'
+
+    def tearDown(self):
+        os.unlink(self._input)
+        super(ImportTestCase, self).tearDown()
+
+    def run_import(self, text, args=()):
+        with open(self._input, 'w') as fp:
+            fp.write(text)
+        with open(os.devnull, 'w') as devnull:
+            stdout, stderr = sys.stdout, sys.stderr
+            sys.stdout = sys.stderr = devnull
+            try:
+                self.run_command(list(args) + [self._input])
+            finally:
+                sys.stdout, sys.stderr = stdout, stderr
+        del self._store.data  # purge
+
+    def test_import_csv(self):
+        self.run_import(
+            'estimator,id,estimate,actual,date\n'
+            'bob,2,4,2,2012-01-02\n'
+            'bob,1,1,,\n'           # duplicate
+            'bob,3,x,,\n'           # invalid
+            'nobody,4,1,,\n'        # no such estimator
+            'bob,5,1,,\n'
+            'bob,5,2,,\n',          # duplicate within the input
+            args=['--chunk-size', '2']
+        )
+        self.assertEqual(
+            [(t.id, t.estimate) for e, t in self._store.tasks()],
+            [('1', 1), ('2', 4), ('5', 1)]
+        )
+        self.assertEqual(self._store.get_estimator('bob').velocities(), [2])
+
+    def test_import_jsonl(self):
+        self.run_import(
+            '{"estimator": "bob", "id": 2, "estimate": 3}\n'
+            '{"type": "holiday", "date": "2012-12-25"}\n'
+            '{"type": "holiday", "rule": "easter:-2"}\n',
+            args=['--format', 'jsonl']
+        )
+        self.assertEqual(self._store.get_task('2')[1].estimate, 3)
+        self.assertEqual(
+            list(self._store.holidays), [datetime.date(2012, 12, 25)])
+        self.assertEqual(len(self._store.holiday_rules), 1)
+
+
+class ExportTestCase(CommandTestCase):
+    _command = command.Export
+
+    def setUp(self):
+        super(ExportTestCase, self).setUp()
+        with self._store as store:
+            store.add_estimator(estimator.Estimator(name='bob', tasks=[
+                task.Task(id='1', estimate=1, actual=2, project='A'),
+                task.Task(id='2', estimate=3, date=datetime.date(2012, 1, 2)),
+            ]))
+            store.add_estimator(estimator.Estimator(name='jane', events=[
+                task.Event(date=datetime.date(2012, 1, 3), cost=2)]))
+            store.add_holiday(datetime.date(2012, 12, 25))
+        self._output = self._tmp + '.jsonl'
+
+    def tearDown(self):
+        os.unlink(self._output)
+        super(ExportTestCase, self).tearDown()
+
+    def export(self, args):
+        self.run_command(args + ['--output', self._output])
+        with open(self._output) as fp:
+            return [json.loads(line) for line in fp]
+
+    def test_export(self):
+        rows = self.export([])
+        self.assertEqual([row['type'] for row in rows],
+            ['task', 'task', 'event', 'holiday'])
+        self.assertEqual(rows[1], {
+            'type': 'task', 'estimator': 'bob', 'id': '2', 'estimate': 3,
+            'actual': 0, 'completed': False, 'date': '2012-01-02'})
+        self.assertEqual(rows[3], {'type': 'holiday', 'date': '2012-12-25'})
+
+    def test_filters(self):
+        self.assertEqual(
+            [row['id'] for row in self.export(['--project', 'A'])
+                if row['type'] == 'task'],
+            ['1']
+        )
+        self.assertEqual(
+            self.export(['--estimator', 'jane', '--type', 'event']),
+            [{'type': 'event', 'estimator': 'jane', 'date': '2012-01-03',
+                'cost': 2}]
+        )
+
+
 class RmTaskTestCase(CommandTestCase):
     _command = command.RmTask
 
     def setUp(self):
         super(RmTaskTestCase, self).setUp()
         with self._store as store:
-            store.estimators.append(
+            store.add_estimator(
                 estimator.Estimator(
                     name='JoeBloggs@example.com',
                     tasks=[task.Task(id='foo'), task.Task(id='bar')]
@@ -127,3 +377,21 @@ class RmTaskTestCase(CommandTestCase):
         del self._store.data  # purge data
         after = list(est.tasks)
         self.assertEqual(before, after)
+
+
+class RegistryTestCase(unittest.TestCase):
+    def test_get_command(self):
+        self.assertIs(command.get_command('lstask'), command.LsTask)
+        self.assertRaises(KeyError, command.get_command, 'nosuchcommand')
+
+    def test_build_parser(self):
+        parser = command.build_parser(['lstask'])
+        args = parser.parse_args(['lstask', '--id', '1'])
+        self.assertIs(args.command, command.LsTask)
+        with open(os.devnull, 'w') as devnull:
+            stderr, sys.stderr = sys.stderr, devnull
+            try:
+                self.assertRaises(
+                    SystemExit, parser.parse_args, ['addtask', '--id', '1'])
+            finally:
+                sys.stderr = stderr
@@ -237,3 +237,63 @@ class DateTestCase(unittest.TestCase):
                 ),
                 (_now + datetime.timedelta(days=offsets[_now.weekday()]), 0)
             )
+
+    def test_ship_date_with_event_timeline(self):
+        work_days = frozenset([0, 1, 2, 3, 4])
+        for i in range(14):
+            _now = _today + datetime.timedelta(days=i)
+            events = [
+                task.Event(
+                    date=date.apply_work_date_interval(work_days, _now, n),
+                    cost=1
+                )
+                for n in (2, 1, 10)
+            ]
+            self.assertEqual(
+                date.ship_date(
+                    hours=1, events=date.EventTimeline(events),
+                    hours_per_day=1, start_date=_now
+                ),
+                date.ship_date(
+                    hours=1, events=events,
+                    hours_per_day=1, start_date=_now
+                )
+            )
+
+    def test_ship_date_with_many_events(self):
+        """A long chain of events does not exhaust the stack."""
+        events = [
+            task.Event(date=_today + datetime.timedelta(days=i), cost=1)
+            for i in range(1, 3000)
+        ]
+        ship, remaining = date.ship_date(
+            hours=1, events=events, hours_per_day=1, start_date=_today)
+        self.assertGreater(ship, events[-1].date)
+        self.assertEqual(remaining, 0)
+
+
+class EventTimelineTestCase(unittest.TestCase):
+    def test_cost_between(self):
+        timeline = date.EventTimeline([
+            task.Event(date=_today + datetime.timedelta(days=3), cost=4),
+            task.Event(date=_today + datetime.timedelta(days=1), cost=1),
+            task.Event(date=_today + datetime.timedelta(days=1), cost=2),
+        ])
+        self.assertEqual(len(timeline), 3)
+        _day = lambda n: _today + datetime.timedelta(days=n)
+        self.assertEqual(timeline.cost_between(_day(0), _day(0)), 0)
+        self.assertEqual(timeline.cost_between(_day(0), _day(1)), 3)
+        self.assertEqual(timeline.cost_between(_day(1), _day(3)), 4)
+        self.assertEqual(timeline.cost_between(_day(0), _day(3)), 7)
+        self.assertEqual(timeline.cost_between(_day(3), _day(0)), 0)
+
+
+class WorkDateCeilTestCase(unittest.TestCase):
+    def test_consecutive_holidays_with_sparse_work_days(self):
+        """Holidays on consecutive work days extend the search."""
+        monday = _today - datetime.timedelta(days=_today.weekday())
+        holidays = [monday + datetime.timedelta(days=7 * i) for i in range(3)]
+        self.assertEqual(
+            date.work_date_ceil(monday, [0], holidays),
+            monday + datetime.timedelta(days=21)
+        )
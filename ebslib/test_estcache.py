@@ -0,0 +1,75 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from . import estcache
+
+
+class EstimateCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._tmp = estcache.cache_filename(os.path.join(self._dir, 'ebs'))
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_key(self):
+        key = estcache.EstimateCache.key([0.5, 2], [1, 8], 2)
+        self.assertEqual(key, estcache.EstimateCache.key((0.5, 2), (1, 8), 2))
+        for args in [
+            ([0.5, 2], [1, 8], 3),
+            ([0.5, 2], [1, 8], 2, 1),
+            ([0.5, 2], [8, 1], 2),
+            ([0.5], [1, 8], 2),
+        ]:
+            self.assertNotEqual(estcache.EstimateCache.key(*args), key)
+
+    def test_save(self):
+        cache = estcache.EstimateCache(self._tmp)
+        self.assertIsNone(cache.get('a'))
+        cache.save()
+        self.assertFalse(os.path.exists(self._tmp))  # nothing cached
+        cache.set('a', [1.5] * 10)
+        cache.save()
+        cache = estcache.EstimateCache(self._tmp)
+        self.assertEqual(cache.get('a'), [1.5] * 10)
+        os.utime(self._tmp, (1000, 1000))
+        cache.save()  # a hit is not written back
+        self.assertEqual(os.stat(self._tmp).st_mtime, 1000)
+
+    def test_lru(self):
+        cache = estcache.EstimateCache(self._tmp, size=2)
+        cache.set('a', [1])
+        cache.set('b', [2])
+        cache.get('a')
+        cache.set('c', [3])  # evicts b, the least recently used
+        self.assertEqual(cache.entries.keys(), ['a', 'c'])
+        cache.save()
+        cache = estcache.EstimateCache(self._tmp, size=2)
+        self.assertEqual(cache.entries.keys(), ['a', 'c'])
+
+    def test_unreadable(self):
+        with open(self._tmp, 'w') as fp:
+            fp.write('not json')
+        cache = estcache.EstimateCache(self._tmp)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', [1])
+        cache.save()
+        self.assertEqual(estcache.EstimateCache(self._tmp).get('a'), [1])
@@ -15,10 +15,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import datetime
+import math
 import unittest
 
 from . import estimator
 from . import task
+from . import tasktable
 
 
 _today = datetime.date.today()
@@ -47,8 +49,9 @@ class EstimatorTestCase(unittest.TestCase):
                 {'date': _today, 'cost': 2, 'description': 'Foo'}
             ]
         })
+        self.assertIsInstance(e.tasks, tasktable.TaskTable)
         self.assertListEqual(
-            e.tasks,
+            list(e.tasks),
             [
                 task.Task(estimate=4, description='Task 1'),
                 task.Task(estimate=2, actual=3, description='Task 2'),
@@ -162,6 +165,126 @@ class EstimatorTestCase(unittest.TestCase):
         })
         self.assertListEqual(e.velocities(), [1])
 
+    def test_velocity_stats(self):
+        e = estimator.Estimator.from_dict({
+            'name': 'Bob',
+            'tasks': [
+                {'estimate': 4, 'actual': 2},
+                {'estimate': 2, 'actual': 2},
+                {'estimate': 2, 'actual': 4},
+                {'estimate': 3, 'actual': 1},
+                {'estimate': 8},
+            ]
+        })
+        stats = e.velocity_stats()
+        self.assertEqual(stats.count, 4)
+        self.assertEqual(stats.min, 0.5)
+        self.assertEqual(stats.max, 3)
+        self.assertAlmostEqual(stats.mean, 1.625)
+        self.assertAlmostEqual(stats.stddev, math.sqrt(0.921875))
+        self.assertEqual(stats.values, [0.5, 1, 2, 3])
+        self.assertEqual(stats.quantile(0), 0.5)
+        self.assertEqual(stats.quantile(0.5), 1.5)
+        self.assertEqual(stats.quantile(1), 3)
+        self.assertEqual(e.min_velocity(), 0.5)
+        self.assertEqual(e.max_velocity(), 3)
+        self.assertAlmostEqual(e.mean_velocity(), 1.625)
+
+    def test_velocity_stats_with_max_age(self):
+        """The mean used for the deviation respects the age limit."""
+        e = estimator.Estimator.from_dict({
+            'name': 'Bob',
+            'tasks': [
+                {'estimate': 4, 'actual': 1, 'date': _today},
+                {'estimate': 2, 'actual': 1, 'date': _today},
+                {'estimate': 100, 'actual': 1, 'date': _yesterday},
+            ]
+        })
+        self.assertEqual(e.stddev_velocity(max_age=datetime.timedelta(hours=12)), 1)
+
+    def test_velocity_stats_with_no_history(self):
+        e = estimator.Estimator.from_dict({
+            'name': 'Bob',
+            'tasks': [{'estimate': 8}]
+        })
+        with self.assertRaises(estimator.NoHistoryError):
+            e.velocity_stats()
+        with self.assertRaises(estimator.NoHistoryError):
+            e.stddev_velocity()
+        self.assertEqual(estimator.VelocityStats().count, 0)
+
+    def test_velocity_summary_maintenance(self):
+        e = estimator.Estimator.from_dict({
+            'name': 'Bob',
+            'tasks': [{'id': 'a', 'estimate': 4, 'actual': 2}]
+        })
+        b = task.Task(id='b', estimate=1, actual=2)
+        c = task.Task(id='c', estimate=3)
+        e.add_task(b)
+        e.add_task(c)
+        self.assertEqual(e.velocities(), [0.5, 2])
+        e.update_task(c, actual=1, completed=True)
+        self.assertEqual(e.velocities(), [0.5, 2, 3])
+        e.update_task(b, completed=False)
+        self.assertEqual(e.velocities(), [2, 3])
+        e.remove_task(c)
+        self.assertEqual(e.velocities(), [2])
+        self.assertEqual(e.summary.count, 1)
+        self.assertEqual(e.summary.mean, 2)
+        self.assertEqual(e.summary.variance, 0)
+        self.assertEqual(e.summary, estimator.VelocitySummary.from_tasks(e.tasks))
+
+    def test_velocity_summary_ties(self):
+        """Entries of equal velocity, with and without dates, are kept."""
+        a = task.Task(id='a', estimate=2, actual=2)
+        b = task.Task(id='b', estimate=3, actual=3, date=_today)
+        c = task.Task(id='c', estimate=1, actual=1)
+        summary = estimator.VelocitySummary.from_tasks([b, a])
+        summary.add(c)
+        summary.extend([task.Task(id='d', estimate=4, actual=4, date=_today)])
+        self.assertEqual(
+            [id for v, date, id in summary.entries], ['a', 'c', 'b', 'd'])
+        summary.discard(b)
+        summary.discard(c)
+        self.assertEqual(summary.velocities(), [1, 1])
+        self.assertEqual(
+            summary, estimator.VelocitySummary.from_tasks([a, task.Task(
+                id='d', estimate=4, actual=4, date=_today)]))
+
+    def test_fingerprint(self):
+        e = estimator.Estimator.from_dict({
+            'name': 'Bob',
+            'tasks': [{'id': 'a', 'estimate': 4, 'actual': 2}]
+        })
+        fingerprint = e.fingerprint
+        b = task.Task(id='b', estimate=1)
+        e.add_task(b)
+        self.assertNotEqual(e.fingerprint, fingerprint)
+        e.update_task(b, actual=2)
+        e.remove_task(b)
+        self.assertEqual(e.fingerprint, fingerprint)
+        e.add_task(b)
+        e.add_task(task.Task(id='c'))
+        e.update_task(b, actual=2)
+        other = estimator.Estimator(name='Bob', tasks=list(reversed(e.tasks)))
+        self.assertEqual(e.fingerprint, other.fingerprint)  # maintained
+        e.events.append(task.Event(date=_today, cost=1))
+        self.assertNotEqual(e.fingerprint, other.fingerprint)
+
+    def test_velocity_summary_from_dict(self):
+        """A stored summary is used in preference to the tasks."""
+        e = estimator.Estimator.from_dict({
+            'name': 'Bob',
+            'tasks': [{'estimate': 4, 'actual': 2}],
+            'summary': {
+                'entries': [[0.5, _today, 'x'], [3, None, 'y']],
+                'total': 3.5, 'total_sq': 9.25
+            }
+        })
+        self.assertEqual(e.velocities(), [0.5, 3])
+        self.assertEqual(e.summary.mean, 1.75)
+        self.assertEqual(e.velocities(max_age=datetime.timedelta(1)), [0.5, 3])
+
     def test_simulate_future(self):
         """Test simulations of the future."""
         e = estimator.Estimator.from_dict({
@@ -216,6 +339,36 @@ class EstimatorTestCase(unittest.TestCase):
             encountered_futures.add(future)
         self.assertSetEqual(possible_futures, encountered_futures)
 
+    def test_future_deciles(self):
+        """Simulate many futures, and take every tenth percentile."""
+        e = estimator.Estimator.from_dict({
+            'name': 'Bob',
+            'tasks': [
+                {'estimate': 4, 'actual': 2},
+                {'estimate': 2, 'actual': 4},
+                {'estimate': 8},
+                {'estimate': 1},
+            ]
+        })
+        velocities, estimates = e.simulation_inputs()
+        self.assertEqual(sorted(velocities), [0.5, 2])
+        self.assertEqual(sorted(estimates), [1, 8])
+        deciles = estimator.future_deciles(velocities, estimates, 3, seed=1)
+        self.assertEqual(len(deciles), 10)
+        self.assertEqual(deciles, sorted(deciles))
+        self.assertTrue(set(deciles) <= set([4.5, 6, 16.5, 18]))
+        self.assertEqual(
+            estimator.future_deciles(velocities, estimates, 3, seed=1),
+            deciles
+        )
+
+    def test_simulation_inputs_without_history(self):
+        e = estimator.Estimator.from_dict(
+            {'name': 'Bob', 'tasks': [{'estimate': 8}]})
+        with self.assertRaises(estimator.NoHistoryError):
+            e.simulation_inputs()
+        self.assertEqual(e.simulation_inputs(project='A'), ([], []))
+
     def test_simulate_future_with_priority(self):
         """Simulate the future with some tasks filtered by priority."""
         e = estimator.Estimator.from_dict({
@@ -0,0 +1,126 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import unittest
+
+from . import date
+from . import holiday
+
+
+class HolidayIndexTestCase(unittest.TestCase):
+    def test_index(self):
+        d1, d2, d3 = (datetime.date(2012, 1, x) for x in (1, 2, 3))
+        index = holiday.HolidayIndex([d3, d1])
+        self.assertEqual(list(index), [d1, d3])
+        self.assertIn(d1, index)
+        self.assertNotIn(d2, index)
+        index.add(d2)
+        index.add(d2)
+        self.assertEqual(list(index), [d1, d2, d3])
+        index.discard(d1)
+        index.discard(d1)
+        self.assertEqual(list(index), [d2, d3])
+        self.assertEqual(index.between(d2, d3), [d2])
+        self.assertEqual(index, holiday.HolidayIndex([d2, d3]))
+
+
+class RuleTestCase(unittest.TestCase):
+    def test_parse_and_str(self):
+        for spec in ('annual:12-25', 'nth:4:thu:11', 'nth:-1:mon:05',
+                'easter:-2', 'easter:+1', 'easter:+0'):
+            self.assertEqual(str(holiday.parse_rule(spec)), spec)
+        self.assertEqual(
+            holiday.parse_rule('nth:1:0:6'),
+            holiday.NthWeekdayRule(1, 0, 6)
+        )
+
+    def test_parse_invalid(self):
+        for spec in ('', 'annual', 'annual:13-01', 'annual:02-30',
+                'nth:6:mon:01', 'nth:1:xyz:01', 'easter:x', 'monthly:1'):
+            with self.assertRaisesRegexp(ValueError, r'\brule\b'):
+                holiday.parse_rule(spec)
+
+    def test_annual(self):
+        rule = holiday.parse_rule('annual:02-29')
+        self.assertEqual(rule.dates(2012), [datetime.date(2012, 2, 29)])
+        self.assertEqual(rule.dates(2013), [])
+
+    def test_nth_weekday(self):
+        self.assertEqual(
+            holiday.parse_rule('nth:4:thu:11').dates(2012),
+            [datetime.date(2012, 11, 22)]
+        )
+        self.assertEqual(
+            holiday.parse_rule('nth:-1:mon:05').dates(2012),
+            [datetime.date(2012, 5, 28)]
+        )
+        self.assertEqual(
+            holiday.parse_rule('nth:-1:mon:12').dates(2012),
+            [datetime.date(2012, 12, 31)]
+        )
+        # there is no fifth Monday in February 2012
+        self.assertEqual(holiday.parse_rule('nth:5:mon:02').dates(2012), [])
+
+    def test_easter(self):
+        self.assertEqual(holiday.easter(2012), datetime.date(2012, 4, 8))
+        self.assertEqual(holiday.easter(2013), datetime.date(2013, 3, 31))
+        self.assertEqual(holiday.easter(2038), datetime.date(2038, 4, 25))
+        self.assertEqual(
+            holiday.parse_rule('easter:-2').dates(2012),
+            [datetime.date(2012, 4, 6)]
+        )
+
+
+class HolidayCalendarTestCase(unittest.TestCase):
+    def test_calendar(self):
+        calendar = holiday.HolidayCalendar(
+            holiday.HolidayIndex([datetime.date(2012, 3, 5)]),
+            [holiday.parse_rule('annual:01-26')]
+        )
+        self.assertIn(datetime.date(2012, 3, 5), calendar)
+        self.assertIn(datetime.date(2040, 1, 26), calendar)
+        self.assertNotIn(datetime.date(2040, 1, 27), calendar)
+        # only queried years are expanded
+        self.assertItemsEqual(calendar._years, [2040])
+        self.assertEqual(
+            calendar.between(
+                datetime.date(2012, 1, 1), datetime.date(2013, 1, 27)),
+            [
+                datetime.date(2012, 1, 26),
+                datetime.date(2012, 3, 5),
+                datetime.date(2013, 1, 26),
+            ]
+        )
+        calendar = holiday.HolidayCalendar([datetime.date(2012, 3, 5)])
+        self.assertEqual(
+            calendar.between(
+                datetime.date(2012, 3, 5), datetime.date(2012, 3, 6)),
+            [datetime.date(2012, 3, 5)]
+        )
+        with self.assertRaises(TypeError):
+            holiday.Rule()  # abstract
+
+    def test_work_date_ceil(self):
+        work_days = frozenset([0, 1, 2, 3, 4])
+        calendar = holiday.HolidayCalendar(rules=[
+            holiday.parse_rule('easter:-2'), holiday.parse_rule('easter:+1')
+        ])
+        # Good Friday and Easter Monday 2012
+        self.assertEqual(
+            date.work_date_ceil(datetime.date(2012, 4, 6), work_days, calendar),
+            datetime.date(2012, 4, 10)
+        )
@@ -0,0 +1,230 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib2
+
+from . import command
+from . import config
+from . import estimator
+from . import httpapi
+from . import store
+from . import task
+
+
+class HTTPServerTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._pool = multiprocessing.Pool(1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._pool.terminate()
+        cls._pool.join()
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._tmp = os.path.join(self._dir, 'ebs')
+        with store.Store(self._tmp) as s:
+            s.add_estimator(estimator.Estimator('Bob'))
+            s.add_estimator(estimator.Estimator('Alice'))
+            for i in range(1, 4):
+                s.add_task('Bob', task.Task(
+                    id=str(i), estimate=i, actual=i + 1, completed=True))
+            s.add_task('Bob', task.Task(id='4', project='A', estimate=2))
+        self._store = store.Store(self._tmp)
+        self._server = httpapi.HTTPServer(
+            ('localhost', 0), self._store, self._pool)
+        self._server.quiet = True
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self._dir)
+
+    def request(self, path, data=None, method=None, headers=None):
+        """Return the status and the decoded body of the reply."""
+        url = 'http://localhost:{}{}'.format(
+            self._server.server_address[1], path)
+        if data is not None:
+            data = json.dumps(data)
+        if headers is None:
+            headers = {'Content-Type': 'application/json'}
+        request = urllib2.Request(url, data, headers)
+        if method:
+            request.get_method = lambda: method
+        try:
+            reply = urllib2.urlopen(request)
+        except urllib2.HTTPError as e:
+            reply = e
+        return reply.getcode(), json.load(reply)
+
+    def test_tasks(self):
+        status, body = self.request('/tasks?estimator=Bob&incomplete')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, {'tasks': [{
+            'type': 'task', 'estimator': 'Bob', 'id': '4', 'project': 'A',
+            'estimate': 2, 'actual': 0, 'completed': False,
+        }]})
+        status, body = self.request('/tasks?priority=high')
+        self.assertEqual(status, 400)
+        self.assertRegexpMatches(body['error'], r'priority')
+
+    def test_stats(self):
+        status, body = self.request('/stats')
+        self.assertEqual(status, 200)
+        bob, alice = body['estimators']
+        self.assertEqual(bob['name'], 'Bob')
+        self.assertEqual(bob['count'], 3)
+        self.assertEqual(sorted(bob['quantiles']), ['0.1', '0.5', '0.9'])
+        self.assertEqual(alice['name'], 'Alice')
+        self.assertIn('error', alice)
+
+    @unittest.skipUnless(
+        command.conf.has_section('core'), 'core configuration required')
+    def test_estimate(self):
+        status, body = self.request('/estimate?estimator=Bob')
+        self.assertEqual(status, 200)
+        (estimate,) = body['estimators']
+        futures = estimate['projects'][0]['futures']
+        self.assertEqual(len(futures), 10)
+        self.assertEqual(
+            [x['hours'] for x in futures],
+            sorted(x['hours'] for x in futures)
+        )
+        self.assertEqual(self.request('/estimate?estimator=Bob')[1], body)
+        self.assertEqual(len(self._server._estimates), 1)
+        self.request('/tasks', {'estimator': 'Bob', 'id': '5', 'estimate': 1})
+        self.request('/estimate?estimator=Bob')
+        self.assertEqual(len(self._server._estimates), 1)  # store changed
+        (key,) = self._server._estimates
+        self.assertEqual(key[0], self._server._generation)
+
+    def test_estimate_cache(self):
+        """Results of earlier generations are evicted, and not cached."""
+        server = self._server
+        today = datetime.date.today()
+        server._cache_estimate((0, today, ('a',)), 'a')
+        server._generation = 1
+        server._cache_estimate((0, today, ('b',)), 'b')  # computed before
+        self.assertEqual(server._estimates, {})
+        server.cache_size = 1
+        server._cache_estimate((1, today, ('c',)), 'c')
+        server._cache_estimate((1, today, ('d',)), 'd')
+        self.assertEqual(server._estimates.keys(), [(1, today, ('d',))])
+
+    def test_config_refresh(self):
+        """Changes to the configuration are seen, and new estimates made."""
+        path = os.path.join(self._dir, 'ebsrc')
+        instances = config.Config._instances
+        self.addCleanup(instances.update, dict(instances))
+        self.addCleanup(instances.clear)
+        with open(path, 'w') as fp:
+            fp.write('[core]\nhours_per_day = 8\n')
+        instances[os.path.expanduser('~/.ebsrc')] = config.Config(path)
+        event = {'estimator': 'Bob', 'date': '2012-01-02', 'cost': 6}
+        self.assertEqual(self.request('/events', event)[0], 201)
+        generation = self._server._generation
+        with open(path, 'w') as fp:
+            fp.write('[core]\nhours_per_day = 4.0\n')
+        status, body = self.request('/events', event)
+        self.assertEqual(status, 400)
+        self.assertRegexpMatches(body['error'], r'greater than one day')
+        self.assertGreater(self._server._generation, generation)
+
+    def test_add(self):
+        status, body = self.request('/tasks', [
+            {'estimator': 'Alice', 'id': '5', 'estimate': 1},
+            {'estimator': 'Alice', 'id': '6'},
+        ])
+        self.assertEqual((status, body), (201, {'added': 2}))
+        self.assertTrue(store.Store(self._tmp).task_exists('6'))
+        status, body = self.request(
+            '/holidays', {'date': '2012-12-25', 'rule': 'annual:12-25'})
+        self.assertEqual(status, 400)
+
+    def test_add_typed(self):
+        status, body = self.request('/tasks', [
+            {'type': 'task', 'estimator': 'Alice', 'id': '5'},
+            {'estimator': 'Alice', 'id': '6'},
+        ])
+        self.assertEqual((status, body), (201, {'added': 2}))
+        status, body = self.request(
+            '/holidays', {'type': 'task', 'estimator': 'Alice', 'id': '7'})
+        self.assertEqual(status, 400)
+        self.assertEqual(body['error'], 'row 1: not a holiday: task')
+        self.assertFalse(self._store.task_exists('7'))
+
+    def test_add_invalid(self):
+        with open(self._tmp) as fp:
+            data = fp.read()
+        status, body = self.request('/tasks', [
+            {'estimator': 'Alice', 'id': '5'},
+            {'estimator': 'Carol', 'id': '6'},
+        ])
+        self.assertEqual(status, 400)
+        self.assertEqual(
+            body['error'], 'row 2: Estimator does not exist: Carol')
+        with open(self._tmp) as fp:
+            self.assertEqual(fp.read(), data)
+        self.assertFalse(self._store.task_exists('5'))
+
+    def test_remove(self):
+        self.assertEqual(
+            self.request('/tasks/4', method='DELETE'),
+            (200, {'removed': '4'})
+        )
+        self.assertFalse(store.Store(self._tmp).task_exists('4'))
+        self.assertEqual(
+            self.request('/tasks/4', method='DELETE')[0], 404)
+
+    def test_not_found(self):
+        self.assertEqual(self.request('/nothing')[0], 404)
+        self.assertEqual(self.request('/tasks/4')[0], 404)
+        self.assertEqual(self.request('/stats', {})[0], 405)
+
+    def test_cross_site(self):
+        row = {'estimator': 'Alice', 'id': '5'}
+        for headers in [
+            {'Content-Type': 'text/plain'},
+            {'Content-Type': 'application/x-www-form-urlencoded'},
+        ]:
+            self.assertEqual(
+                self.request('/tasks', row, headers=headers)[0], 415)
+        self.assertEqual(self.request('/tasks', row, headers={
+            'Content-Type': 'application/json', 'Host': 'evil.example.com',
+        })[0], 400)
+        self.assertFalse(self._store.task_exists('5'))
+        self.assertEqual(self.request('/tasks', row, headers={
+            'Content-Type': 'application/json; charset=utf-8',
+            'Host': '127.0.0.1:8000',
+        })[0], 201)
+
+    def test_refresh(self):
+        with store.Store(self._tmp) as s:
+            s.add_task('Alice', task.Task(id='5', estimate=1))
+        status, body = self.request('/tasks?estimator=Alice')
+        self.assertEqual([x['id'] for x in body['tasks']], ['5'])
@@ -0,0 +1,156 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from . import estimator
+from . import holiday
+from . import journal
+from . import store
+from . import task
+from . import tasktable
+
+
+_today = datetime.date.today()
+
+
+class JournalStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'ebs.json')
+        with journal.JournalStore(self._path) as s:
+            s.add_estimator(estimator.Estimator(
+                name='Bob', tasks=[task.Task(id='a', estimate=1, actual=2)]))
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _mutate(self, s):
+        s.add_estimator(estimator.Estimator(name='Jane'))
+        s.add_task('Bob', task.Task(id='b', estimate=4, date=_today))
+        s.add_task('Jane', task.Task(id='c', estimate=2))
+        s.move_task('b', 'Jane')
+        s.update_task('c', actual=1, completed=True)
+        s.remove_task('a')
+        s.add_event('Jane', task.Event(date=_today, cost=3))
+        s.add_holiday(_today)
+        s.add_holiday_rule(holiday.parse_rule('easter:+1'))
+        s.remove_estimator('Bob')
+
+    def _check(self, s):
+        self.assertEqual([e.name for e in s.estimators], ['Jane'])
+        jane = s.get_estimator('Jane')
+        self.assertEqual(
+            jane.tasks,
+            [
+                task.Task(id='c', estimate=2, actual=1, completed=True),
+                task.Task(id='b', estimate=4, date=_today),
+            ]
+        )
+        self.assertEqual(jane.velocities(), [2])
+        self.assertEqual(jane.events, [task.Event(date=_today, cost=3)])
+        self.assertEqual(list(s.holidays), [_today])
+        self.assertEqual(s.holiday_rules, [holiday.parse_rule('easter:+1')])
+
+    def test_detect_format(self):
+        self.assertEqual(store.detect_format(self._path), 'journal')
+        self.assertIsInstance(store.open_store(self._path), journal.JournalStore)
+        self.assertIsInstance(
+            store.open_store(os.path.join(self._dir, 'new'), journal=True),
+            journal.JournalStore
+        )
+
+    def test_append_and_replay(self):
+        before = os.stat(self._path)
+        with journal.JournalStore(self._path) as s:
+            self._mutate(s)
+        after = os.stat(self._path)
+        self.assertEqual(before.st_ino, after.st_ino)  # snapshot untouched
+        with open(self._path + '.journal') as fp:
+            self.assertEqual(len(fp.readlines()), 11)  # header + records
+        self._check(journal.JournalStore(self._path))
+
+    def test_add_tasks(self):
+        tasks = [task.Task(id='b', estimate=4), task.Task(id='c', estimate=2)]
+        with journal.JournalStore(self._path) as s:
+            s.add_tasks('Bob', tasks)
+            s.add_tasks('Bob', tasktable.TaskTable.from_records([['d', 'A']]))
+        s = journal.JournalStore(self._path)
+        self.assertEqual(
+            list(s.get_estimator('Bob').tasks)[1:],
+            tasks + [task.Task(id='d', project='A')])
+
+    def test_compaction(self):
+        with journal.JournalStore(self._path, limit=0) as s:
+            self._mutate(s)
+        with open(self._path + '.journal') as fp:
+            self.assertEqual(fp.readlines(), ['{"generation": 2}\n'])
+        self._check(journal.JournalStore(self._path))
+        self._check(store.Store(self._path))
+
+    def test_incomplete_record_ignored(self):
+        with journal.JournalStore(self._path) as s:
+            s.add_estimator(estimator.Estimator(name='Jane'))
+        with open(self._path + '.journal', 'a') as fp:
+            fp.write(journal.encode_record('remove_estimator', ['Jane'], {})[:-3])
+        s = journal.JournalStore(self._path)
+        self.assertTrue(s.estimator_exists('Jane'))
+
+    def test_stale_journal_ignored(self):
+        """A journal of an earlier generation is not replayed."""
+        with journal.JournalStore(self._path) as s:
+            s.add_estimator(estimator.Estimator(name='Jane'))
+        shutil.copy(self._path + '.journal', self._path + '.old')
+        journal.JournalStore(self._path).compact()
+        shutil.copy(self._path + '.old', self._path + '.journal')
+        s = journal.JournalStore(self._path)
+        self.assertEqual([e.name for e in s.estimators], ['Bob', 'Jane'])
+        with s:
+            s.add_holiday(_today)
+        self.assertEqual(
+            list(journal.JournalStore(self._path).holidays), [_today])
+
+    def test_discard(self):
+        s = journal.JournalStore(self._path)
+        s.add_estimator(estimator.Estimator(name='Jane'))
+        del s.data
+        s.flush()
+        self.assertFalse(
+            journal.JournalStore(self._path).estimator_exists('Jane'))
+
+    def test_compressed_snapshot(self):
+        path = os.path.join(self._dir, 'ebs.json.gz')
+        with journal.JournalStore(path, limit=0) as s:
+            s.add_estimator(estimator.Estimator(
+                name='Bob', tasks=[task.Task(id='a', estimate=1, actual=2)]))
+            self._mutate(s)
+        self.assertEqual(store.detect_compression(path), 'gzip')
+        self._check(journal.JournalStore(path))
+
+    def test_changed_on_disk(self):
+        reader = journal.JournalStore(self._path, readonly=True)
+        self.assertFalse(reader.changed_on_disk())
+        reader.estimators
+        with journal.JournalStore(self._path) as s:
+            s.add_holiday(_today)
+        self.assertTrue(reader.changed_on_disk())
+        self.assertTrue(reader.refresh())
+        self.assertEqual(list(reader.holidays), [_today])
+        self.assertFalse(reader.changed_on_disk())
@@ -0,0 +1,119 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from . import estimator
+from . import lock
+from . import store
+from . import task
+
+
+def _add_tasks(path, name, n):
+    for i in range(n):
+        with store.Store(path) as s:
+            s.add_task('Bob', task.Task(id='{}{}'.format(name, i)))
+
+
+@unittest.skipIf(lock.fcntl is None, 'fcntl not available')
+class FileLockTestCase(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'ebs.lock')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_exclusive(self):
+        a, b = lock.FileLock(self._path), lock.FileLock(self._path)
+        a.acquire()
+        with self.assertRaisesRegexp(UserWarning, r'Timed out'):
+            b.acquire(timeout=0.05)
+        with self.assertRaisesRegexp(UserWarning, r'Timed out'):
+            b.acquire(exclusive=False, timeout=0.05)
+        self.assertFalse(b.locked)
+        a.release()
+        b.acquire(timeout=0)
+        self.assertTrue(b.locked)
+        b.release()
+
+    def test_shared(self):
+        a, b = lock.FileLock(self._path), lock.FileLock(self._path)
+        a.acquire(exclusive=False)
+        b.acquire(exclusive=False, timeout=0)
+        with self.assertRaisesRegexp(UserWarning, r'Timed out'):
+            lock.FileLock(self._path).acquire(timeout=0.05)
+        a.release()
+        b.release()
+
+
+@unittest.skipIf(lock.fcntl is None, 'fcntl not available')
+class StoreLockTestCase(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'ebs.json')
+        with store.Store(self._path) as s:
+            s.add_estimator(estimator.Estimator(name='Bob'))
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_writer_excludes(self):
+        with store.Store(self._path):
+            with self.assertRaisesRegexp(UserWarning, r'Timed out'):
+                with store.Store(self._path, lock_timeout=0.05):
+                    pass
+
+    def test_readers_do_not_wait(self):
+        """Readers see the latest committed version during a write."""
+        with store.Store(self._path) as writer:
+            writer.add_estimator(estimator.Estimator(name='Jane'))
+            with store.Store(
+                self._path, readonly=True, lock_timeout=0
+            ) as reader:
+                self.assertFalse(reader.estimator_exists('Jane'))
+                writer.flush()
+                self.assertTrue(reader.changed_on_disk())
+                self.assertFalse(reader.estimator_exists('Jane'))
+                self.assertTrue(reader.refresh())
+                self.assertTrue(reader.estimator_exists('Jane'))
+                self.assertFalse(reader.changed_on_disk())
+                self.assertFalse(reader.refresh())
+
+    def test_readonly(self):
+        with store.Store(self._path, readonly=True) as a:
+            with store.open_store(self._path, readonly=True) as b:
+                self.assertTrue(b.estimator_exists('Bob'))
+                with self.assertRaisesRegexp(UserWarning, r'read-only'):
+                    b.add_estimator(estimator.Estimator(name='Jane'))
+
+    def test_concurrent_writers(self):
+        """Concurrent writers do not lose each other's modifications."""
+        procs = [
+            multiprocessing.Process(
+                target=_add_tasks, args=(self._path, name, 20))
+            for name in 'abc'
+        ]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        self.assertEqual(
+            len(store.Store(self._path).get_estimator('Bob').tasks), 60)
@@ -0,0 +1,108 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from . import estimator
+from . import sectionstore
+from . import store
+from . import task
+from . import test_stores
+
+
+_today = datetime.date.today()
+
+
+class SectionStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'ebs.sections')
+        test_stores.populate(sectionstore.SectionStore(self._path))
+        self._store = sectionstore.SectionStore(self._path)
+
+    def tearDown(self):
+        del self._store.data
+        shutil.rmtree(self._dir)
+
+    def _loaded(self):
+        return [
+            (e.name, name) for e in self._store.estimators
+            for name in sectionstore._estimator_sections if e.loaded(name)
+        ]
+
+    def test_lazy(self):
+        """Only the sections that are used are decoded."""
+        list(self._store.holidays)
+        self._store.get_estimator('Jane')
+        self.assertEqual(self._loaded(), [])
+        self.assertEqual(
+            [t.id for e, t in self._store.tasks(completed=False)], ['a', 'c'])
+        self._store.get_estimator('Bob').velocities()
+        self.assertEqual(
+            self._loaded(),
+            [('Bob', 'pending'), ('Bob', 'summary'), ('Jane', 'pending')]
+        )
+        list(self._store.tasks(estimators=['Jane']))
+        self.assertNotIn(('Bob', 'completed'), self._loaded())
+
+    def test_write_copies_undecoded_sections(self):
+        with self._store as s:
+            s.add_event('Jane', task.Event(date=_today, cost=1))
+            s.add_holiday(datetime.date(2013, 1, 1))
+        self.assertEqual(self._loaded(), [('Jane', 'events')])
+        del self._store.data
+        expected = test_stores.estimators()
+        expected[1].events.append(task.Event(date=_today, cost=1))
+        self.assertEqual(self._store.estimators, expected)
+        self.assertEqual(len(self._store.holidays), 2)
+        self.assertEqual(len(self._store.holiday_rules), 1)
+
+    def test_task_mutations(self):
+        with self._store as s:
+            s.update_task('a', actual=2, completed=True)
+            s.move_task('c', 'Bob')
+            s.remove_estimator('Jane')
+        del self._store.data
+        bob = self._store.get_estimator('Bob')
+        self.assertEqual([t.id for t in bob.pending_tasks()], ['c'])
+        self.assertEqual(
+            [t.id for t in bob.completed_tasks()], ['a', 'b'])
+        self.assertEqual([t.id for t in bob.tasks], ['a', 'b', 'c'])
+        self.assertEqual(bob.velocities(), [2.0 / 3, 2])
+
+    def test_not_sectioned(self):
+        with open(self._path, 'w') as fp:
+            store.write(fp, {})
+        with self.assertRaisesRegexp(UserWarning, r'Not a sectioned store'):
+            self._store.estimators
+
+    def test_reader_keeps_version(self):
+        """A reader decodes sections of the version it opened."""
+        reader = sectionstore.SectionStore(self._path, readonly=True)
+        reader.estimators
+        with sectionstore.SectionStore(self._path) as s:
+            s.remove_estimator('Bob')
+            s.add_estimator(estimator.Estimator(name='Kim'))
+        self.assertTrue(reader.changed_on_disk())
+        self.assertEqual(reader.estimators, test_stores.estimators())
+        reader.refresh()
+        self.assertEqual(
+            [e.name for e in reader.estimators], ['Jane', 'Kim'])
+        del reader.data
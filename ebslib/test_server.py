@@ -0,0 +1,179 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import socket
+import StringIO
+import sys
+import tempfile
+import threading
+import unittest
+
+from . import client
+from . import config
+from . import estimator
+from . import server
+from . import store
+from . import task
+
+
+class ServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._tmp = os.path.join(self._dir, 'ebs')
+        with store.Store(self._tmp) as s:
+            s.add_estimator(estimator.Estimator('Bob'))
+            s.add_task('Bob', task.Task(id='1', estimate=2))
+        self._store = store.Store(self._tmp)
+        self._socket = client.socket_filename(self._tmp)
+        self._server = server.Server(self._socket, self._store)
+        self._stdout, self._stderr = sys.stdout, sys.stderr
+        sys.stdout = server._ThreadStream('stdout', sys.stdout)
+        sys.stderr = server._ThreadStream('stderr', sys.stderr)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self._cwd = os.getcwd()
+        os.chdir(self._dir)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._server.shutdown()
+        self._server.server_close()
+        sys.stdout, sys.stderr = self._stdout, self._stderr
+        shutil.rmtree(self._dir)
+
+    def request(self, *argv):
+        return client.request(self._socket, list(argv) + ['--store', 'ebs'])
+
+    def test_read(self):
+        reply = self.request('lstask')
+        self.assertEqual(reply['status'], 0)
+        self.assertEqual(reply['stdout'], 'E   1 Bob: None\n')
+        self.assertEqual(reply['stderr'], '')
+
+    def test_write(self):
+        reply = self.request(
+            'addtask', '--estimator', 'Bob', '--id', '2', '--estimate', '2')
+        self.assertEqual(reply['status'], 0)
+        self.assertTrue(store.Store(self._tmp).task_exists('2'))
+        reply = self.request('lstask', '--id', '2')
+        self.assertEqual(reply['stdout'], 'E   2 Bob: None\n')
+
+    def test_error(self):
+        with open(self._tmp) as fp:
+            data = fp.read()
+        reply = self.request(
+            'addtask', '--estimator', 'Alice', '--id', '2', '--estimate', '2')
+        self.assertEqual(reply['status'], 1)
+        self.assertEqual(
+            reply['stderr'], 'ebs: Estimator does not exist: Alice\n')
+        with open(self._tmp) as fp:
+            self.assertEqual(fp.read(), data)
+        reply = self.request('addtask', '--estimator', 'Bob')
+        self.assertEqual(reply['status'], 2)
+        self.assertRegexpMatches(reply['stderr'], r'required')
+
+    def test_not_run(self):
+        for argv in [
+            ['nosuchcommand'],
+            ['help'],
+            ['export'],
+            ['serve'],
+            ['lstask', '--store', 'other'],
+        ]:
+            self.assertIsNone(
+                client.request(self._socket, argv)['status'], argv)
+            self.assertIsNone(client.forward(argv))
+
+    def test_refresh(self):
+        with store.Store(self._tmp) as s:
+            s.add_task('Bob', task.Task(id='2', estimate=1))
+        reply = self.request('lstask', '--id', '2')
+        self.assertEqual(reply['stdout'], 'E   2 Bob: None\n')
+
+    def test_config_refresh(self):
+        """Forwarded commands see changes to the configuration."""
+        path = os.path.join(self._dir, 'ebsrc')
+        instances = config.Config._instances
+        self.addCleanup(instances.update, dict(instances))
+        self.addCleanup(instances.clear)
+        with open(path, 'w') as fp:
+            fp.write('[core]\nhours_per_day = 8\n')
+        instances[os.path.expanduser('~/.ebsrc')] = config.Config(path)
+        argv = [
+            'addevent', '--estimator', 'Bob', '--date', '2012-01-02',
+            '--cost', '6']
+        self.assertEqual(self.request(*argv)['status'], 0)
+        with open(path, 'w') as fp:
+            fp.write('[core]\nhours_per_day = 4.0\n')
+        reply = self.request(*argv)
+        self.assertEqual(reply['status'], 1)
+        self.assertRegexpMatches(reply['stderr'], r'greater than one day')
+
+    def test_no_server(self):
+        self.assertIsNone(client.request(self._tmp + '.nosock', ['lstask']))
+
+    def test_no_reply(self):
+        filename = self._tmp + '.other.sock'
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(filename)
+        sock.listen(1)
+
+        def accept():
+            conn, address = sock.accept()
+            conn.recv(65536)
+            conn.close()  # as if the server died before replying
+
+        thread = threading.Thread(target=accept)
+        thread.start()
+        stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            status = client.forward(['addtask', '--store', filename[:-5]])
+            message = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+            thread.join()
+            sock.close()
+        self.assertEqual(status, 1)  # not None: not to be run again
+        self.assertRegexpMatches(message, r'no reply')
+
+
+class ReadWriteLockTestCase(unittest.TestCase):
+    def test_readers(self):
+        lock = server.ReadWriteLock()
+        with lock.read():
+            with lock.read():
+                self.assertEqual(lock._readers, 2)
+        with lock.write():
+            self.assertTrue(lock._writing)
+        self.assertFalse(lock._writing)
+
+    def test_writer_waits(self):
+        lock = server.ReadWriteLock()
+        events = []
+        with lock.read():
+            def write():
+                with lock.write():
+                    events.append('write')
+            thread = threading.Thread(target=write)
+            thread.start()
+            thread.join(0.05)
+            events.append('read')
+        thread.join()
+        self.assertEqual(events, ['read', 'write'])
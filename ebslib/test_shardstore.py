@@ -0,0 +1,164 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from . import estimator
+from . import shardstore
+from . import store
+from . import task
+from . import test_stores
+
+
+_today = datetime.date.today()
+
+
+def _estimators():
+    """The shared estimators, named to need quoting in shard names."""
+    bob, jane = test_stores.estimators()
+    bob.name, jane.name = 'bob@example.com', 'Jane/Doe'
+    return [bob, jane, estimator.Estimator('Joe')]
+
+
+class ShardedStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'ebs')
+        test_stores.populate(shardstore.ShardedStore(self._path), _estimators)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _shards(self):
+        """Return the shard files."""
+        return set(os.listdir(self._path)) - set(['manifest.json'])
+
+    def test_detect_format(self):
+        self.assertIsInstance(
+            store.open_store(self._path + os.sep), shardstore.ShardedStore)
+
+    def test_read(self):
+        s = shardstore.ShardedStore(self._path)
+        self.assertEqual(
+            sorted(s.holidays), [datetime.date(2012, 1, 1)])
+        self.assertNotIn('estimators', s.data)  # no shards read
+        self.assertEqual(s.estimators, _estimators())
+
+    def test_lookups_read_needed_shards(self):
+        s = shardstore.ShardedStore(self._path)
+        self.assertEqual(s.get_task('c')[0].name, 'Jane/Doe')
+        self.assertTrue(s.task_exists('a'))
+        self.assertFalse(s.task_exists('z'))
+        self.assertTrue(s.estimator_exists('Joe'))
+        self.assertEqual(s.get_estimator('Joe').tasks, [])
+        self.assertEqual(
+            [t.id for e, t in s.tasks(ids=['d', 'z'])], ['d'])
+        self.assertEqual(
+            [t.id for e, t in s.tasks(estimators=['Jane/Doe'])], ['d', 'c'])
+        self.assertEqual(sorted(s._shards), ['Jane/Doe', 'Joe'])
+        with s:
+            s.remove_task('d')
+            s.update_task('c', actual=5)
+        self.assertEqual(sorted(s._shards), ['Jane/Doe', 'Joe'])
+        s = shardstore.ShardedStore(self._path)
+        self.assertFalse(s.task_exists('d'))
+        self.assertEqual(s.get_task('c')[1].actual, 5)
+        self.assertEqual(
+            [t.id for e, t in s.tasks()], ['a', 'b', 'c'])
+
+    def test_read_manifest_without_ids(self):
+        """Manifests that do not record task IDs are read."""
+        manifest = store.read_file(os.path.join(self._path, 'manifest.json'))
+        manifest['shards'] = [entry[:2] for entry in manifest['shards']]
+        store.write_file(os.path.join(self._path, 'manifest.json'), manifest)
+        s = shardstore.ShardedStore(self._path)
+        self.assertEqual(s.get_task('c')[0].name, 'Jane/Doe')
+        self.assertEqual(s.estimators, _estimators())  # all shards read
+        with s:
+            s.remove_task('a')
+        s = shardstore.ShardedStore(self._path)
+        self.assertEqual(s.get_task('b')[0].name, 'bob@example.com')
+        self.assertEqual(len(s._shards), 1)
+
+    def test_write_modified_shards(self):
+        shards = self._shards()
+        self.assertEqual(sorted(shards), [
+            'Jane%2FDoe.1.json', 'Joe.1.json', 'bob@example.com.1.json'])
+        with shardstore.ShardedStore(self._path) as s:
+            s.update_task('c', actual=5)
+        self.assertEqual(
+            self._shards() - shards, set(['Jane%2FDoe.2.json']))
+        shards = self._shards()
+        with shardstore.ShardedStore(self._path) as s:
+            s.move_task('a', 'Joe')
+            s.add_holiday(datetime.date(2012, 1, 2))
+        self.assertEqual(
+            sorted(self._shards() - shards),
+            ['Joe.3.json', 'bob@example.com.3.json'])
+        self.assertEqual(len(self._shards()), 3)  # old shards deleted
+        s = shardstore.ShardedStore(self._path)
+        self.assertEqual(s.get_task('c')[1].actual, 5)
+        self.assertEqual(s.get_task('a')[0].name, 'Joe')
+        self.assertEqual(len(s.holidays), 2)
+
+    def test_failed_commit(self):
+        shards = self._shards()
+        write_file = store.write_file
+        writes = []
+
+        def failing_write_file(filename, data, *args):
+            writes.append(filename)
+            if len(writes) == 2:
+                raise IOError('disk full')
+            write_file(filename, data, *args)
+
+        store.write_file = failing_write_file
+        try:
+            with self.assertRaises(IOError):
+                with shardstore.ShardedStore(self._path) as s:
+                    s.move_task('a', 'Joe')
+        finally:
+            store.write_file = write_file
+        s = shardstore.ShardedStore(self._path)
+        self.assertEqual(s.estimators, _estimators())  # previous version
+        with shardstore.ShardedStore(self._path) as s:
+            s.move_task('a', 'Joe')
+        self.assertEqual(len(self._shards()), 3)  # partial write removed
+        self.assertEqual(
+            shardstore.ShardedStore(self._path).get_task('a')[0].name, 'Joe')
+
+    def test_read_replaced_shards(self):
+        reader = shardstore.ShardedStore(self._path)
+        self.assertEqual(len(reader.holidays), 1)  # manifest read
+        with shardstore.ShardedStore(self._path) as s:
+            s.move_task('a', 'Joe')
+        self.assertEqual(reader.get_task('a')[0].name, 'Joe')
+
+    def test_remove_estimator(self):
+        with shardstore.ShardedStore(self._path) as s:
+            s.remove_estimator('Jane/Doe')
+            s.add_task('Joe', task.Task(id='d', estimate=1))
+        self.assertEqual(
+            sorted(self._shards()),
+            ['Joe.2.json', 'bob@example.com.1.json'])
+        s = shardstore.ShardedStore(self._path)
+        self.assertEqual(
+            [e.name for e in s.estimators], ['bob@example.com', 'Joe'])
+        self.assertEqual(s.get_task('d')[0].name, 'Joe')
@@ -0,0 +1,132 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from . import estimator
+from . import sqlstore
+from . import store
+from . import task
+from . import test_stores
+
+
+_today = datetime.date.today()
+
+
+class SQLiteStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'ebs.db')
+        test_stores.populate(sqlstore.SQLiteStore(self._path))
+        self._store = sqlstore.SQLiteStore(self._path)
+
+    def tearDown(self):
+        self._store.close()
+        shutil.rmtree(self._dir)
+
+    def test_read(self):
+        e, t = self._store.get_task('b')
+        self.assertFalse(e.loaded)  # only the row of the task was read
+        self.assertIs(
+            self._store.get_estimator('Bob'), self._store.get_estimator('Bob'))
+        e, t = self._store.get_task('b')
+        self.assertEqual(e.name, 'Bob')
+        self.assertEqual(t, task.Task(id='b', estimate=2, actual=3, date=_today))
+        self.assertIn(t, e.tasks)
+        self.assertIs(self._store.get_task('b')[1], t)
+        self.assertEqual(e.velocities(), [2 / 3.0])
+
+    def test_integral_costs(self):
+        """Integral costs are read back as ints, as other stores do."""
+        with self._store as s:
+            s.update_task('c', actual=12.5)
+            s.archive_tasks(_today + datetime.timedelta(days=1))
+        self.assertIs(type(self._store.get_task('a')[1].estimate), int)
+        self.assertEqual(self._store.get_task('c')[1].actual, 12.5)
+        e = self._store.get_estimator('Bob')
+        self.assertEqual([type(x.cost) for x in e.events], [int])
+        self.assertEqual(
+            [(type(x.estimate), type(x.actual))
+                for x in self._store.archived_tasks('Bob')],
+            [(int, int)])
+
+    def test_single_task_mutations(self):
+        """Verify that tasks are modified without reading estimators."""
+        with self._store as s:
+            s.update_task('c', actual=5, completed=True)
+            s.remove_task('d')
+            s.move_task('a', 'Jane')
+            self.assertFalse(any(e.loaded for e in s._estimators.values()))
+        jane = self._store.get_estimator('Jane')
+        self.assertEqual([t.id for t in jane.tasks], ['a', 'c'])
+        self.assertEqual(jane.velocities(), [2])
+
+    def test_indexes(self):
+        indexes = set(name for name, in self._store._execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"))
+        for column in ('id', 'estimator', 'project', 'priority', 'completed'):
+            self.assertIn('task_' + column, indexes)
+
+    def test_filtered_tasks(self):
+        ids = lambda **kw: [t.id for e, t in self._store.tasks(**kw)]
+        # only the estimators involved are loaded
+        self.assertEqual(ids(estimators=['Jane']), ['d', 'c'])
+        self.assertItemsEqual(self._store._estimators, ['Jane'])
+        self.assertFalse(self._store.get_estimator('Jane').loaded)
+        self.assertEqual(ids(), ['a', 'b', 'd', 'c'])
+        self.assertEqual(ids(projects=['A']), ['a', 'd'])
+        self.assertEqual(ids(estimators=['Jane']), ['d', 'c'])
+        self.assertEqual(ids(completed=False), ['a', 'c'])
+        self.assertEqual(ids(priority=2), ['a', 'b', 'd'])
+        self.assertEqual(ids(ids=['b', 'c'], completed=True), ['b'])
+
+    def test_mutations(self):
+        with self._store as s:
+            s.add_task('Jane', task.Task(id='e', estimate=1))
+            s.move_task('a', 'Jane')
+            s.update_task('c', actual=5, completed=True)
+            s.remove_task('d')
+            s.add_event('Jane', task.Event(date=_today, cost=1))
+            s.remove_holiday(datetime.date(2012, 1, 1))
+            s.remove_estimator('Bob')
+        with self.assertRaisesRegexp(UserWarning, r'exists'):
+            self._store.add_task('Jane', task.Task(id='a'))
+        jane = self._store.get_estimator('Jane')
+        self.assertEqual([t.id for t in jane.tasks], ['a', 'c', 'e'])
+        self.assertEqual(jane.velocities(), [2])
+        self.assertEqual(len(jane.events), 1)
+        self.assertFalse(self._store.estimator_exists('Bob'))
+        self.assertFalse(self._store.task_exists('b'))
+        self.assertEqual(list(self._store.holidays), [])
+
+    def test_uncommitted_changes_discarded(self):
+        self._store.add_task('Jane', task.Task(id='e', estimate=1))
+        self._store.close()
+        self.assertFalse(self._store.task_exists('e'))
+
+    def test_copy_duplicate_ids(self):
+        db_path = os.path.join(self._dir, 'copy.db')
+        with sqlstore.SQLiteStore(db_path) as s:
+            s.add_estimator(estimator.Estimator.from_dict(
+                {'name': 'Jane', 'tasks': [{'id': 'a'}]}))
+            with self.assertRaisesRegexp(UserWarning, r'Task exists: a'):
+                store.copy(self._store, s)
+            self.assertFalse(s.estimator_exists('Bob'))
+            self.assertFalse(s.task_exists('b'))
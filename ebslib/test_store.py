@@ -15,13 +15,20 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import datetime
+import json
 import tempfile
 import os
+import shutil
 import unittest
 
 from . import task
+from . import colstore
 from . import estimator
+from . import holiday
+from . import journal
+from . import sqlstore
 from . import store
+from . import tasktable
 
 
 _estimators = [
@@ -45,7 +52,10 @@ _estimators = [
     },
 ]
 _holidays = [datetime.date(2012, 1, 1)]
-_data = {'estimators': _estimators, 'holidays': _holidays}
+_data = {
+    'estimators': _estimators,
+    'holidays': holiday.HolidayIndex(_holidays),
+}
 
 
 class EmptyStoreTestCase(unittest.TestCase):
@@ -100,6 +110,8 @@ class StoreTestCase(unittest.TestCase):
     def tearDown(self):
         del self._store
         os.unlink(self._tmp)
+        if os.path.exists(self._tmp + '.lock'):
+            os.unlink(self._tmp + '.lock')
         del self._tmp
 
     def test_write_and_read(self):
@@ -109,6 +121,60 @@ class StoreTestCase(unittest.TestCase):
             fp.seek(0)
             self.assertEqual(_data, store.read(fp))
 
+    def test_read_in_chunks(self):
+        """Verify that values split across reads are decoded."""
+        with tempfile.TemporaryFile() as fp:
+            store.write(fp, dict(_data, generation=12345))
+            fp.seek(0)
+            self.assertEqual(fp.read(11), '{"codec":1,')
+            fp.seek(0)
+            chunk_size = store._chunk_size
+            store._chunk_size = 3
+            try:
+                self.assertEqual(
+                    dict(_data, generation=12345), store.read(fp))
+            finally:
+                store._chunk_size = chunk_size
+        for text, value in [
+            ('{}', {}), (' [1, 2] ', [1, 2]), ('12345', 12345),
+        ]:
+            with tempfile.TemporaryFile() as fp:
+                fp.write(text)
+                fp.seek(0)
+                self.assertEqual(store.read(fp), value)
+        for text in ['', '{', '{"codec":1,}', '{"a":1} 2', '[1,2']:
+            with tempfile.TemporaryFile() as fp:
+                fp.write(text)
+                fp.seek(0)
+                with self.assertRaises(ValueError):
+                    store.read(fp)
+
+    def test_read_generic_encoding(self):
+        """Verify that data written by the generic encoder are read."""
+        with tempfile.TemporaryFile() as fp:
+            json.dump(_data, fp, default=store._serialise)
+            fp.seek(0)
+            self.assertEqual(_data, store.read(fp))
+
+    def test_read_legacy(self):
+        """Verify that stores written before the codec are read."""
+        doc = {'estimators': [{'name': 'Bob', 'events': [], 'tasks': [
+            {'id': '1', 'project': None, 'description': None,
+                'priority': None, 'estimate': 2, 'date': None,
+                'completed': True, 'actual': 2},
+            {'id': '2', 'project': None, 'description': None,
+                'priority': None, 'estimate': 3,
+                'date': {'__date__': True, 'ymd': [2012, 1, 1]},
+                'completed': True, 'actual': 3},
+        ]}]}
+        with open(self._tmp, 'w') as fp:
+            json.dump(doc, fp)
+        del self._store.data
+        bob = self._store.get_estimator('Bob')
+        self.assertEqual(bob.velocities(), [1, 1])
+        self.assertEqual(self._store.get_task('2')[1].date,
+            datetime.date(2012, 1, 1))
+
     def test_get_task(self):
         _estimator, _task = self._store.get_task(1)
         self.assertEqual(
@@ -119,6 +185,257 @@ class StoreTestCase(unittest.TestCase):
 
     def test_get_holidays(self):
         self.assertEqual(
-            self._store.holidays,
+            list(self._store.holidays),
             _holidays
         )
+
+    def test_holiday_rules(self):
+        self.assertEqual(self._store.holiday_rules, [])
+        self._store.add_holiday_rule(holiday.parse_rule('annual:12-25'))
+        self._store.flush()
+        del self._store.data
+        self.assertEqual(
+            self._store.holiday_rules,
+            [holiday.AnnualRule(12, 25)]
+        )
+        calendar = self._store.holiday_calendar()
+        self.assertIn(datetime.date(2012, 1, 1), calendar)
+        self.assertIn(datetime.date(2030, 12, 25), calendar)
+        self.assertNotIn(datetime.date(2030, 12, 24), calendar)
+
+    def test_read_only_does_not_write(self):
+        """Reading data does not rewrite the file."""
+        before = os.stat(self._tmp)
+        with self._store as s:
+            s.estimators
+            s.holidays
+            s.holiday_calendar()
+            s.get_task(1)
+            self.assertFalse(s.dirty)
+        after = os.stat(self._tmp)
+        self.assertEqual(before.st_ino, after.st_ino)
+        self.assertEqual(before.st_mtime, after.st_mtime)
+
+    def test_mutation_writes_atomically(self):
+        before = os.stat(self._tmp)
+        with self._store as s:
+            s.add_task('Jane', task.Task(id='new', estimate=3))
+            self.assertTrue(s.dirty)
+        self.assertFalse(self._store.dirty)
+        after = os.stat(self._tmp)
+        self.assertNotEqual(before.st_ino, after.st_ino)  # replaced
+        self.assertEqual(before.st_mode, after.st_mode)
+        self.assertEqual(
+            os.listdir(os.path.dirname(self._tmp)).count(
+                os.path.basename(self._tmp)),
+            1
+        )
+        del self._store.data
+        self.assertEqual(self._store.get_task('new')[0].name, 'Jane')
+
+    def test_task_mutations(self):
+        self._store.add_estimator(estimator.Estimator(name='Kim'))
+        with self.assertRaisesRegexp(UserWarning, r'exists'):
+            self._store.add_estimator(estimator.Estimator(name='Kim'))
+        with self.assertRaisesRegexp(UserWarning, r'exists'):
+            self._store.add_task('Kim', task.Task(id=1))
+        self._store.move_task(1, 'Kim')
+        self.assertEqual(self._store.get_task(1)[0].name, 'Kim')
+        self._store.update_task(1, actual=2, completed=True)
+        self.assertEqual(self._store.get_estimator('Kim').velocities(), [2])
+        self.assertEqual(self._store.remove_task(1)[0].name, 'Kim')
+        self.assertFalse(self._store.task_exists(1))
+        self.assertEqual(self._store.remove_estimator('Kim').name, 'Kim')
+        self.assertFalse(self._store.estimator_exists('Kim'))
+
+    def test_add_tasks(self):
+        tasks = [
+            task.Task(id='x', estimate=2, actual=1),
+            task.Task(id='y', estimate=3, actual=3),
+        ]
+        with self.assertRaisesRegexp(UserWarning, r'exists: 1'):
+            self._store.add_tasks('Jane', tasks + [task.Task(id=1)])
+        with self.assertRaisesRegexp(UserWarning, r'exists: x'):
+            self._store.add_tasks('Jane', tasks + [task.Task(id='x')])
+        self.assertFalse(self._store.task_exists('x'))  # none added
+        self._store.add_tasks('Jane', tasks)
+        self.assertEqual(self._store.get_task('y')[0].name, 'Jane')
+        jane = self._store.get_estimator('Jane')
+        self.assertEqual(
+            jane.summary, estimator.VelocitySummary.from_tasks(jane.tasks))
+        self._store.flush()
+        del self._store.data
+        self.assertEqual(self._store.get_task('x')[1], tasks[0])
+        table = tasktable.TaskTable.from_records([['z', None, None, 1]])
+        with self.assertRaisesRegexp(UserWarning, r'exists: x'):
+            self._store.add_tasks(
+                'Jane', tasktable.TaskTable.from_records([['x']]))
+        self._store.add_tasks('Jane', table)
+        self.assertEqual(
+            self._store.get_task('z')[1], task.Task(id='z', priority=1))
+
+    def test_tasks_without_id(self):
+        """Any number of tasks may lack an ID; they are not indexed."""
+        jane = self._store.get_estimator('Jane')
+        count = len(jane.tasks)
+        self._store.add_task('Jane', task.Task(estimate=1))
+        self._store.add_tasks('Jane', [task.Task(), task.Task()])
+        self.assertEqual(len(jane.tasks), count + 3)
+        self.assertFalse(self._store.task_exists(None))
+        self.assertEqual(list(self._store.tasks(ids=[None])), [])
+
+    def test_indexes(self):
+        """Lookups by name and ID follow mutations of the store."""
+        self.assertFalse(self._store.task_exists(None))
+        self._store.add_task('Jane', task.Task(id=2, estimate=1))
+        self.assertEqual(
+            [t.id for e, t in self._store.tasks(ids=[2, 1, 'x', 2])],
+            [1, 2]  # in store order, once each
+        )
+        self.assertEqual(
+            list(self._store.tasks(ids=[2], estimators=['Bob'])), [])
+        self._store.remove_estimator('Jane')
+        self.assertFalse(self._store.task_exists(2))
+        with self.assertRaisesRegexp(UserWarning, r'does not exist'):
+            self._store.get_estimator('Jane')
+        self._store.add_estimator(estimator.Estimator.from_dict(
+            {'name': 'Kim', 'tasks': [{'id': 3, 'estimate': 1}]}))
+        self.assertEqual(self._store.get_task(3)[0].name, 'Kim')
+        del self._store.data
+        self.assertTrue(self._store.estimator_exists('Jane'))
+        self.assertFalse(self._store.task_exists(3))
+        self.assertTrue(self._store.task_exists(1))
+
+
+class CompressedStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _round_trip(self, filename, compression, level=None):
+        path = os.path.join(self._dir, filename)
+        with store.Store(path, compression_level=level) as s:
+            for e in _estimators:
+                s.add_estimator(e)
+            s.add_holiday(_holidays[0])
+        self.assertEqual(store.detect_compression(path), compression)
+        os.rename(path, path + '.moved')  # detected by magic, not name
+        s = store.Store(path + '.moved')
+        self.assertEqual(s.data, _data)
+        with s:
+            s.add_holiday(datetime.date(2013, 1, 1))
+        self.assertEqual(
+            store.detect_compression(path + '.moved'), compression)
+        return os.path.getsize(path + '.moved')
+
+    def test_uncompressed(self):
+        self._round_trip('ebs.json', None)
+
+    def test_gzip(self):
+        fast = self._round_trip('fast.gz', 'gzip', level=1)
+        best = self._round_trip('best.gz', 'gzip', level=9)
+        self.assertLessEqual(best, fast)
+
+    @unittest.skipIf(store.lzma is None, 'lzma module not available')
+    def test_xz(self):
+        self._round_trip('ebs.xz', 'xz')
+
+    @unittest.skipIf(store.lzma is not None, 'lzma module available')
+    def test_xz_unavailable(self):
+        path = os.path.join(self._dir, 'ebs.xz')
+        with self.assertRaisesRegexp(UserWarning, r'lzma'):
+            with store.Store(path) as s:
+                s.add_holiday(_holidays[0])
+
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'ebs.json')
+        old = datetime.date.today() - datetime.timedelta(days=100)
+        with store.Store(self._path) as s:
+            s.add_estimator(estimator.Estimator.from_dict({
+                'name': 'Bob',
+                'tasks': [
+                    {'id': 'a', 'estimate': 2, 'actual': 1, 'date': old},
+                    {'id': 'b', 'estimate': 3, 'actual': 1},
+                    {'id': 'c', 'estimate': 4},
+                ],
+            }))
+            s.add_estimator(estimator.Estimator.from_dict({
+                'name': 'Jane',
+                'tasks': [
+                    {'id': 'd', 'estimate': 1, 'actual': 4, 'date': old},
+                ],
+            }))
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _archive(self, s):
+        with s:
+            self.assertEqual(s.archive_tasks(datetime.date.today()), 2)
+
+    def test_archive(self):
+        self._archive(store.Store(self._path))
+        s = store.Store(self._path)
+        bob = s.get_estimator('Bob')
+        self.assertEqual([t.id for t in bob.tasks], ['b', 'c'])
+        self.assertIsNone(s._archive)  # archive not read
+        self.assertEqual(bob.velocities(), [2, 3])
+        self.assertFalse(s.task_exists('a'))
+        self.assertTrue(s.task_archived('a'))
+        self.assertEqual(
+            s.archived_tasks('Bob'),
+            [task.ArchivedTask('a', 2, 1, bob.summary.entries[0][1])]
+        )
+        with s:
+            s.remove_estimator('Jane')
+        self.assertFalse(store.Store(self._path).task_archived('d'))
+
+    def test_copy(self):
+        """Archived tasks are copied, and used by the columnar store."""
+        self._archive(store.Store(self._path))
+        path = os.path.join(self._dir, 'ebs.col')
+        with colstore.ColumnStore(path) as s:
+            store.copy(store.Store(self._path), s)
+        s = colstore.ColumnStore(path)
+        self.assertEqual(s.get_estimator('Bob').velocities(), [2, 3])
+        self.assertEqual(s.get_estimator('Jane').velocities(), [0.25])
+        self.assertEqual([t.id for t in s.get_estimator('Jane').tasks], [])
+        self.assertEqual(s.get_estimator('Jane').summary.count, 1)
+        del s.data
+
+    def test_journal(self):
+        """Archiving a journaled store compacts it."""
+        self._archive(journal.JournalStore(self._path))
+        s = journal.JournalStore(self._path)
+        self.assertEqual(
+            [t.id for t in s.get_estimator('Bob').tasks], ['b', 'c'])
+        self.assertTrue(s.task_archived('a'))
+
+    def test_sqlite(self):
+        """Archived tasks are copied to, and archived by, SQLite stores."""
+        self._archive(store.Store(self._path))
+        path = os.path.join(self._dir, 'ebs.db')
+        with sqlstore.SQLiteStore(path) as s:
+            store.copy(store.Store(self._path), s)
+        s = sqlstore.SQLiteStore(path)
+        self.assertEqual(s.get_estimator('Bob').velocities(), [2, 3])
+        self.assertEqual(s.get_estimator('Jane').summary.count, 1)
+        self.assertTrue(s.task_archived('a'))
+        with self.assertRaisesRegexp(UserWarning, r'archived'):
+            s.add_task('Bob', task.Task(id='a'))
+        s.close()
+        with sqlstore.SQLiteStore(path) as s:
+            s.update_task('b', date=datetime.date(2000, 1, 1))
+            self.assertEqual(s.archive_tasks(datetime.date.today()), 1)
+        s = sqlstore.SQLiteStore(path)
+        bob = s.get_estimator('Bob')
+        self.assertEqual([t.id for t in bob.tasks], ['c'])
+        self.assertEqual(bob.velocities(), [2, 3])
+        self.assertEqual(
+            [t.id for t in s.archived_tasks('Bob')], ['a', 'b'])
+        s.close()
@@ -0,0 +1,125 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests common to every kind of store, and the data they store.
+
+``estimators`` and ``populate`` give the data stored by the tests of
+each kind of store.
+"""
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from . import colstore
+from . import estimator
+from . import holiday
+from . import sectionstore
+from . import shardstore
+from . import sqlstore
+from . import store
+
+
+_today = datetime.date.today()
+
+
+def estimators():
+    """Return the estimators stored by the tests.
+
+    A completed task of Jane comes before a pending one, so that the
+    order of tasks is seen to be kept.
+    """
+    return [
+        estimator.Estimator.from_dict({
+            'name': 'Bob',
+            'tasks': [
+                {'id': 'a', 'estimate': 4, 'project': 'A', 'priority': 1},
+                {'id': 'b', 'estimate': 2, 'actual': 3, 'date': _today},
+            ],
+            'events': [{'date': _today, 'cost': 2, 'description': 'Bar'}]
+        }),
+        estimator.Estimator.from_dict({
+            'name': 'Jane',
+            'tasks': [
+                {'id': 'd', 'estimate': 20, 'actual': 25, 'project': 'A'},
+                {'id': 'c', 'estimate': 10, 'project': 'B', 'priority': 3},
+            ],
+        }),
+    ]
+
+
+def populate(s, estimators=estimators):
+    """Add the estimators, a holiday and a holiday rule to the store."""
+    with s:
+        for e in estimators():
+            s.add_estimator(e)
+        s.add_holiday(datetime.date(2012, 1, 1))
+        s.add_holiday_rule(holiday.parse_rule('annual:12-25'))
+
+
+_backends = [
+    ('json', store.Store, 'ebs.json'),
+    ('sqlite', sqlstore.SQLiteStore, 'ebs.db'),
+    ('sections', sectionstore.SectionStore, 'ebs.sections'),
+    ('columnar', colstore.ColumnStore, 'ebs.col'),
+    ('sharded', shardstore.ShardedStore, 'ebs'),
+]
+"""Format, class and file name of each kind of store."""
+
+
+class BackendTestCase(unittest.TestCase):
+    """Verify that every kind of store keeps what is stored in it."""
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _path(self, filename):
+        return os.path.join(self._dir, filename)
+
+    def test_round_trip(self):
+        for format, cls, filename in _backends:
+            path = self._path(filename)
+            populate(cls(path))
+            self.assertEqual(store.detect_format(path), format)
+            s = store.open_store(path)
+            self.assertIsInstance(s, cls)
+            self.assertEqual(s.estimators, estimators(), format)
+            self.assertEqual(
+                [t.id for e, t in s.tasks()], ['a', 'b', 'd', 'c'], format)
+            self.assertEqual(
+                list(s.holidays), [datetime.date(2012, 1, 1)], format)
+            self.assertEqual(
+                s.holiday_rules, [holiday.parse_rule('annual:12-25')],
+                format)
+
+    def test_copy(self):
+        """Copying a store to each kind of store and back changes nothing."""
+        source = store.Store(self._path('source.json'))
+        populate(source)
+        for format, cls, filename in _backends:
+            path = self._path(filename)
+            with cls(path) as s:
+                store.copy(source, s)
+            copy = store.Store(self._path(format + '.json'))
+            with copy:
+                store.copy(cls(path), copy)
+            with open(source.filename) as a, open(copy.filename) as b:
+                self.assertEqual(a.read(), b.read(), format)
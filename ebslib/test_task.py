@@ -26,6 +26,7 @@ from . import task
 _today = datetime.date.today()
 _tomorrow = _today + datetime.timedelta(days=1)
 _yesterday = _today - datetime.timedelta(days=1)
+_public_slots = set(x for x in task.Task.__slots__ if not x.startswith('_'))
 
 
 class TaskTestCase(unittest.TestCase):
@@ -46,7 +47,7 @@ class TaskTestCase(unittest.TestCase):
             estimate=1, date=_today, completed=True, actual=2
         )
         self.assertEqual(task.Task.from_dict(data), task.Task.from_dict(data))
-        self.assertSetEqual(set(data.viewkeys()), task.Task.__slots__)
+        self.assertSetEqual(set(data.viewkeys()), _public_slots)
 
     def test_ne(self):
         # check one differing attribute at a time
@@ -65,7 +66,26 @@ class TaskTestCase(unittest.TestCase):
             _data.update({key: other_data[key]})
             self.assertNotEqual(t, task.Task.from_dict(_data))
             checked_attrs.add(key)
-        self.assertSetEqual(checked_attrs, task.Task.__slots__)
+        self.assertSetEqual(checked_attrs, _public_slots)
+
+    def test_fingerprint(self):
+        t = task.Task(id='a', description='Foo', estimate=2, date=_yesterday)
+        same = task.Task(id=u'a', description=u'Foo', estimate=2.0,
+            date=_yesterday)
+        self.assertEqual(t.fingerprint, same.fingerprint)
+        same.actual = 1
+        self.assertNotEqual(t.fingerprint, same.fingerprint)
+        same.actual = 0
+        self.assertEqual(t.fingerprint, same.fingerprint)
+
+    def test_fingerprint_cached(self):
+        t = task.Task(id='a', estimate=2)
+        self.assertIsNone(t._fingerprint)
+        fingerprint = t.fingerprint
+        self.assertEqual(t._fingerprint, fingerprint)
+        t.project = 'A'
+        self.assertIsNone(t._fingerprint)
+        self.assertNotEqual(t.fingerprint, fingerprint)
 
     def test_completed(self):
         t = task.Task(estimate=1)
@@ -137,3 +157,16 @@ class EventTestCase(unittest.TestCase):
         self.assertFalse(t.completed)
         t = task.Event(date=_yesterday)
         self.assertTrue(t.completed)
+
+
+class ArchivedTaskTestCase(unittest.TestCase):
+    def test_row(self):
+        t = task.Task(id='a', estimate=3, actual=2, date=_yesterday)
+        archived = task.ArchivedTask.from_task(t)
+        self.assertTrue(archived.completed)
+        self.assertEqual(archived.velocity, t.velocity)
+        self.assertEqual(
+            task.ArchivedTask.from_row(archived.to_row()), archived)
+        undated = task.ArchivedTask(id=1, estimate=1, actual=1)
+        self.assertEqual(
+            task.ArchivedTask.from_row(undated.to_row()), undated)
@@ -0,0 +1,173 @@
+# This file is part of ebs
+# Copyright (C) 2012 Benon Technologies Pty Ltd, Fraser Tweedale
+#
+# ebs is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import unittest
+
+from . import estimator
+from . import task
+from . import tasktable
+
+
+_today = datetime.date.today()
+
+
+def _tasks():
+    return [
+        task.Task(id='a', project='A', estimate=4, priority=1, date=_today),
+        task.Task(id='b', project='B', estimate=2.5, actual=3),
+        task.Task(id='c', project='A', description='Foo', estimate=1),
+        task.Task(id='d', estimate=8, priority=3),
+    ]
+
+
+class TaskTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self._table = tasktable.TaskTable(_tasks())
+
+    def test_rows(self):
+        self.assertEqual(list(self._table), _tasks())
+        self.assertEqual(self._table, _tasks())
+        self.assertEqual(_tasks(), list(self._table))
+        row = self._table[0]
+        self.assertIsInstance(row, tasktable.TaskRow)
+        self.assertEqual(row.date, _today)
+        self.assertIsInstance(row.estimate, int)
+        self.assertEqual(self._table[1].velocity, 2.5 / 3)
+        self.assertEqual(row.fingerprint, _tasks()[0].fingerprint)
+        row.project = 'C'
+        row.priority = None
+        self.assertEqual(self._table[0].project, 'C')
+        self.assertIsNone(self._table[0].priority)
+
+    def test_records(self):
+        records = list(self._table.records())
+        self.assertEqual(
+            records[1], ['b', 'B', None, None, 2.5, None, True, 3])
+        table = tasktable.TaskTable.from_records(records + [['e']])
+        self.assertEqual(list(table), _tasks() + [task.Task(id='e')])
+
+    def test_nulls(self):
+        """Verify that costs and priorities of None are kept."""
+        tasks = [
+            task.Task(id='n', estimate=None, actual=None, priority=None),
+            task.Task(id='z', estimate=0, actual=0, priority=-1),
+        ]
+        table = tasktable.TaskTable(tasks)
+        self.assertEqual(list(table), tasks)
+        records = list(table.records())
+        self.assertEqual(
+            records, [
+                ['n', None, None, None, None, None, False, None],
+                ['z', None, None, -1, 0, None, False, 0],
+            ])
+        self.assertEqual(
+            list(tasktable.TaskTable.from_records(records)), tasks)
+        row = table[1]
+        row.estimate = None
+        self.assertIsNone(table[1].estimate)
+        row.estimate = 2
+        self.assertEqual(table[1].estimate, 2)
+        self.assertEqual(
+            [t.id for t in table.select(priority=1)], ['n', 'z'])
+
+    def test_add_table(self):
+        """Verify that the rows of another table are copied."""
+        other = tasktable.TaskTable([task.Task(id='e', project='C')])
+        other.extend(_tasks())
+        del other[1]
+        rows = self._table.add_rows(other)
+        self.assertEqual(rows, other)
+        self.assertEqual(list(self._table), _tasks() + list(other))
+        self.assertEqual(self._table.ids(), list('abcdebcd'))
+        self.assertEqual(
+            list(self._table.select(project='A')),
+            [_tasks()[0], _tasks()[2], rows[2]])
+
+    def test_compact(self):
+        t = task.Task(id='e')
+        self._table.append(t)
+        kept, removed = self._table[1], self._table[2]
+        del self._table[2]
+        del self._table[0]
+        self._table.compact()
+        self.assertEqual(len(self._table._ids), 3)
+        self.assertEqual([x.id for x in self._table], ['b', 'd', 'e'])
+        self.assertIs(self._table[0], kept)
+        self.assertIs(self._table[2], t)
+        self.assertEqual(kept, _tasks()[1])
+        self.assertEqual(removed, _tasks()[2])  # views keep their values
+        self._table.update(t, estimate=3)
+        self.assertEqual(list(self._table.select(completed=False))[-1], t)
+
+    def test_reclaim(self):
+        """Verify that storage is reclaimed as rows are removed."""
+        n = tasktable.TaskTable.min_garbage
+        table = tasktable.TaskTable(task.Task(id=i) for i in xrange(3 * n))
+        del table[:n]
+        self.assertEqual(len(table._ids), 3 * n)  # not yet reclaimed
+        del table[:n]
+        self.assertEqual(len(table._ids), n)
+        self.assertEqual(table[0].id, 2 * n)
+
+    def test_mutation(self):
+        t = task.Task(id='e', estimate=2)
+        self._table.append(t)
+        self.assertIs(self._table[-1], t)  # plain tasks are kept
+        self._table.update(t, actual=1, completed=True)
+        self.assertEqual(t.actual, 1)
+        self.assertEqual(list(self._table.select(completed=True))[-1], t)
+        self._table.remove(self._table[1])
+        del self._table[0]
+        self.assertEqual([x.id for x in self._table], ['c', 'd', 'e'])
+        self._table[:] = [self._table[2], self._table[0]]
+        self.assertEqual([x.id for x in self._table], ['e', 'c'])
+        self.assertIs(self._table[0], t)
+        self._table.insert(0, task.Task(id='f'))
+        self.assertEqual([x.id for x in self._table], ['f', 'e', 'c'])
+        self.assertEqual(self._table.index(t), 1)
+
+    def test_select(self):
+        def ids(**kwargs):
+            return [t.id for t in self._table.select(**kwargs)]
+        self.assertEqual(ids(), ['a', 'b', 'c', 'd'])
+        self.assertEqual(ids(completed=False), ['a', 'c', 'd'])
+        self.assertEqual(ids(completed=True), ['b'])
+        self.assertEqual(ids(project='A'), ['a', 'c'])
+        self.assertEqual(ids(project='X'), [])
+        self.assertEqual(ids(priority=2), ['a', 'b', 'c'])
+        self.assertEqual(
+            self._table.column('estimate', completed=False, priority=2),
+            [4, 1])
+        del self._table[0]
+        self.assertEqual(ids(project='A'), ['c'])
+
+    def test_estimator(self):
+        """Estimators give the same results from tables and lists."""
+        table = estimator.Estimator(
+            name='Bob', tasks=tasktable.TaskTable(_tasks()))
+        plain = estimator.Estimator(name='Bob', tasks=_tasks())
+        self.assertEqual(table, plain)
+        self.assertEqual(
+            list(table.pending_tasks()), list(plain.pending_tasks()))
+        for project, priority in [(None, None), ('A', None), (None, 2)]:
+            self.assertEqual(
+                table._simulation_estimates(project, priority),
+                plain._simulation_estimates(project, priority))
+        table.update_task(table.tasks[0], actual=2, completed=True)
+        self.assertEqual(table.velocities(), [5 / 6.0, 2])
+        self.assertEqual(
+            table.summary, estimator.VelocitySummary.from_tasks(table.tasks))